@@ -0,0 +1,98 @@
+"""
+Low-stock alerts, materialized from the catalog mirror.
+
+An item is in alert while `quantity <= min_stock_alert`. The set of such
+items is kept current by the same write hooks as the other catalog
+indexes, and every transition (into or out of alert) is published on
+`alert_events` for the /stock/alerts/stream SSE feed.
+"""
+
+from typing import Iterable
+
+from catalog import catalog, Catalog, CatalogIndex  # type: ignore
+from events import Broadcaster  # type: ignore
+
+
+def is_low(row: dict | None) -> bool:
+    if not row or row.get("min_stock_alert") is None:
+        return False
+    return (row.get("quantity") or 0) <= row["min_stock_alert"]
+
+
+def alert_payload(row: dict, state: str) -> dict:
+    return {
+        "item_id": row["id"],
+        "state": state,
+        "name": row.get("name"),
+        "brand": row.get("brand"),
+        "quantity": row.get("quantity"),
+        "min_stock_alert": row.get("min_stock_alert"),
+    }
+
+
+class AlertIndex(CatalogIndex):
+    """Items at or below their alert threshold: id → last row seen in alert."""
+
+    def __init__(self, source: Catalog, events: Broadcaster):
+        self._source = source
+        self._events = events
+        self.clear()
+
+    def clear(self):
+        # Rows are kept so an item deleted behind our back can still be announced
+        self._low: dict[int, dict] = {}
+        self._built = False
+
+    def rebuild(self, rows: Iterable[dict]):
+        """
+        Recompute from a full load. After the first build, differences
+        (e.g. writes made by another instance) are published as transitions;
+        an alert whose item is gone from the load is published as REMOVED.
+        """
+        rows = list(rows)
+        low = {row["id"]: row for row in rows if is_low(row)}
+        if self._built:
+            by_id = {row["id"]: row for row in rows}
+            for item_id in low.keys() - self._low.keys():
+                self._events.publish("low", alert_payload(low[item_id], "LOW"))
+            for item_id in self._low.keys() - low.keys():
+                row = by_id.get(item_id)
+                if row is not None:
+                    self._events.publish("ok", alert_payload(row, "OK"))
+                else:
+                    self._events.publish("removed", alert_payload(self._low[item_id], "REMOVED"))
+        self._low = low
+        self._built = True
+
+    def update(self, old: dict | None, new: dict | None):
+        if new is None:
+            if old is not None and old["id"] in self._low:
+                del self._low[old["id"]]
+                self._events.publish("removed", alert_payload(old, "REMOVED"))
+            return
+
+        was_low = new["id"] in self._low
+        now_low = is_low(new)
+        if now_low:
+            self._low[new["id"]] = new
+            if not was_low:
+                self._events.publish("low", alert_payload(new, "LOW"))
+        elif was_low:
+            del self._low[new["id"]]
+            self._events.publish("ok", alert_payload(new, "OK"))
+
+    def alerts(self) -> list[dict]:
+        """Items in alert, most urgent (lowest quantity vs threshold) first."""
+        rows = [row for row in (self._source.get(i) for i in self._low) if row is not None]
+        rows.sort(key=lambda r: ((r.get("quantity") or 0) - (r.get("min_stock_alert") or 0), r.get("name") or ""))
+        return [
+            dict(row, shortfall=(row.get("min_stock_alert") or 0) - (row.get("quantity") or 0))
+            for row in rows
+        ]
+
+    def __len__(self) -> int:
+        return len(self._low)
+
+
+alert_events = Broadcaster()
+alert_index: AlertIndex = catalog.register(AlertIndex(catalog, alert_events))  # type: ignore
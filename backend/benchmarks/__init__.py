@@ -0,0 +1 @@
+"""Latency/load benchmarks for the API against an in-process PostgREST stand-in."""
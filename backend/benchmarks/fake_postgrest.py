@@ -0,0 +1,465 @@
+"""
+In-memory stand-in for Supabase's PostgREST API.
+
+MemoryDatabase is a small table engine implementing the subset of
+PostgREST that QueryBuilder emits:
+
+  - GET / POST / PATCH / DELETE, `Prefer: return=representation`
+    (anything else returns no body)
+  - `resolution=merge-duplicates` / `ignore-duplicates` upserts with
+    `on_conflict`
+  - filters eq, neq, gt, gte, lt, lte, like, ilike, in, is
+  - `select` column lists, `order`, `limit`, `offset`, the `Range`
+    header and the single-object Accept header (406 unless exactly one
+    row matches)
+  - `Prefer: count=exact` (the total is sent in Content-Range)
+
+Rows are keyed by id, and `id` plus every `*_id` column (foreign keys:
+stock_item_id, sale_tx_id, category_id, ...) have hash indexes, so the
+eq/in lookups the app does stay O(matches) on large tables. Each
+request is applied atomically, like one PostgREST statement.
+
+It is served two ways:
+
+  - FakePostgREST, an ASGI app (`/rest/v1/{table}`) for running the real
+    client over HTTP semantics, e.g. from the benchmarks
+  - FakeSupabase, a drop-in for the `supabase` singleton that sends the
+    real QueryBuilder requests to the engine through an httpx transport,
+    without sockets or ASGI
+
+Both can delay each request by `latency` plus up to `jitter` seconds,
+split around the moment the request is applied, so concurrent requests
+interleave like they would against a remote database.
+"""
+
+import asyncio
+import json
+import random
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Any, Callable, Iterable
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx  # type: ignore
+from starlette.types import Receive, Scope, Send  # type: ignore
+
+from supabase_client import SupabaseLite  # type: ignore
+
+FAKE_URL = "http://fake-postgrest"
+REST_PREFIX = "/rest/v1/"
+SINGLE_OBJECT = "application/vnd.pgrst.object+json"
+MODIFIERS = {"select", "order", "limit", "offset", "on_conflict"}
+
+# Columns the real schema fills in with a database default
+COLUMN_DEFAULTS: dict[str, dict[str, Callable[[], Any]]] = {
+    "*": {"created_at": lambda: datetime.now().isoformat()},
+    "transactions": {"date": lambda: date.today().isoformat()},
+}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+# ─── Filters ─────────────────────────────────────────────────────────────────
+
+def _coerce(raw: str, sample: Any) -> Any:
+    """Parse a filter value as the type of the column it is compared with."""
+    if raw == "null":
+        return None
+    if isinstance(sample, bool):
+        return raw == "true"
+    if isinstance(sample, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _index_key(value: Any) -> Any:
+    """Hash key under which a column value is indexed (5, 5.0 and "5" meet)."""
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _like(pattern: str, flags: int = 0) -> re.Pattern:
+    parts = re.split(r"[%*]", pattern)
+    return re.compile(".*".join(re.escape(part) for part in parts), flags | re.DOTALL)
+
+
+_COMPARE: dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+class Filter:
+    """One `col=op.value` query parameter, compiled to a row predicate."""
+
+    __slots__ = ("col", "op", "values", "_check")
+
+    def __init__(self, col: str, expr: str):
+        op, _, raw = expr.partition(".")
+        self.col = col
+        self.op = op
+        self.values = [raw]
+
+        if op == "in":
+            self.values = [v.strip().strip('"') for v in raw.strip("()").split(",") if v.strip()]
+            self._check = self._in
+        elif op == "is":
+            self._check = self._is
+        elif op in ("like", "ilike"):
+            regex = _like(raw, re.IGNORECASE if op == "ilike" else 0)
+            self._check = lambda value: value is not None and regex.fullmatch(str(value)) is not None
+        elif op in _COMPARE:
+            self._check = self._compare
+        else:
+            raise PostgrestError(400, "PGRST100", f"unknown operator: {op}")
+
+    def __call__(self, row: dict) -> bool:
+        return self._check(row.get(self.col))
+
+    def _in(self, value: Any) -> bool:
+        return value is not None and any(value == _coerce(v, value) for v in self.values)
+
+    def _is(self, value: Any) -> bool:
+        return value is {"null": None, "true": True, "false": False}.get(self.values[0].lower(), self.values[0])
+
+    def _compare(self, value: Any) -> bool:
+        if value is None:
+            return False
+        try:
+            return _COMPARE[self.op](value, _coerce(self.values[0], value))
+        except TypeError:
+            return False
+
+
+def _sort(rows: list[dict], order: str) -> list[dict]:
+    # Stable sorts applied from the last key to the first
+    for term in reversed(order.split(",")):
+        col, _, rest = term.partition(".")
+        desc = rest.startswith("desc")
+        present = [r for r in rows if r.get(col) is not None]
+        missing = [r for r in rows if r.get(col) is None]
+        present.sort(key=lambda r: r[col], reverse=desc)
+        rows = present + missing  # NULLS LAST
+    return rows
+
+
+# ─── Tables ──────────────────────────────────────────────────────────────────
+
+def _indexed(col: str) -> bool:
+    return col == "id" or col.endswith("_id")
+
+
+class Table:
+    """id → row, with hash indexes on `id` and `*_id` columns."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: dict[int, dict] = {}
+        self.next_id = 0
+        self.indexes: dict[str, defaultdict[Any, set[int]]] = {}
+
+    def _index(self, col: str) -> defaultdict[Any, set[int]]:
+        index = self.indexes.get(col)
+        if index is None:
+            index = self.indexes[col] = defaultdict(set)
+            for row_id, row in self.rows.items():
+                index[_index_key(row.get(col))].add(row_id)
+        return index
+
+    def _add_to_indexes(self, row: dict):
+        for col in row:
+            if _indexed(col):
+                self._index(col)[_index_key(row[col])].add(row["id"])
+
+    def _remove_from_indexes(self, row: dict, cols: Iterable[str] | None = None):
+        for col in (row if cols is None else cols):
+            index = self.indexes.get(col)
+            if index is not None:
+                bucket = index.get(_index_key(row.get(col)))
+                if bucket is not None:
+                    bucket.discard(row["id"])
+
+    def insert(self, row: dict) -> dict:
+        for defaults in (COLUMN_DEFAULTS["*"], COLUMN_DEFAULTS.get(self.name, {})):
+            for col, default in defaults.items():
+                row.setdefault(col, default())
+        if row.get("id") is None:
+            self.next_id += 1
+            row["id"] = self.next_id
+        elif row["id"] in self.rows:
+            raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint "{self.name}_pkey"')
+        else:
+            self.next_id = max(self.next_id, int(row["id"]))
+        self.rows[row["id"]] = row
+        self._add_to_indexes(row)
+        return row
+
+    def select(self, filters: list[Filter]) -> list[dict]:
+        candidates: Iterable[dict] = self.rows.values()
+        # Narrow with the first eq/in filter on an indexed column
+        for f in filters:
+            if f.op in ("eq", "in") and _indexed(f.col):
+                index = self._index(f.col)
+                ids: set[int] = set()
+                for raw in f.values:
+                    ids |= index.get(_index_key(raw), set())
+                candidates = [self.rows[i] for i in sorted(ids)]
+                break
+        return [row for row in candidates if all(f(row) for f in filters)]
+
+    def update(self, row: dict, values: dict):
+        changed = [col for col in values if col in self.indexes]
+        self._remove_from_indexes(row, changed)
+        row.update(values)
+        for col in changed:
+            self.indexes[col][_index_key(row.get(col))].add(row["id"])
+
+    def delete(self, row: dict):
+        self._remove_from_indexes(row)
+        del self.rows[row["id"]]
+
+
+class MemoryDatabase:
+    """Named Tables, created on first use."""
+
+    def __init__(self):
+        self.tables: dict[str, Table] = {}
+
+    def table(self, name: str) -> Table:
+        if name not in self.tables:
+            self.tables[name] = Table(name)
+        return self.tables[name]
+
+    def rows(self, name: str) -> list[dict]:
+        """Current rows of a table, in id order (for assertions)."""
+        return [dict(row) for _, row in sorted(self.table(name).rows.items())]
+
+    def seed(self, name: str, rows: list[dict]):
+        table = self.table(name)
+        for row in rows:
+            table.insert(dict(row))
+
+    def insert(self, name: str, row: dict) -> dict:
+        return self.table(name).insert(row)
+
+    def select(self, name: str, filters: list[Filter]) -> list[dict]:
+        return self.table(name).select(filters)
+
+    def upsert(self, name: str, row: dict, on_conflict: list[str], ignore_duplicates: bool = False) -> dict | None:
+        """Insert, or on a conflict merge into the existing row (None if duplicates are ignored)."""
+        table = self.table(name)
+        if all(row.get(col) is not None for col in on_conflict):
+            existing = table.select([Filter(col, f"eq.{row[col]}") for col in on_conflict])
+            if existing:
+                if ignore_duplicates:
+                    return None
+                table.update(existing[0], row)
+                return existing[0]
+        return table.insert(row)
+
+    def update(self, name: str, filters: list[Filter], values: dict) -> list[dict]:
+        table = self.table(name)
+        matched = table.select(filters)
+        for row in matched:
+            table.update(row, values)
+        return matched
+
+    def delete(self, name: str, filters: list[Filter]) -> list[dict]:
+        table = self.table(name)
+        matched = table.select(filters)
+        for row in matched:
+            table.delete(row)
+        return matched
+
+
+# ─── PostgREST semantics ─────────────────────────────────────────────────────
+
+class FakePostgREST:
+    """ASGI app answering QueryBuilder requests from a MemoryDatabase."""
+
+    def __init__(self, db: MemoryDatabase | None = None, latency: float = 0.0, jitter: float = 0.0):
+        self.db = db or MemoryDatabase()
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter = Counter()  # (method, table) → requests served
+
+    async def delay(self):
+        """Half of one simulated round trip."""
+        seconds = (self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)) / 2
+        await asyncio.sleep(seconds)
+
+    async def respond(self, method: str, path: str, query: str, headers: dict, body: bytes) -> tuple[int, bytes, dict]:
+        """Apply one request after the request leg of the latency; return (status, JSON body, headers)."""
+        if self.latency or self.jitter:
+            await self.delay()
+        try:
+            status, payload = self.handle(method, path, query, headers, body)
+        except PostgrestError as e:
+            status, payload = e.status, {"code": e.code, "message": e.message}
+        if self.latency or self.jitter:
+            await self.delay()
+        response_headers = {"content-type": "application/json"}
+        if isinstance(payload, CountedRows):
+            response_headers["content-range"] = f"*/{payload.total}"
+        return status, b"" if payload is None else json.dumps(payload, default=str).encode(), response_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        status, content, response_headers = await self.respond(
+            scope["method"], scope["path"], scope["query_string"].decode(), headers, body
+        )
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                *((k.encode("latin-1"), v.encode("latin-1")) for k, v in response_headers.items()),
+                (b"content-length", str(len(content)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    def handle(self, method: str, path: str, query: str, headers: dict, body: bytes) -> tuple[int, Any]:
+        if not path.startswith(REST_PREFIX):
+            raise PostgrestError(404, "PGRST125", f"invalid path: {path}")
+        table = path[len(REST_PREFIX):]
+        self.calls[(method, table)] += 1
+
+        params = parse_qsl(query, keep_blank_values=True)
+        modifiers = {k: v for k, v in params if k in MODIFIERS}
+        filters = [Filter(k, v) for k, v in params if k not in MODIFIERS]
+        prefer = headers.get("prefer", "")
+        data = json.loads(body) if body else None
+
+        if method == "GET":
+            rows = self.db.select(table, filters)
+            status = 200
+        elif method == "POST":
+            new_rows = data if isinstance(data, list) else [data]
+            if "-duplicates" in prefer:
+                on_conflict = (modifiers.get("on_conflict") or "id").split(",")
+                ignore = "ignore-duplicates" in prefer
+                upserted = (self.db.upsert(table, dict(row), on_conflict, ignore) for row in new_rows)
+                rows = [row for row in upserted if row is not None]
+            else:
+                rows = [self.db.insert(table, dict(row)) for row in new_rows]
+            status = 201
+        elif method == "PATCH":
+            rows = self.db.update(table, filters, data or {})
+            status = 200
+        elif method == "DELETE":
+            rows = self.db.delete(table, filters)
+            status = 200
+        else:
+            raise PostgrestError(405, "PGRST000", f"unsupported method: {method}")
+
+        if method != "GET" and "return=representation" not in prefer:
+            return (204, None)
+        return status, self._shape(rows, modifiers, headers)
+
+    def _shape(self, rows: list[dict], modifiers: dict, headers: dict) -> Any:
+        total = len(rows)
+        if "order" in modifiers:
+            rows = _sort(rows, modifiers["order"])
+        start = int(modifiers.get("offset", 0))
+        if "range" in headers:
+            first, _, last = headers["range"].partition("-")
+            start = int(first)
+            rows = rows[start:int(last) + 1] if last else rows[start:]
+        else:
+            rows = rows[start:]
+        if "limit" in modifiers:
+            rows = rows[:int(modifiers["limit"])]
+
+        columns = modifiers.get("select", "*")
+        if columns != "*":
+            wanted = [c.strip() for c in columns.split(",")]
+            rows = [{c: row.get(c) for c in wanted} for row in rows]
+        else:
+            rows = [dict(row) for row in rows]
+
+        if SINGLE_OBJECT in headers.get("accept", ""):
+            if len(rows) != 1:
+                raise PostgrestError(406, "PGRST116", f"JSON object requested, multiple (or no) rows returned: {len(rows)}")
+            return rows[0]
+        if "count=exact" in headers.get("prefer", ""):
+            return CountedRows(rows, total)
+        return rows
+
+
+class CountedRows(list):
+    """A page of rows plus the total number of matches, for `Prefer: count=exact`."""
+
+    def __init__(self, rows: list[dict], total: int):
+        super().__init__(rows)
+        self.total = total
+
+
+# ─── Drop-in client ──────────────────────────────────────────────────────────
+
+class FakeTransport(httpx.AsyncBaseTransport):
+    """httpx transport that hands requests straight to a FakePostgREST."""
+
+    def __init__(self, backend: FakePostgREST):
+        self.backend = backend
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = urlsplit(str(request.url))
+        body = await request.aread()
+        headers = {k.lower(): v for k, v in request.headers.items()}
+        status, content, response_headers = await self.backend.respond(request.method, url.path, url.query, headers, body)
+        return httpx.Response(status, content=content, headers=response_headers, request=request)
+
+
+class FakeSupabase(SupabaseLite):
+    """
+    SupabaseLite backed by a MemoryDatabase: the real QueryBuilder, no network.
+
+        fake = FakeSupabase()
+        fake.db.seed("stock_items", [...])
+        with patch("routers.sales.supabase", fake): ...
+    """
+
+    def __init__(self, db: MemoryDatabase | None = None, latency: float = 0.0, jitter: float = 0.0):
+        super().__init__(FAKE_URL, "fake-key")
+        self.backend = FakePostgREST(db, latency=latency, jitter=jitter)
+
+    @property
+    def db(self) -> MemoryDatabase:
+        return self.backend.db
+
+    def set_table_data(self, table_name: str, data: list):
+        """MockSupabase-compatible seeding (replaces the table)."""
+        self.db.tables.pop(table_name, None)
+        self.db.seed(table_name, data)
+
+    async def open(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(transport=FakeTransport(self.backend))
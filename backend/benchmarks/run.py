@@ -0,0 +1,309 @@
+"""
+Benchmark harness: the real FastAPI app against FakePostgREST.
+
+Both the app and the fake upstream run in-process over ASGI transports,
+so results measure handler work plus the number of upstream round trips
+times the injected latency — the part this codebase controls.
+
+    cd backend
+    python -m benchmarks.run --latency-ms 2 --iterations 50
+    python -m benchmarks.run --only checkout --baseline benchmarks/results/<earlier>.json
+
+Each scenario resets the caches that would otherwise answer it (catalog,
+dashboard, invoice and report caches), so every measured request takes
+the upstream path (with --concurrency above 1, a request may still be
+answered by a fill another one just made). Results (p50/p95/p99, throughput, upstream calls per
+request) are written to a JSON file; with --baseline the run is compared
+against an earlier results file.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Awaitable, Callable
+
+import httpx  # type: ignore
+
+from benchmarks.fake_postgrest import FAKE_URL, FakePostgREST, MemoryDatabase  # type: ignore
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BRANDS = ["Coca-Cola", "Quilmes", "Fernet Branca", "Pepsi", "Stella Artois", "Brahma", "Manaos", "Villavicencio"]
+INVOICE_TX_ID = 1
+INVOICE_LINES = 20
+
+
+@dataclass
+class Scenario:
+    name: str
+    skus: int
+    request: Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+    reset: Callable[[], None] | None = None
+
+
+# ─── Dataset ─────────────────────────────────────────────────────────────────
+
+def build_database(skus: int) -> MemoryDatabase:
+    """Catalog of `skus` items (every 5th with a pack format) plus a month of activity."""
+    db = MemoryDatabase()
+    today = date.today()
+    db.seed("categories", [{"id": i, "name": f"Rubro {i}", "type": "PRODUCT"} for i in range(1, 11)] + [
+        {"id": 11, "name": "Venta de Bebidas", "type": "INCOME"},
+        {"id": 12, "name": "Compra de Mercadería", "type": "EXPENSE"},
+    ])
+    db.seed("stock_items", [
+        {
+            "id": i,
+            "name": f"Producto {i:05d}",
+            "brand": BRANDS[i % len(BRANDS)],
+            "barcode": f"779{i:010d}",
+            "quantity": 10**9,
+            "initial_quantity": 10**9,
+            "selling_price": 500 + i % 700,
+            "unit_cost": 300 + i % 400,
+            "cost_amount": 0,
+            "is_pack": i % 5 == 0,
+            "pack_size": 6 if i % 5 == 0 else 1,
+            "pack_price": 2800 if i % 5 == 0 else None,
+            "category_id": 1 + i % 10,
+            "status": "AVAILABLE",
+            "min_stock_alert": 5,
+        }
+        for i in range(1, skus + 1)
+    ])
+    db.seed("stock_item_formats", [
+        {"stock_item_id": i, "pack_size": 12, "pack_price": 5400, "label": "Caja x12"}
+        for i in range(5, skus + 1, 5)
+    ])
+    db.seed("transactions", [
+        {
+            "id": i,
+            "amount": 1000 + i,
+            "description": f"Movimiento {i}",
+            "type": "INCOME" if i % 3 else "EXPENSE",
+            "category_id": 11 if i % 3 else 12,
+            "date": today.replace(day=1 + i % 28).isoformat(),
+        }
+        for i in range(1, 501)
+    ])
+    db.seed("sales", [
+        {
+            "sale_tx_id": INVOICE_TX_ID,
+            "stock_item_id": 1 + i,
+            "quantity": 1 + i % 3,
+            "sale_price_total": 500.0 * (1 + i % 3),
+            "description": f"Producto {1 + i:05d}",
+        }
+        for i in range(INVOICE_LINES)
+    ])
+    db.seed("app_movements", [
+        {"type": "VENTA", "category": "VENTA", "description": f"Venta {i}", "amount": 1000}
+        for i in range(50)
+    ])
+    return db
+
+
+# ─── Scenarios ───────────────────────────────────────────────────────────────
+
+def scenarios(skus: int) -> list[Scenario]:
+    from cache import response_cache, CATALOG, DASHBOARD  # type: ignore
+    from routers import reports  # type: ignore
+    from routers.sales import invoice_cache  # type: ignore
+
+    def checkout(lines: int):
+        async def request(client: httpx.AsyncClient) -> httpx.Response:
+            items = [{"item_id": random.randint(1, skus), "quantity": 1} for _ in range(lines)]
+            return await client.post("/sales", json={"items": items, "description": "Benchmark"})
+        return request
+
+    def reset_report_cache():
+        shutil.rmtree(reports.REPORT_CACHE_DIR, ignore_errors=True)
+
+    today = date.today()
+    return [
+        Scenario("checkout_1_line", skus, checkout(1)),
+        Scenario("checkout_5_lines", skus, checkout(5)),
+        Scenario("checkout_25_lines", skus, checkout(25)),
+        Scenario("catalog_read_1k", 1_000, lambda c: c.get("/stock"), lambda: response_cache.invalidate(CATALOG)),
+        Scenario("catalog_read_10k", 10_000, lambda c: c.get("/stock"), lambda: response_cache.invalidate(CATALOG)),
+        Scenario("dashboard", skus, lambda c: c.get("/dashboard-stats"), lambda: response_cache.invalidate(DASHBOARD)),
+        Scenario(
+            "bulk_price_update", skus,
+            lambda c: c.post("/stock/bulk-update", json={"target_field": "both", "percentage": 1.0, "category_id": 3}),
+        ),
+        Scenario("invoice_pdf", skus, lambda c: c.get(f"/sales/invoice/{INVOICE_TX_ID}"), invoice_cache.clear),
+        Scenario(
+            "accounting_pdf", skus,
+            lambda c: c.get("/reports/accounting/pdf", params={"month": today.month, "year": today.year}),
+            reset_report_cache,
+        ),
+    ]
+
+
+# ─── Runner ──────────────────────────────────────────────────────────────────
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+async def run_scenario(app, scenario: Scenario, iterations: int, warmup: int, concurrency: int) -> dict:
+    from tracing import trace_listeners  # type: ignore
+
+    latencies: list[float] = []
+    calls: list[int] = []
+    errors = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(warmup):
+            if scenario.reset:
+                scenario.reset()
+            try:
+                await scenario.request(client)
+            except Exception:
+                pass  # Reported by the measured requests
+
+        listener = lambda trace: calls.append(len(trace.queries))  # noqa: E731
+        trace_listeners.append(listener)
+        remaining = iterations
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                if scenario.reset:
+                    scenario.reset()
+                started = time.perf_counter()
+                try:
+                    response = await scenario.request(client)
+                    failed = response.status_code >= 400
+                except Exception as e:
+                    print(f"[bench] {scenario.name}: {type(e).__name__}: {e}")
+                    failed = True
+                latencies.append(time.perf_counter() - started)
+                errors += failed
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            trace_listeners.remove(listener)
+        wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "skus": scenario.skus,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "upstream_calls_mean": round(sum(calls) / len(calls), 2) if calls else 0.0,
+        "upstream_calls_max": max(calls, default=0),
+    }
+
+
+async def run(args) -> dict:
+    from main import app  # type: ignore
+    from supabase_client import supabase  # type: ignore
+    from catalog import catalog  # type: ignore
+    from helpers import category_registry  # type: ignore
+    from routers import reports  # type: ignore
+
+    report_cache_dir, upstream_url = reports.REPORT_CACHE_DIR, supabase.url
+    reports.REPORT_CACHE_DIR = tempfile.mkdtemp(prefix="novamanager_bench_")
+    supabase.url = FAKE_URL
+    selected = [s for s in scenarios(args.skus) if not args.only or any(key in s.name for key in args.only)]
+
+    results: dict[str, dict] = {}
+    try:
+        for scenario in selected:
+            # Fresh data per scenario so writes from one do not skew the next
+            fake = FakePostgREST(build_database(scenario.skus), latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+            await supabase.close()
+            supabase._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+            category_registry.invalidate()
+            catalog.reset()
+
+            results[scenario.name] = await run_scenario(app, scenario, args.iterations, args.warmup, args.concurrency)
+            print(format_row(scenario.name, results[scenario.name]))
+    finally:
+        await supabase.close()
+        shutil.rmtree(reports.REPORT_CACHE_DIR, ignore_errors=True)
+        reports.REPORT_CACHE_DIR, supabase.url = report_cache_dir, upstream_url
+    return results
+
+
+# ─── Reporting ───────────────────────────────────────────────────────────────
+
+def format_row(name: str, r: dict) -> str:
+    return (
+        f"{name:<20} p50 {r['p50_ms']:>9.2f}ms  p95 {r['p95_ms']:>9.2f}ms  p99 {r['p99_ms']:>9.2f}ms  "
+        f"{r['throughput_rps']:>8.1f} req/s  {r['upstream_calls_mean']:>7.1f} calls/req"
+        + (f"  {r['errors']} errors" if r["errors"] else "")
+    )
+
+
+def compare(results: dict, baseline: dict):
+    print("\nvs baseline:")
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        def delta(key: str) -> str:
+            if not old[key]:
+                return f"{old[key]} → {r[key]}"
+            return f"{old[key]} → {r[key]} ({(r[key] - old[key]) / old[key] * 100:+.1f}%)"
+        print(f"{name:<20} p50 {delta('p50_ms')}  p95 {delta('p95_ms')}  calls {delta('upstream_calls_mean')}")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight at once")
+    parser.add_argument("--skus", type=int, default=1_000, help="catalog size for scenarios without a fixed size")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="injected upstream latency per query")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random upstream latency, up to this much")
+    parser.add_argument("--only", nargs="*", help="run scenarios whose name contains any of these")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            },
+            "scenarios": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f)["scenarios"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
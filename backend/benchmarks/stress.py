@@ -0,0 +1,207 @@
+"""
+Concurrency stress test for stock correctness.
+
+Fires interleaved checkouts (POST /sales), quick sales (PUT
+/stock/{id}/sell), offline queue replays (POST /sales/offline-batch) and
+replenishments (POST /stock/batch) at the real app,
+backed by a FakeSupabase with randomized latency, then checks that:
+
+  - every item's quantity == initial + replenished − sold, counting only
+    the operations the API reported as successful
+  - no quantity is negative
+  - every `sales` row belongs to an INCOME transaction, and there is one
+    per line of each successful checkout and accepted offline cart
+
+    cd backend
+    python -m benchmarks.stress --operations 5000 --concurrency 64 --jitter-ms 3
+
+Stock is kept scarce (few items, small initial quantities) so requests
+collide and some sales are rejected for insufficient stock.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import httpx  # type: ignore
+
+from benchmarks.fake_postgrest import FAKE_URL, FakeTransport, MemoryDatabase  # type: ignore
+
+
+def seed(db: MemoryDatabase, items: int, initial: int):
+    db.seed("categories", [
+        {"id": 1, "name": "Venta de Bebidas", "type": "INCOME"},
+        {"id": 2, "name": "Compra de Mercadería", "type": "EXPENSE"},
+    ])
+    db.seed("stock_items", [
+        {
+            "id": i, "name": f"Producto {i}", "brand": "Marca", "quantity": initial,
+            "selling_price": 100, "unit_cost": 60, "is_pack": False, "pack_size": 1, "status": "AVAILABLE",
+        }
+        for i in range(1, items + 1)
+    ])
+
+
+async def stress(app, db: MemoryDatabase, operations: int, concurrency: int, seed_value: int = 0) -> dict:
+    """Run the workload against `app` (whose Supabase is backed by `db`) and check the invariants."""
+    from tracing import metrics  # type: ignore
+
+    rng = random.Random(seed_value)
+    item_ids = sorted(db.table("stock_items").rows)
+    initial = {item_id: row["quantity"] for item_id, row in db.table("stock_items").rows.items()}
+    sold: Counter = Counter()
+    replenished: Counter = Counter()
+    outcomes: Counter = Counter()
+    committed_lines = 0
+    writes_before = metrics.counter("stock_cas_writes_total")
+    conflicts_before = metrics.counter("stock_cas_conflicts_total")
+
+    async def checkout(client: httpx.AsyncClient):
+        nonlocal committed_lines
+        lines = [{"item_id": rng.choice(item_ids), "quantity": rng.randint(1, 3)} for _ in range(rng.randint(1, 3))]
+        res = await client.post("/sales", json={"items": lines, "description": "Stress"})
+        outcomes[("checkout", res.status_code)] += 1
+        if res.status_code == 200:
+            committed_lines += len(lines)
+            for line in lines:
+                sold[line["item_id"]] += line["quantity"]
+
+    async def quick_sale(client: httpx.AsyncClient):
+        item_id, quantity = rng.choice(item_ids), rng.randint(1, 4)
+        res = await client.put(f"/stock/{item_id}/sell", json={"quantity": quantity})
+        outcomes[("quick_sale", res.status_code)] += 1
+        if res.status_code == 200:
+            sold[item_id] += quantity
+
+    async def offline_batch(client: httpx.AsyncClient):
+        nonlocal committed_lines
+        carts = [
+            {
+                "client_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                "created_at": datetime.now().isoformat(),
+                "items": [{"item_id": rng.choice(item_ids), "quantity": rng.randint(1, 3)} for _ in range(rng.randint(1, 2))],
+            }
+            for _ in range(rng.randint(1, 3))
+        ]
+        res = await client.post("/sales/offline-batch", json={"carts": carts})
+        outcomes[("offline_batch", res.status_code)] += 1
+        if res.status_code != 200:
+            return
+        by_id = {cart["client_id"]: cart for cart in carts}
+        for result in res.json()["results"]:
+            outcomes[("offline_cart", result["status"])] += 1
+            if result["status"] == "accepted":
+                lines = by_id[result["client_id"]]["items"]
+                committed_lines += len(lines)
+                for line in lines:
+                    sold[line["item_id"]] += line["quantity"]
+
+    async def replenish(client: httpx.AsyncClient):
+        item_id, quantity = rng.choice(item_ids), rng.randint(1, 10)
+        res = await client.post("/stock/batch", json={
+            "items": [{"item_id": item_id, "name": f"Producto {item_id}", "quantity": quantity, "cost_amount": 0}],
+        })
+        ok = res.status_code == 200 and "error" not in res.json()[0]
+        outcomes[("replenish", 200 if ok else res.status_code)] += 1
+        if ok:
+            replenished[item_id] += quantity
+
+    workload = rng.choices([checkout, quick_sale, offline_batch, replenish], weights=[4, 3, 1, 2], k=operations)
+    queue = iter(workload)
+
+    async def worker(client: httpx.AsyncClient):
+        for op in queue:
+            await op(client)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://stress") as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    # ── Invariants ────────────────────────────────────────────────────────
+    violations: list[str] = []
+    for item_id in item_ids:
+        actual = db.table("stock_items").rows[item_id]["quantity"]
+        expected = initial[item_id] + replenished[item_id] - sold[item_id]
+        if actual != expected:
+            violations.append(f"item {item_id}: quantity {actual}, expected {expected}")
+        if actual < 0:
+            violations.append(f"item {item_id}: negative quantity {actual}")
+
+    incomes = {tx["id"] for tx in db.rows("transactions") if tx.get("type") == "INCOME"}
+    sales = db.rows("sales")
+    orphans = [s["id"] for s in sales if s.get("sale_tx_id") not in incomes]
+    if orphans:
+        violations.append(f"{len(orphans)} sales rows without an INCOME transaction")
+    if len(sales) != committed_lines:
+        violations.append(f"{len(sales)} sales rows for {committed_lines} committed checkout and offline lines")
+
+    writes = metrics.counter("stock_cas_writes_total") - writes_before
+    conflicts = metrics.counter("stock_cas_conflicts_total") - conflicts_before
+    return {
+        "operations": operations,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_ops": round(operations / elapsed, 1) if elapsed else 0.0,
+        "outcomes": {f"{kind} {status}": n for (kind, status), n in sorted(outcomes.items())},
+        "stock_writes": writes,
+        "conflict_retries": conflicts,
+        "conflict_rate": round(conflicts / writes, 4) if writes else 0.0,
+        "violations": violations,
+    }
+
+
+async def run(args) -> dict:
+    from main import app  # type: ignore
+    from supabase_client import supabase  # type: ignore
+    from benchmarks.fake_postgrest import FakePostgREST  # type: ignore
+
+    db = MemoryDatabase()
+    seed(db, args.items, args.initial)
+    backend = FakePostgREST(db, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    upstream_url = supabase.url
+    supabase.url = FAKE_URL
+    await supabase.close()
+    supabase._client = httpx.AsyncClient(transport=FakeTransport(backend))
+    try:
+        return await stress(app, db, args.operations, args.concurrency, args.seed)
+    finally:
+        await supabase.close()
+        supabase.url = upstream_url
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight at once")
+    parser.add_argument("--items", type=int, default=8, help="distinct stock items (fewer = more contention)")
+    parser.add_argument("--initial", type=int, default=40, help="starting quantity of each item")
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="fixed upstream latency per query")
+    parser.add_argument("--jitter-ms", type=float, default=3.0, help="extra random upstream latency, up to this much")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print(
+        f"{report['operations']} operations in {report['seconds']}s "
+        f"({report['throughput_ops']} ops/s, concurrency {report['concurrency']})"
+    )
+    for outcome, n in report["outcomes"].items():
+        print(f"  {outcome:<20} {n}")
+    print(f"  stock writes {report['stock_writes']:.0f}, conflict retries {report['conflict_retries']:.0f} ({report['conflict_rate']:.1%})")
+    if report["violations"]:
+        print("INVARIANTS VIOLATED:")
+        for violation in report["violations"]:
+            print(f"  {violation}")
+        return 1
+    print("All stock invariants hold.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
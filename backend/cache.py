@@ -0,0 +1,98 @@
+"""
+In-process caches.
+
+- ResponseCache: hot read endpoints (catalog, dashboard). Entries are
+  PrecompressedPayloads with a TTL. Write endpoints call
+  `response_cache.invalidate(...)` with the keys their change affects, so
+  the TTL only bounds staleness from writes made outside this process.
+- LRUCache: bounded key → value store with optional TTL, for results
+  that are replayed rather than recomputed (idempotent responses, ...).
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any
+
+from compression import PrecompressedPayload  # type: ignore
+
+# Cache keys
+CATALOG = "catalog"
+DASHBOARD = "dashboard"
+
+
+class ResponseCache:
+    """Key → (expires_at, payload) store using a monotonic clock."""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[float, PrecompressedPayload]] = {}
+
+    def get(self, key: str) -> PrecompressedPayload | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if time.monotonic() >= expires_at:
+            self._entries.pop(key, None)
+            return None
+        return payload
+
+    def set(self, key: str, data: Any, ttl: float) -> PrecompressedPayload:
+        """Serialize `data` to JSON once and store it for `ttl` seconds."""
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        payload = PrecompressedPayload(body)
+        self._entries[key] = (time.monotonic() + ttl, payload)
+        return payload
+
+    def invalidate(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+class LRUCache:
+    """Least-recently-used mapping capped at `max_entries`, entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if self.ttl is not None and time.monotonic() >= expires_at:
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_MISSING = object()
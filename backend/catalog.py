@@ -0,0 +1,298 @@
+"""
+In-process catalog mirror and the indexes built on it.
+
+The mirror holds every stock_items row (with its formats embedded, like
+GET /stock returns them) keyed by id. Stock write endpoints report their
+changes here and every registered CatalogIndex is updated incrementally
+from the (old, new) row pair, so lookups never hit Supabase.
+
+The mirror is warmed at startup and reloaded when older than
+CATALOG_MAX_AGE seconds, which bounds staleness from writes made
+outside this process. Only the first load is waited for; after that a
+stale mirror keeps serving while the reload runs in the background.
+Changes reported before the first load are ignored: the load fetches
+the current state anyway.
+"""
+
+import asyncio
+import bisect
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Iterable
+
+from supabase_client import supabase  # type: ignore
+
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", "300"))
+
+
+class CatalogIndex(ABC):
+    """Base class for indexes kept in sync with the catalog mirror."""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry."""
+
+    @abstractmethod
+    def update(self, old: dict | None, new: dict | None):
+        """Apply one row change. `old` is None on insert, `new` is None on delete."""
+
+    def rebuild(self, rows: Iterable[dict]):
+        self.clear()
+        for row in rows:
+            self.update(None, row)
+
+
+class Catalog:
+    """id → stock item row, plus the indexes that follow it."""
+
+    def __init__(self, max_age: float = CATALOG_MAX_AGE):
+        self.max_age = max_age
+        self._rows: dict[int, dict] = {}
+        self._format_owner: dict[int, int] = {}
+        self._indexes: list[CatalogIndex] = []
+        self._loaded_at: float | None = None
+        self._loading: asyncio.Future | None = None
+
+    # ── Loading ───────────────────────────────────────────────────────────
+
+    def register(self, index: CatalogIndex) -> CatalogIndex:
+        self._indexes.append(index)
+        if self._loaded_at is not None:
+            index.rebuild(self._rows.values())
+        return index
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    async def ensure_loaded(self):
+        """
+        Wait for the mirror only if it was never loaded. Once loaded, a
+        mirror older than max_age is served as is and reloaded in the background.
+        """
+        if self._loaded_at is None:
+            await asyncio.shield(self._start_load())
+        elif time.monotonic() - self._loaded_at >= self.max_age:
+            self._start_load()
+
+    def _start_load(self) -> asyncio.Future:
+        # Concurrent callers share one load instead of stampeding Supabase
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.ensure_future(self.load())
+            self._loading.add_done_callback(_log_load_failure)
+        return self._loading
+
+    async def load(self):
+        """Fetch all items and formats (two queries) and rebuild every index."""
+        res = await supabase.table("stock_items").select("*").order("name").execute()
+        if not res:
+            # Keep serving the previous mirror; the next call retries
+            print(f"[catalog] Warning: load failed: {res.error}")
+            return
+        items = res.data or []
+
+        formats_by_item: dict[int, list] = {}
+        if items:
+            # Every item is loaded, so fetch every format: an id list would overflow the URL
+            fmt_res = await supabase.table("stock_item_formats").select("*").execute()
+            if not fmt_res:
+                print(f"[catalog] Warning: load failed: {fmt_res.error}")
+                return
+            for fmt in (fmt_res.data or []):
+                formats_by_item.setdefault(fmt["stock_item_id"], []).append(fmt)
+
+        self.replace(
+            dict(item, formats=formats_by_item.get(item["id"], []))
+            for item in items
+            if "id" in item
+        )
+
+    def replace(self, rows: Iterable[dict]):
+        """Swap in a full set of item rows (formats embedded) and rebuild every index."""
+        self._rows = {row["id"]: dict(row, formats=row.get("formats", [])) for row in rows}
+        self._format_owner = {
+            fmt["id"]: item_id for item_id, row in self._rows.items() for fmt in row["formats"]
+        }
+        for index in self._indexes:
+            index.rebuild(self._rows.values())
+        self._loaded_at = time.monotonic()
+
+    def reset(self):
+        """Forget everything; the next ensure_loaded() reloads from Supabase."""
+        self._rows = {}
+        self._format_owner = {}
+        self._loaded_at = None
+        self._loading = None
+        for index in self._indexes:
+            index.clear()
+
+    # ── Reads ─────────────────────────────────────────────────────────────
+
+    def get(self, item_id: int) -> dict | None:
+        return self._rows.get(item_id)
+
+    def rows(self) -> Iterable[dict]:
+        return self._rows.values()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ── Change notifications (called by write endpoints) ──────────────────
+
+    def upsert(self, row: dict):
+        """Record a created or fully re-read item row."""
+        if not self.loaded or "id" not in row:
+            return
+        old = self._rows.get(row["id"])
+        new = {**old, **row} if old else dict(row)
+        new.setdefault("formats", [])
+        self._apply(row["id"], old, new)
+
+    def patch(self, item_id: int, changes: dict[str, Any]):
+        """Record a partial update of an item (e.g. quantity after a sale)."""
+        old = self._rows.get(item_id)
+        if old is None:
+            return
+        self._apply(item_id, old, {**old, **changes})
+
+    def remove(self, item_id: int):
+        old = self._rows.get(item_id)
+        if old is None:
+            return
+        for fmt in old.get("formats", []):
+            self._format_owner.pop(fmt["id"], None)
+        self._apply(item_id, old, None)
+
+    def add_format(self, fmt: dict):
+        item_id = fmt.get("stock_item_id")
+        old = self._rows.get(item_id)  # type: ignore
+        if old is None:
+            return
+        self._format_owner[fmt["id"]] = item_id  # type: ignore
+        self._apply(item_id, old, {**old, "formats": [*old.get("formats", []), fmt]})  # type: ignore
+
+    def patch_format(self, format_id: int, changes: dict[str, Any]):
+        item_id = self._format_owner.get(format_id)
+        old = self._rows.get(item_id) if item_id is not None else None
+        if old is None:
+            return
+        formats = [dict(f, **changes) if f["id"] == format_id else f for f in old.get("formats", [])]
+        self._apply(item_id, old, {**old, "formats": formats})  # type: ignore
+
+    def remove_format(self, format_id: int):
+        item_id = self._format_owner.pop(format_id, None)
+        old = self._rows.get(item_id) if item_id is not None else None
+        if old is None:
+            return
+        formats = [f for f in old.get("formats", []) if f["id"] != format_id]
+        self._apply(item_id, old, {**old, "formats": formats})  # type: ignore
+
+    def _apply(self, item_id: int, old: dict | None, new: dict | None):
+        if new is None:
+            self._rows.pop(item_id, None)
+        else:
+            self._rows[item_id] = new
+        for index in self._indexes:
+            index.update(old, new)
+
+
+# ─── Barcode Index ───────────────────────────────────────────────────────────
+
+class BarcodeIndex(CatalogIndex):
+    """Hash index barcode → item id, resolved against the mirror on lookup."""
+
+    def __init__(self, source: Catalog):
+        self._source = source
+        self._ids: dict[str, int] = {}
+
+    @staticmethod
+    def normalize(code: str | None) -> str:
+        return (code or "").strip()
+
+    def clear(self):
+        self._ids = {}
+
+    def update(self, old: dict | None, new: dict | None):
+        old_code = self.normalize(old.get("barcode")) if old else ""
+        new_code = self.normalize(new.get("barcode")) if new else ""
+        if old_code and old_code != new_code and self._ids.get(old_code) == old["id"]:  # type: ignore
+            del self._ids[old_code]
+        if new_code:
+            self._ids[new_code] = new["id"]  # type: ignore
+
+    def lookup(self, code: str) -> dict | None:
+        item_id = self._ids.get(self.normalize(code))
+        return self._source.get(item_id) if item_id is not None else None
+
+
+# ─── Brand Index ─────────────────────────────────────────────────────────────
+
+class BrandIndex(CatalogIndex):
+    """
+    Distinct brands with a reference count per brand.
+
+    A brand is listed while at least one item uses it. The sorted key list
+    (case-insensitive) serves the full listing and prefix autocomplete.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._counts: dict[str, int] = {}
+        self._sorted: list[tuple[str, str]] = []  # (casefolded, brand)
+
+    def update(self, old: dict | None, new: dict | None):
+        old_brand = (old.get("brand") or "") if old else ""
+        new_brand = (new.get("brand") or "") if new else ""
+        if old_brand == new_brand:
+            return
+        if old_brand:
+            self._decrement(old_brand)
+        if new_brand:
+            self._increment(new_brand)
+
+    def _increment(self, brand: str):
+        count = self._counts.get(brand, 0)
+        if count == 0:
+            bisect.insort(self._sorted, (brand.casefold(), brand))
+        self._counts[brand] = count + 1
+
+    def _decrement(self, brand: str):
+        count = self._counts.get(brand, 0)
+        if count <= 1:
+            self._counts.pop(brand, None)
+            key = (brand.casefold(), brand)
+            pos = bisect.bisect_left(self._sorted, key)
+            if pos < len(self._sorted) and self._sorted[pos] == key:
+                del self._sorted[pos]
+        else:
+            self._counts[brand] = count - 1
+
+    def brands(self, prefix: str | None = None) -> list[str]:
+        if not prefix:
+            return [brand for _, brand in self._sorted]
+        folded = prefix.casefold()
+        start = bisect.bisect_left(self._sorted, (folded, ""))
+        result = []
+        for key, brand in self._sorted[start:]:
+            if not key.startswith(folded):
+                break
+            result.append(brand)
+        return result
+
+    def count(self, brand: str) -> int:
+        return self._counts.get(brand, 0)
+
+
+# ─── Singletons ───────────────────────────────────────────────────────────────
+
+def _log_load_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[catalog] Warning: load failed: {task.exception()}")
+
+
+catalog = Catalog()
+barcode_index: BarcodeIndex = catalog.register(BarcodeIndex(catalog))  # type: ignore
+brand_index: BrandIndex = catalog.register(BrandIndex())  # type: ignore
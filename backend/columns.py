@@ -0,0 +1,139 @@
+"""
+Columnar view of the catalog mirror, for catalog-wide scans.
+
+The mirror keeps one dict per item, which is the right shape for
+returning rows but a slow one for summing a column over the whole
+catalog. CatalogColumns keeps the numeric columns as parallel typed
+arrays (`array.array`, 8 bytes per value, contiguous) plus an id → row
+position map, so a reorder or bulk-update scan walks a few flat
+buffers instead of 50k dicts. The brand column is dictionary-encoded:
+one small int per row, decoded through `brand_names`.
+
+It is a CatalogIndex, so it is built from the same bulk load as the
+other indexes and updated in place by the same write hooks. Rows stay
+dense: a delete moves the last row into the freed slot.
+"""
+
+import math
+from array import array
+from typing import Iterable
+
+from catalog import catalog, CatalogIndex  # type: ignore
+
+NO_CATEGORY = 0  # category_id column value for items without a category
+
+# (column, typecode); "d" columns are floats, "q" 64-bit ints, "i" brand codes
+COLUMNS = (
+    ("id", "q"),
+    ("quantity", "d"),
+    ("unit_cost", "d"),
+    ("selling_price", "d"),
+    ("pack_price", "d"),  # NaN when the item has no pack price
+    ("pack_size", "d"),
+    ("min_stock_alert", "d"),
+    ("category_id", "q"),
+    ("brand", "i"),
+)
+
+
+class CatalogColumns(CatalogIndex):
+    """Parallel typed arrays over the catalog, one row per item."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+        self.brand_names: list[str] = [""]
+        self._brand_codes: dict[str, int] = {"": 0}
+        self._positions: dict[int, int] = {}
+
+    def _encode_brand(self, brand: str | None) -> int:
+        brand = brand or ""
+        code = self._brand_codes.get(brand)
+        if code is None:
+            code = self._brand_codes[brand] = len(self.brand_names)
+            self.brand_names.append(brand)
+        return code
+
+    def _values(self, row: dict) -> tuple:
+        get = row.get
+        pack_price = get("pack_price")
+        return (
+            row["id"],
+            get("quantity") or 0,
+            get("unit_cost") or 0,
+            get("selling_price") or 0,
+            math.nan if pack_price is None else pack_price,
+            get("pack_size") or 1,
+            get("min_stock_alert") or 0,
+            get("category_id") or NO_CATEGORY,
+            self._encode_brand(get("brand")),
+        )
+
+    # ── CatalogIndex ──────────────────────────────────────────────────────
+
+    def rebuild(self, rows: Iterable[dict]):
+        """Build every column in one pass over the load."""
+        self.clear()
+        values = [self._values(row) for row in rows]
+        if values:
+            for (name, _), column in zip(COLUMNS, zip(*values)):
+                getattr(self, name).extend(column)
+        self._positions = {item_id: pos for pos, item_id in enumerate(self.id)}
+
+    def update(self, old: dict | None, new: dict | None):
+        if new is None:
+            if old is not None:
+                self._delete(old["id"])
+            return
+        values = self._values(new)
+        pos = self._positions.get(new["id"])
+        if pos is None:
+            pos = self._positions[new["id"]] = len(self.id)
+            for (name, _), value in zip(COLUMNS, values):
+                getattr(self, name).append(value)
+        else:
+            for (name, _), value in zip(COLUMNS, values):
+                getattr(self, name)[pos] = value
+
+    def _delete(self, item_id: int):
+        pos = self._positions.pop(item_id, None)
+        if pos is None:
+            return
+        last = len(self.id) - 1
+        for name, _ in COLUMNS:
+            column = getattr(self, name)
+            if pos != last:
+                column[pos] = column[last]
+            column.pop()
+        if pos != last:
+            self._positions[self.id[pos]] = pos
+
+    # ── Reads ─────────────────────────────────────────────────────────────
+
+    def position(self, item_id: int) -> int | None:
+        return self._positions.get(item_id)
+
+    def where(self, category_id: int | None = None, brand: str | None = None) -> list[int]:
+        """
+        Row positions matching the filters of POST /stock/bulk-update: an
+        exact category and a case-insensitive brand substring (like ilike
+        %brand%). The brand test runs once per distinct brand, not per row.
+        """
+        positions: Iterable[int] = range(len(self.id))
+        if category_id is not None:
+            positions = [pos for pos, value in enumerate(self.category_id) if value == category_id]
+        if brand and brand.strip():
+            needle = brand.casefold()
+            codes = {code for code, name in enumerate(self.brand_names) if needle in name.casefold()}
+            brands = self.brand
+            positions = [pos for pos in positions if brands[pos] in codes]
+        return list(positions)
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+
+catalog_columns: CatalogColumns = catalog.register(CatalogColumns())  # type: ignore
@@ -0,0 +1,244 @@
+"""
+Response compression — gzip/brotli negotiation for the whole API.
+
+CompressionMiddleware compresses JSON and PDF responses above a size
+threshold, including chunked StreamingResponse bodies. Responses that
+already carry a Content-Encoding (e.g. PrecompressedPayload cache hits)
+are passed through untouched, so cached endpoints pay the compression
+cost once per encoding instead of once per request.
+
+Brotli is optional: if the `brotli` package is not installed only gzip
+is offered.
+"""
+
+import os
+import zlib
+from typing import Any
+
+from starlette.datastructures import Headers, MutableHeaders  # type: ignore
+from starlette.responses import Response  # type: ignore
+from starlette.types import ASGIApp, Message, Receive, Scope, Send  # type: ignore
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Already-compressed or incremental (SSE) payloads are never re-encoded
+EXCLUDED_CONTENT_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "image/gif",
+    "application/zip",
+    "application/gzip",
+    "text/event-stream",
+}
+
+
+# ─── Negotiation ─────────────────────────────────────────────────────────────
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """
+    Pick the best supported encoding from an Accept-Encoding header.
+    Prefers brotli over gzip; honours q=0 exclusions.
+    """
+    offered: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[token.strip()] = q
+
+    wildcard = offered.get("*", 0.0)
+    if brotli is not None and offered.get("br", wildcard) > 0:
+        return "br"
+    if offered.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def _gzip_compressor():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """One-shot compression of a complete body."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = _gzip_compressor()
+    return compressor.compress(body) + compressor.flush()
+
+
+class _StreamCompressor:
+    """Incremental compressor; every chunk is flushed so the client sees it immediately."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._obj: Any = brotli.Compressor(quality=BROTLI_QUALITY) if encoding == "br" else _gzip_compressor()
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.finish()
+        return self._obj.compress(data) + self._obj.flush()
+
+
+# ─── Middleware ──────────────────────────────────────────────────────────────
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware) so streaming bodies are
+    compressed chunk by chunk instead of being buffered.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """
+    Holds back the response start until enough body has been seen to decide
+    the strategy. Small bodies split across messages (as BaseHTTPMiddleware
+    sends them) are buffered up to the threshold, not treated as streams.
+    """
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start: Message | None = None
+        self._passthrough = False
+        self._compressor: _StreamCompressor | None = None
+        self._buffer = b""
+
+    async def send(self, message: Message):
+        msg_type = message["type"]
+
+        if msg_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+            self._passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 206, 304)
+                or media_type in EXCLUDED_CONTENT_TYPES
+                or media_type.startswith(("image/", "video/", "audio/"))
+            )
+            if self._passthrough:
+                await self._send(message)
+            else:
+                self._start = message
+            return
+
+        if msg_type != "http.response.body" or self._passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is not None:
+            # Continuation of a compressed stream
+            data = self._compressor.chunk(body) if more_body else self._compressor.finish(body)
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        self._buffer += body
+        if more_body and len(self._buffer) < self.minimum_size:
+            return
+        body, self._buffer = self._buffer, b""
+
+        start = self._start
+        assert start is not None
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+
+        if not more_body:
+            # Complete body
+            if len(body) < self.minimum_size:
+                await self._flush_start()
+                await self._send({"type": "http.response.body", "body": body, "more_body": False})
+                return
+            data = compress(body, self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers["Content-Length"] = str(len(data))
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": data, "more_body": False})
+            return
+
+        # Streaming response: size is unknown, compress every chunk
+        self._compressor = _StreamCompressor(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        await self._flush_start()
+        await self._send({"type": "http.response.body", "body": self._compressor.chunk(body), "more_body": True})
+
+    async def _flush_start(self):
+        if self._start is not None:
+            start, self._start = self._start, None
+            await self._send(start)
+
+
+# ─── Precompressed Payloads ──────────────────────────────────────────────────
+
+class PrecompressedPayload:
+    """
+    An immutable response body that memoizes its compressed variants.
+
+    Stored in the response cache; the first hit per encoding compresses,
+    every later hit serves the stored bytes with Content-Encoding set so
+    the middleware leaves them alone.
+    """
+
+    __slots__ = ("body", "media_type", "_variants")
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.media_type = media_type
+        self._variants: dict[str, bytes] = {}
+
+    def response(self, accept_encoding: str = "", minimum_size: int = MINIMUM_SIZE) -> Response:
+        encoding = negotiate_encoding(accept_encoding) if len(self.body) >= minimum_size else None
+        if encoding is None:
+            return Response(content=self.body, media_type=self.media_type, headers={"Vary": "Accept-Encoding"})
+
+        data = self._variants.get(encoding)
+        if data is None:
+            data = compress(self.body, encoding)
+            self._variants[encoding] = data
+        return Response(
+            content=data,
+            media_type=self.media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
@@ -0,0 +1,135 @@
+"""
+In-process pub/sub with Server-Sent Events delivery.
+
+A Broadcaster fans every published event out to the queues of its
+current subscribers and keeps the last N events in a ring buffer, so a
+client reconnecting with `Last-Event-ID` receives what it missed. Open
+dashboards cost one queue each instead of one polling loop each.
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator
+
+from fastapi.responses import StreamingResponse  # type: ignore
+
+KEEPALIVE_SECONDS = 15.0
+
+
+def format_sse(event_id: int, event: str, data: Any) -> bytes:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class Broadcaster:
+    """Fan-out of events to live subscribers, with a bounded replay buffer."""
+
+    def __init__(self, history: int = 500, queue_size: int = 200):
+        self.queue_size = queue_size
+        self._history: deque[tuple[int, str, Any]] = deque(maxlen=history)
+        self._subscribers: set[asyncio.Queue] = set()
+        self._last_id = 0
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @property
+    def history_size(self) -> int:
+        return self._history.maxlen or 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: Any) -> int:
+        """
+        Record and fan out one event. Ids are a sequence in publish order,
+        never taken from the data: rows committed by concurrent jobs can be
+        published out of their id order, and a resume point must still
+        cover everything published before it.
+        """
+        self._last_id += 1
+        entry = (self._last_id, event, data)
+        self._history.append(entry)
+        for queue in self._subscribers:
+            if queue.full():
+                # Slow consumer: drop its oldest pending event, never block publishers
+                queue.get_nowait()
+            queue.put_nowait(entry)
+        return self._last_id
+
+    def since(self, last_id: int) -> list[tuple[int, str, Any]] | None:
+        """
+        Buffered events after `last_id`, or None if the buffer cannot tell:
+        some were already evicted, or `last_id` is ahead of anything this
+        process published (it restarted, or the id came from another
+        instance), so events in between may have been missed.
+        """
+        if last_id > self._last_id:
+            return None
+        if last_id == self._last_id:
+            return []
+        if not self._history or last_id < self._history[0][0] - 1:
+            return None
+        return [entry for entry in self._history if entry[0] > last_id]
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def clear(self):
+        self._history.clear()
+        self._subscribers.clear()
+        self._last_id = 0
+
+    async def stream(self, last_event_id: int | None = None) -> AsyncIterator[bytes]:
+        """
+        Yield SSE frames: first anything buffered after `last_event_id`,
+        then live events, with keepalive comments while idle. Callers check
+        since() first and resync the client themselves when the buffer no
+        longer covers the gap.
+        """
+        queue = self.subscribe()  # Subscribe first so nothing falls between replay and live
+        try:
+            sent = self._last_id
+            if last_event_id is not None:
+                missed = self.since(last_event_id)
+                if missed is not None:
+                    sent = last_event_id
+                for event_id, event, data in missed or []:
+                    yield format_sse(event_id, event, data)
+                    sent = event_id
+
+            while True:
+                try:
+                    event_id, event, data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event_id <= sent:
+                    continue  # Already delivered by the replay
+                sent = event_id
+                yield format_sse(event_id, event, data)
+        finally:
+            self.unsubscribe(queue)
+
+
+def parse_last_event_id(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def sse_response(stream: AsyncIterator[bytes]) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,41 +1,137 @@
 """
-Helper utilities — logging movements and upload config.
+Helper utilities — category registry, logging movements and derived
+transactions (as background jobs), upload config and raw passthrough responses.
 """
 
+import asyncio
 import os
 import shutil
+import time
 from datetime import datetime
 from typing import Any
-from fastapi import UploadFile, HTTPException  # type: ignore
+from fastapi import UploadFile, HTTPException, Response  # type: ignore
 from supabase_client import supabase  # type: ignore
+from events import Broadcaster  # type: ignore
+from cache import response_cache, DASHBOARD  # type: ignore
+from rollups import rollups  # type: ignore
+from jobs import job_runner, current_job_id  # type: ignore
 
 # Upload directory (Vercel uses /tmp, local uses ./uploads)
 IS_VERCEL = os.getenv("VERCEL", "")
 UPLOAD_DIR = "/tmp/uploads" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# ─── In-memory category cache ────────────────────────────────────────────────
+# ─── Category registry ───────────────────────────────────────────────────────
 
-_category_cache: dict[str, int] = {}
+CATEGORY_CACHE_TTL = float(os.getenv("CATEGORY_CACHE_TTL", "300"))
+
+
+class CategoryRegistry:
+    """
+    All categories, loaded with ONE query and served from memory.
+
+    Answers both name → id lookups and the /categories listing. Reloaded
+    after CATEGORY_CACHE_TTL seconds, or right away once invalidated by a
+    category write.
+    """
+
+    def __init__(self, ttl: float = CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._rows: list[dict] = []
+        self._ids_by_name: dict[str, int] = {}
+        self._loaded_at: float | None = None
+        self._loading: asyncio.Future | None = None
+        self._generation = 0  # Bumped by invalidate(): loads started before it are stale
+
+    async def ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        # Concurrent callers share one load
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.ensure_future(self.load())
+        await asyncio.shield(self._loading)
+
+    async def load(self):
+        generation = self._generation
+        res = await supabase.table("categories").select("*").order("name").execute()
+        if not res:
+            # Keep serving the previous snapshot; the next call retries
+            print(f"[categories] Warning: load failed: {res.error}")
+            return
+        stale = generation != self._generation
+        if stale and self._loaded_at is not None:
+            return  # Read before a category write: keep the snapshot a newer load may have set
+        self._rows = list(res.data or [])
+        self._ids_by_name = {row["name"]: row["id"] for row in self._rows}
+        if not stale:
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._generation += 1
+        self._loaded_at = None
+        self._loading = None  # The next caller starts a load that sees the write
+
+    async def get_id(self, name: str) -> int | None:
+        await self.ensure_loaded()
+        return self._ids_by_name.get(name)
+
+    async def list(self, type: str | None = None) -> list[dict]:
+        await self.ensure_loaded()
+        if type:
+            return [row for row in self._rows if row.get("type") == type]
+        return list(self._rows)
+
+
+category_registry = CategoryRegistry()
 
 
 async def get_category_id(name: str) -> int | None:
     """
-    Get category ID by name, with in-memory caching.
+    Get category ID by name from the category registry.
     Returns None if category not found.
     """
-    if name in _category_cache:
-        return _category_cache[name]
+    return await category_registry.get_id(name)
 
-    res = await supabase.table("categories").select("id").eq("name", name).single().execute()
-    if res and res.data:
-        _category_cache[name] = res.data["id"]
-        return res.data["id"]
-    return None
+
+# ─── Raw Passthrough ─────────────────────────────────────────────────────────
+
+def raw_response(res) -> Response:
+    """
+    Forward a raw-mode SupabaseResponse body to the client without
+    decoding and re-encoding it. Falls back to an empty list on error,
+    like the decoded endpoints do.
+    """
+    if not res or not res.content:
+        return Response(content=b"[]", media_type="application/json")
+    return Response(content=res.content, media_type=res.content_type)
 
 
 # ─── Movement Logging ────────────────────────────────────────────────────────
 
+# Live feed of inserted app_movements rows (GET /movements/stream).
+# Event ids are the broadcaster's publish sequence (jobs insert rows out of
+# id order); the row, with its id, is the payload.
+movement_events = Broadcaster(history=int(os.getenv("MOVEMENT_STREAM_HISTORY", "500")))
+
+
+def publish_movements(rows: list[dict]):
+    for row in sorted(rows, key=lambda r: r.get("id") or 0):
+        movement_events.publish("movement", row)
+
+
+async def fetch_movements_since(last_id: int | None) -> list[dict]:
+    """
+    Rows after the `last_id` row cursor, or the newest ones without it:
+    the resync for stream clients the ring buffer cannot resume.
+    """
+    query = supabase.table("app_movements").select("*")
+    if last_id is None:
+        res = await query.order("id", desc=True).limit(movement_events.history_size).execute()
+        return list(reversed(res.data if res else []))
+    res = await query.gt("id", last_id).order("id").limit(movement_events.history_size).execute()
+    return res.data if res else []
+
+
 async def log_movement(
     category: str,
     action: str,
@@ -47,25 +143,74 @@ async def log_movement(
 ):
     """
     Log an application movement to the app_movements table.
+    The insert runs as a background job; callers do not wait for it.
 
     Categories: STOCK, VENTA, FINANZAS, SISTEMA
     Actions: ALTA, VENTA, VENTA_LOTE, REPORTE, GASTO, CONFIG, etc.
     """
-    try:
-        payload: dict[str, Any] = {
-            "category": category,
-            "action": action,
-            "description": description,
-            "metadata": metadata or {},
-        }
-        if stock_item_id:
-            payload["stock_item_id"] = stock_item_id
-        if transaction_id:
-            payload["transaction_id"] = transaction_id
-        if sale_id:
-            payload["sale_id"] = sale_id
-
-        await supabase.table("app_movements").insert(payload).execute()
-    except Exception as e:
-        # Don't let logging failures break the main operation
-        print(f"[log_movement] Warning: {e}")
+    payload: dict[str, Any] = {
+        "category": category,
+        "action": action,
+        "description": description,
+        "metadata": metadata or {},
+    }
+    if stock_item_id:
+        payload["stock_item_id"] = stock_item_id
+    if transaction_id:
+        payload["transaction_id"] = transaction_id
+    if sale_id:
+        payload["sale_id"] = sale_id
+    await job_runner.enqueue("insert_movement", payload=payload)
+
+
+async def _insert_once(table: str, row: dict, require_rows: bool = False) -> tuple[list[dict], bool]:
+    """
+    Insert `row` at most once per job. The job id goes into the row's
+    unique job_id column and the insert ignores duplicates, so a retry or
+    a crash-recovered replay of a job whose insert already went through
+    writes nothing. Returns (rows, replayed). Needs:
+
+        alter table transactions add column job_id text unique;
+        alter table app_movements add column job_id text unique;
+    """
+    job_id = current_job_id()
+    query = supabase.table(table)
+    if job_id is None:
+        res = await query.insert(row).execute()
+    else:
+        res = await query.upsert({**row, "job_id": job_id}, on_conflict="job_id", ignore_duplicates=True).execute()
+    if not res:
+        raise RuntimeError(f"{table} insert failed: {res.error}")
+    if job_id is not None and not res.data:
+        return [], True
+    if require_rows and not res.data:
+        raise RuntimeError(f"{table} insert failed: no data")
+    return res.data, False
+
+
+@job_runner.handler("insert_movement")
+async def _insert_movement(payload: dict):
+    rows, replayed = await _insert_once("app_movements", payload)
+    if rows and not replayed:
+        publish_movements(rows)
+
+
+async def record_transaction(tx: dict, movement: dict | None = None):
+    """
+    Insert a derived transaction (purchase cost, expense) as a background
+    job. `movement` holds log_movement() arguments to log once the
+    transaction id is known.
+    """
+    await job_runner.enqueue("insert_transaction", tx=tx, movement=movement)
+
+
+@job_runner.handler("insert_transaction")
+async def _insert_transaction(tx: dict, movement: dict | None = None):
+    rows, replayed = await _insert_once("transactions", tx, require_rows=True)
+    if replayed:
+        return  # Recorded (and its movement enqueued) by the first run
+    rollups.record_transactions(rows)
+    response_cache.invalidate(DASHBOARD)
+    if movement:
+        # Separate job: a retry of the movement must not insert the transaction twice
+        await log_movement(**movement, transaction_id=rows[0]["id"])
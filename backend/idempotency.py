@@ -0,0 +1,238 @@
+"""
+Idempotency-Key support for non-repeatable POST endpoints.
+
+A client that retries a request with the same `Idempotency-Key` header
+gets the stored response of the first successful attempt instead of
+running the operation (and its stock deduction) again.
+
+Completed responses live in an in-memory LRU. If IDEMPOTENCY_TABLE is
+set they are also persisted to that Supabase table so replays survive
+restarts and are shared between instances:
+
+    create table idempotency_keys (
+        key text primary key,
+        fingerprint text not null,
+        response jsonb not null,
+        created_at timestamptz default now()
+    );
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException  # type: ignore
+from pydantic import BaseModel  # type: ignore
+
+from supabase_client import supabase  # type: ignore
+from cache import LRUCache  # type: ignore
+
+IDEMPOTENCY_TABLE = os.getenv("IDEMPOTENCY_TABLE", "")
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "2048"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of the request body, to reject a key reused for a different request."""
+    if isinstance(payload, BaseModel):
+        raw = payload.model_dump_json()
+    else:
+        raw = repr(payload)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs an operation at most once per (scope, key).
+
+    Concurrent requests with the same key wait for the first one and get
+    its outcome. Failures are not stored: the handlers roll back on error,
+    so a retry after a failure is allowed to run again.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL, table: str = IDEMPOTENCY_TABLE):
+        self.table = table
+        self._completed = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def run(
+        self,
+        key: str | None,
+        scope: str,
+        payload: Any,
+        operation: Callable[[], Awaitable[Any]],
+    ) -> tuple[Any, bool]:
+        """
+        Execute `operation` unless `key` was already completed for `scope`.
+        Returns (result, replayed).
+        """
+        if not key:
+            return await operation(), False
+
+        cache_key = f"{scope}:{key}"
+        fp = fingerprint(payload)
+
+        stored = self._completed.get(cache_key)
+        if stored is not None:
+            return self._replay(stored, fp), True
+
+        pending = self._in_flight.get(cache_key)
+        if pending is not None:
+            stored = await asyncio.shield(pending)
+            return self._replay(stored, fp), True
+
+        # Reserved before the first await (the table lookup), so a duplicate
+        # arriving meanwhile waits for this request instead of running too
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        try:
+            stored = await self._load(cache_key)
+            replayed = stored is not None
+            if stored is None:
+                stored = {"fingerprint": fp, "response": await operation()}
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # Mark retrieved when nobody is waiting
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+
+        self._completed.set(cache_key, stored)
+        future.set_result(stored)
+        if replayed:
+            return self._replay(stored, fp), True
+        await self._persist(cache_key, stored)
+        return stored["response"], False
+
+    async def lookup_many(self, keys: list[str], scope: str) -> dict[str, Any]:
+        """
+        Return {key: stored response} for the keys already completed.
+        Memory misses are resolved with ONE query against the table.
+        """
+        found: dict[str, Any] = {}
+        missing: list[str] = []
+        for key in keys:
+            stored = self._completed.get(f"{scope}:{key}")
+            if stored is not None:
+                found[key] = stored["response"]
+            else:
+                missing.append(key)
+
+        if missing and self.table:
+            try:
+                res = await (
+                    supabase.table(self.table)
+                    .select("key, fingerprint, response")
+                    .in_("key", [f"{scope}:{key}" for key in missing])
+                    .execute()
+                )
+            except Exception as e:
+                print(f"[idempotency] Warning: lookup failed: {e}")
+                res = None
+            for row in (res.data if res else []):
+                stored = {"fingerprint": row["fingerprint"], "response": row["response"]}
+                self._completed.set(row["key"], stored)
+                found[row["key"].split(":", 1)[1]] = stored["response"]
+        return found
+
+    async def claim_many(self, keys: list[str], scope: str) -> tuple[dict[str, Any], list[str]]:
+        """
+        Batch counterpart of run() for work done outside it.
+
+        Returns ({key: stored response} for keys already completed, keys
+        now reserved for the caller). Keys another request is working on
+        are waited for first, like run() does. The caller must record its
+        outcomes with remember_many() and then release_many() the claimed
+        keys, also when it fails.
+        """
+        found = await self.lookup_many(keys, scope)
+        while True:
+            waiting = [
+                self._in_flight[f"{scope}:{key}"]
+                for key in keys
+                if key not in found and f"{scope}:{key}" in self._in_flight
+            ]
+            if not waiting:
+                break
+            await asyncio.wait(waiting)
+            for key in keys:
+                stored = self._completed.get(f"{scope}:{key}")
+                if stored is not None:
+                    found[key] = stored["response"]
+
+        # No await from the check above to here: the reservation is atomic
+        claimed = [key for key in keys if key not in found]
+        loop = asyncio.get_running_loop()
+        for key in claimed:
+            self._in_flight[f"{scope}:{key}"] = loop.create_future()
+        return found, claimed
+
+    def release_many(self, keys: list[str], scope: str):
+        """Drop reservations made by claim_many() and wake whoever waits on them."""
+        for key in keys:
+            future = self._in_flight.pop(f"{scope}:{key}", None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    async def remember_many(self, entries: list[tuple[str, Any, Any]], scope: str):
+        """Record (key, payload, result) outcomes for work done outside run(), in one write."""
+        rows = []
+        for key, payload, result in entries:
+            stored = {"fingerprint": fingerprint(payload), "response": result}
+            self._completed.set(f"{scope}:{key}", stored)
+            rows.append({"key": f"{scope}:{key}", **stored})
+
+        if rows and self.table:
+            try:
+                await supabase.table(self.table).upsert(rows, on_conflict="key").execute()
+            except Exception as e:
+                print(f"[idempotency] Warning: persist failed: {e}")
+
+    def _replay(self, stored: dict, fp: str) -> Any:
+        if stored["fingerprint"] != fp:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key already used with a different request body",
+            )
+        return stored["response"]
+
+    async def _load(self, cache_key: str) -> dict | None:
+        if not self.table:
+            return None
+        try:
+            res = await (
+                supabase.table(self.table)
+                .select("fingerprint, response")
+                .eq("key", cache_key)
+                .limit(1)
+                .execute()
+            )
+        except Exception as e:
+            print(f"[idempotency] Warning: lookup failed: {e}")
+            return None
+        if not res or not res.data:
+            return None
+        stored = res.data[0]
+        self._completed.set(cache_key, stored)
+        return stored
+
+    async def _persist(self, cache_key: str, stored: dict):
+        if not self.table:
+            return
+        try:
+            await supabase.table(self.table).upsert(
+                {"key": cache_key, **stored}, on_conflict="key"
+            ).execute()
+        except Exception as e:
+            # The in-memory copy still protects retries against this instance
+            print(f"[idempotency] Warning: persist failed: {e}")
+
+    def clear(self):
+        self._completed.clear()
+        self._in_flight.clear()
+
+
+idempotency = IdempotencyStore()
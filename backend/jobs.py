@@ -0,0 +1,291 @@
+"""
+In-process background jobs for post-commit work.
+
+Handlers enqueue slow follow-up writes (audit movements, derived
+transactions) instead of awaiting them, so endpoint latency covers only
+the work the client waits for. Jobs are named functions with JSON
+arguments:
+
+    @job_runner.handler("send_mail")
+    async def send_mail(to: str): ...
+
+    await job_runner.enqueue("send_mail", to="x@y.z")
+
+A fixed pool of worker tasks (JOBS_CONCURRENCY) runs them with up to
+JOBS_MAX_ATTEMPTS tries and exponential backoff. Every job is appended
+to a JSONL journal when enqueued and when it finishes; jobs without a
+final record are re-queued by start() after a crash. Journal records are
+buffered and written by one background flush (in a thread), never on the
+request path; every JOBS_JOURNAL_COMPACT_EVERY records the flush rewrites
+the journal with only the unfinished jobs, so it stays small in a
+long-lived process. The queue is drained on shutdown.
+
+Each process owns its journal: start() locks the first free slot
+(JOBS_JOURNAL, then JOBS_JOURNAL.1, .2, ...), so sibling workers never
+replay or compact each other's jobs, and a crashed worker's slot is
+recovered by the next process that starts. A recovered job may still
+have run before the crash: handlers that insert rows should be
+idempotent on current_job_id() (helpers._insert_once writes it to a
+unique job_id column).
+
+With JOBS_INLINE (the default on Vercel, where the process may be frozen
+right after the response) jobs run immediately inside enqueue(), with a
+single attempt: a failure is recorded, not retried with backoff inside
+the request.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import IO, Any, Awaitable, Callable
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one journal per pid instead
+    fcntl = None  # type: ignore
+
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "4"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETRY_DELAY = float(os.getenv("JOBS_RETRY_DELAY", "0.5"))
+JOBS_DRAIN_TIMEOUT = float(os.getenv("JOBS_DRAIN_TIMEOUT", "10"))
+JOBS_JOURNAL = os.getenv("JOBS_JOURNAL", os.path.join(tempfile.gettempdir(), "novamanager_jobs.jsonl"))
+JOBS_JOURNAL_SLOTS = int(os.getenv("JOBS_JOURNAL_SLOTS", "16"))
+JOBS_JOURNAL_COMPACT_EVERY = int(os.getenv("JOBS_JOURNAL_COMPACT_EVERY", "1000"))
+JOBS_INLINE = os.getenv("JOBS_INLINE", "true" if os.getenv("VERCEL") else "false").lower() == "true"
+
+Handler = Callable[..., Awaitable[Any]]
+
+_current_job: ContextVar[str | None] = ContextVar("current_job", default=None)
+
+
+def current_job_id() -> str | None:
+    """Id of the job being run (stable across retries and crash recovery)."""
+    return _current_job.get()
+
+
+class JobRunner:
+    """Bounded-concurrency asyncio job queue with retries and a crash journal."""
+
+    def __init__(
+        self,
+        concurrency: int = JOBS_CONCURRENCY,
+        max_attempts: int = JOBS_MAX_ATTEMPTS,
+        retry_delay: float = JOBS_RETRY_DELAY,
+        journal_path: str = JOBS_JOURNAL,
+        inline: bool = JOBS_INLINE,
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.journal_base = journal_path
+        self.journal_path = journal_path  # The slot this process locked, once started
+        self.inline = inline
+        self._journal_lock: IO | None = None
+        self._journal_buffer: list[dict] = []
+        self._journal_flush: asyncio.Task | None = None
+        self._journal_written = 0  # Records appended since the last compaction
+        self.compact_every = JOBS_JOURNAL_COMPACT_EVERY
+        self._unfinished: dict[str, dict] = {}  # Journaled jobs without a final record
+        self._handlers: dict[str, Handler] = {}
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        self._counts: Counter = Counter()
+        self._running = 0
+        self._failures: deque = deque(maxlen=20)
+
+    def handler(self, name: str) -> Callable[[Handler], Handler]:
+        def register(fn: Handler) -> Handler:
+            self._handlers[name] = fn
+            return fn
+        return register
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """Start the workers and re-queue jobs the journal shows as unfinished."""
+        if self.inline or self.started:
+            return
+        self._queue = asyncio.Queue()
+        self.journal_path = self._claim_journal()
+        pending = self._recover()
+        self._compact(pending)
+        self._unfinished = {job["id"]: job for job in pending}
+        for job in pending:
+            self._queue.put_nowait(job)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def drain(self, timeout: float = JOBS_DRAIN_TIMEOUT):
+        """Wait for queued jobs (up to `timeout`), then stop the workers."""
+        if not self.started:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)  # type: ignore
+        except asyncio.TimeoutError:
+            print(f"[jobs] Warning: {self._queue.qsize()} jobs left in the journal at shutdown")  # type: ignore
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        if self._journal_flush is not None:
+            await self._journal_flush
+        if self._journal_lock is not None:
+            self._journal_lock.close()  # Releases the slot
+            self._journal_lock = None
+
+    # ── Enqueue / run ─────────────────────────────────────────────────────
+
+    async def enqueue(self, name: str, **kwargs: Any) -> str:
+        if name not in self._handlers:
+            raise KeyError(f"Unknown job: {name}")
+        job = {"id": uuid.uuid4().hex, "name": name, "kwargs": kwargs, "enqueued_at": time.time()}
+        self._counts["enqueued"] += 1
+        if self.inline or not self.started:
+            await self._run(job)
+            return job["id"]
+        self._unfinished[job["id"]] = job
+        self._journal({"op": "enqueued", "job": job})
+        self._queue.put_nowait(job)  # type: ignore
+        return job["id"]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()  # type: ignore
+            try:
+                ok = await self._run(job)
+                self._unfinished.pop(job["id"], None)
+                self._journal({"op": "done" if ok else "failed", "id": job["id"]})
+            finally:
+                self._queue.task_done()  # type: ignore
+
+    async def _run(self, job: dict) -> bool:
+        handler = self._handlers.get(job["name"])
+        if handler is None:
+            self._fail(job, "no handler registered")
+            return False
+        # Inline jobs run inside a request: no backoff sleeps there
+        attempts = 1 if self.inline or not self.started else self.max_attempts
+        token = _current_job.set(job["id"])
+        self._running += 1
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    await handler(**job["kwargs"])
+                    self._counts["completed"] += 1
+                    return True
+                except Exception as e:
+                    if attempt == attempts:
+                        self._fail(job, str(e))
+                        return False
+                    self._counts["retried"] += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            return False
+        finally:
+            self._running -= 1
+            _current_job.reset(token)
+
+    def _fail(self, job: dict, error: str):
+        self._counts["failed"] += 1
+        self._failures.append({"id": job["id"], "name": job["name"], "error": error, "at": time.time()})
+        print(f"[jobs] Warning: job {job['name']} ({job['id']}) failed: {error}")
+
+    # ── Journal ───────────────────────────────────────────────────────────
+
+    def _claim_journal(self) -> str:
+        """Lock and return the first journal slot no running process holds."""
+        if fcntl is None:
+            return f"{self.journal_base}.{os.getpid()}"
+        for slot in range(JOBS_JOURNAL_SLOTS):
+            path = self.journal_base if slot == 0 else f"{self.journal_base}.{slot}"
+            lock = open(f"{path}.lock", "a")
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                continue
+            self._journal_lock = lock
+            return path
+        print(f"[jobs] Warning: all {JOBS_JOURNAL_SLOTS} journal slots are locked, using a per-pid journal")
+        return f"{self.journal_base}.{os.getpid()}"
+
+    def _journal(self, record: dict):
+        """Buffer a record; one flush task at a time appends the buffer in a thread."""
+        self._journal_buffer.append(record)
+        if self._journal_flush is None or self._journal_flush.done():
+            self._journal_flush = asyncio.create_task(self._flush_journal())
+
+    async def _flush_journal(self):
+        while self._journal_buffer:
+            records, self._journal_buffer = self._journal_buffer, []
+            await asyncio.to_thread(self._append, records)
+            self._journal_written += len(records)
+            if self._journal_written >= self.compact_every:
+                # Records still buffered are appended after the rewrite: at
+                # worst a job is listed twice, which _recover() tolerates
+                self._journal_written = 0
+                await asyncio.to_thread(self._compact, list(self._unfinished.values()))
+
+    def _append(self, records: list[dict]):
+        try:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+        except OSError as e:
+            print(f"[jobs] Warning: journal write failed: {e}")
+
+    def _recover(self) -> list[dict]:
+        pending: dict[str, dict] = {}
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line after a crash
+                    if record.get("op") == "enqueued":
+                        pending[record["job"]["id"]] = record["job"]
+                    else:
+                        pending.pop(record.get("id"), None)
+        except FileNotFoundError:
+            return []
+        return [job for job in pending.values() if job.get("name") in self._handlers]
+
+    def _compact(self, pending: list[dict]):
+        """Rewrite the journal with only the unfinished jobs."""
+        tmp_path = f"{self.journal_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for job in pending:
+                    f.write(json.dumps({"op": "enqueued", "job": job}, default=str) + "\n")
+            os.replace(tmp_path, self.journal_path)
+        except OSError as e:
+            print(f"[jobs] Warning: journal compaction failed: {e}")
+
+    # ── Stats ─────────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        return {
+            "mode": "inline" if self.inline or not self.started else "background",
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "enqueued": self._counts["enqueued"],
+            "completed": self._counts["completed"],
+            "retried": self._counts["retried"],
+            "failed": self._counts["failed"],
+            "recent_failures": list(self._failures),
+        }
+
+
+job_runner = JobRunner()
@@ -1,7 +1,7 @@
 """
 NovaManager — FastAPI Application Entry Point.
 
-Sets up middleware (CORS, Auth), exception handling, router registration,
+Sets up middleware (CORS, Auth, Compression, Tracing), exception handling, router registration,
 and manages the async Supabase client lifecycle.
 """
 
@@ -16,6 +16,12 @@ from fastapi.middleware.cors import CORSMiddleware  # type: ignore
 
 from supabase_client import supabase  # type: ignore
 from auth import ApiKeyMiddleware  # type: ignore
+from compression import CompressionMiddleware  # type: ignore
+from tracing import TracingMiddleware  # type: ignore
+from catalog import catalog  # type: ignore
+from helpers import category_registry  # type: ignore
+from rendering import render_pool  # type: ignore
+from jobs import job_runner  # type: ignore
 
 load_dotenv()
 
@@ -26,9 +32,21 @@ IS_VERCEL = os.getenv("VERCEL", "")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Open the Supabase client on startup, close on shutdown."""
+    """
+    Open the Supabase client, start the job runner and warm the in-memory
+    registries on startup; drain pending jobs and close on shutdown.
+    """
     await supabase.open()
+    await job_runner.start()
+    try:
+        await category_registry.load()
+        await catalog.load()
+    except Exception as e:
+        # Registries load lazily on first use instead
+        print(f"[startup] Warning: warm-up failed: {e}")
     yield
+    await job_runner.drain()
+    render_pool.shutdown()
     await supabase.close()
 
 # ─── App Factory ─────────────────────────────────────────────────────────────
@@ -58,6 +76,12 @@ app.add_middleware(
 # API Key Authentication
 app.add_middleware(ApiKeyMiddleware)
 
+# Response compression (gzip / brotli, threshold via COMPRESSION_MIN_SIZE)
+app.add_middleware(CompressionMiddleware)
+
+# Query tracing (outermost: times everything, adds Server-Timing, feeds /metrics)
+app.add_middleware(TracingMiddleware)
+
 # ─── Global Exception Handler ────────────────────────────────────────────────
 
 @app.exception_handler(Exception)
@@ -0,0 +1,199 @@
+"""
+PDF rendering off the event loop.
+
+reportlab is synchronous and CPU-bound, so documents are rendered by
+plain functions (data in, bytes or file out) submitted to a small worker
+pool instead of being built inside the async handlers. The pool uses
+threads by default; with PDF_RENDER_PROCESSES > 0 it uses that many
+spawned processes, so large reports do not compete with the API for the
+GIL. Static page furniture is drawn once per document as a form XObject
+and referenced from every page.
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from reportlab.lib.pagesizes import A4  # type: ignore
+from reportlab.lib.units import mm  # type: ignore
+from reportlab.pdfgen import canvas  # type: ignore
+
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_PROCESSES = int(os.getenv("PDF_RENDER_PROCESSES", "0"))
+
+COMPANY_NAME = "Centro de Abaratamiento Mayorista"
+
+
+class RenderPool:
+    """Lazily started executor shared by every PDF endpoint."""
+
+    def __init__(self, workers: int = PDF_RENDER_WORKERS, processes: int = PDF_RENDER_PROCESSES):
+        self.workers = workers
+        self.processes = processes
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes > 0:
+                # spawn: never fork the running event loop and client sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdf-render")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a module-level render function (picklable, for process pools)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+render_pool = RenderPool()
+
+
+# ─── Templates ───────────────────────────────────────────────────────────────
+
+def _define_header(c: canvas.Canvas, name: str, title: str, title_size: int, title_offset: float):
+    """Record the static header (title + company) once as a reusable form."""
+    _, height = A4
+    c.beginForm(name)
+    c.setFont("Helvetica-Bold", title_size)
+    c.drawString(30 * mm, height - title_offset * mm, title)
+    c.setFont("Helvetica", 10)
+    c.drawString(30 * mm, height - (title_offset + 8) * mm, COMPANY_NAME)
+    c.endForm()
+
+
+# ─── Invoice ─────────────────────────────────────────────────────────────────
+
+def render_invoice(transaction_id: int, tx: dict, sale_items: list[dict], product_names: dict[int, dict]) -> bytes:
+    """Invoice PDF for one sale transaction."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    _define_header(c, "invoice_header", "FACTURA DE VENTA", 16, 30)
+
+    def page_header():
+        c.doForm("invoice_header")
+        c.setFont("Helvetica", 10)
+        c.drawString(30 * mm, height - 44 * mm, f"Transacción #{transaction_id}")
+        c.drawString(130 * mm, height - 44 * mm, f"Fecha: {tx.get('date', '-')}")
+
+    page_header()
+
+    # Table header
+    y = height - 60 * mm
+    c.setFont("Helvetica-Bold", 9)
+    c.drawString(30 * mm, y, "Producto")
+    c.drawString(110 * mm, y, "Cant.")
+    c.drawString(135 * mm, y, "Subtotal")
+    c.line(30 * mm, y - 2, 175 * mm, y - 2)
+
+    # Items
+    y -= 8 * mm
+    c.setFont("Helvetica", 9)
+    for item in sale_items:
+        prod = product_names.get(item["stock_item_id"], {})
+        name: str = f"{prod.get('brand', '')} {prod.get('name', item.get('description', '?'))}".strip()
+        truncated_name = name[:50]  # type: ignore
+
+        c.drawString(30 * mm, y, truncated_name)
+        c.drawString(110 * mm, y, str(item["quantity"]))
+        c.drawString(135 * mm, y, f"$ {item['sale_price_total']:,.2f}")
+        y -= 6 * mm
+
+        if y < 30 * mm:
+            c.showPage()
+            page_header()
+            c.setFont("Helvetica", 9)
+            y = height - 55 * mm
+
+    # Total
+    y -= 5 * mm
+    c.line(30 * mm, y, 175 * mm, y)
+    y -= 8 * mm
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(110 * mm, y, f"TOTAL:  $ {tx['amount']:,.2f}")
+
+    c.save()
+    return buffer.getvalue()
+
+
+# ─── Accounting report ───────────────────────────────────────────────────────
+
+# Rows travel to the worker as compact (date, description, amount) tuples
+ReportRow = tuple[str, str, float]
+
+
+def render_accounting_report(path: str, period: str, incomes: list[ReportRow], expenses: list[ReportRow]):
+    """
+    Monthly statement PDF written to `path`.
+
+    Page streams are compressed as each page is finished, so memory stays
+    bounded by one page plus the compressed output; the file is written
+    to a temp name and renamed so readers never see a partial report.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        c = canvas.Canvas(tmp_path, pagesize=A4, pageCompression=1)
+        _, height = A4
+        _define_header(c, "report_header", "ESTADO DE CUENTA", 18, 25)
+
+        c.doForm("report_header")
+        c.setFont("Helvetica", 11)
+        c.drawString(30 * mm, height - 40 * mm, f"Período: {period}")
+        y = height - 55 * mm
+
+        def section(title: str, rows: list[ReportRow], total_label: str, y: float) -> tuple[float, float]:
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(30 * mm, y, title)
+            y -= 8 * mm
+            c.setFont("Helvetica", 9)
+            total = 0.0
+            for day, description, amount in sorted(rows, key=lambda r: r[0]):
+                total += amount
+                c.drawString(30 * mm, y, day)
+                c.drawString(55 * mm, y, description)
+                c.drawRightString(175 * mm, y, f"$ {amount:,.2f}")
+                y -= 5 * mm
+                if y < 30 * mm:
+                    c.showPage()  # Flush: the finished page is compressed and kept as bytes
+                    c.doForm("report_header")
+                    c.setFont("Helvetica", 9)
+                    y = height - 45 * mm
+
+            c.setFont("Helvetica-Bold", 10)
+            y -= 3 * mm
+            c.line(30 * mm, y + 2, 175 * mm, y + 2)
+            c.drawString(55 * mm, y - 3 * mm, total_label)
+            c.drawRightString(175 * mm, y - 3 * mm, f"$ {total:,.2f}")
+            return y, total
+
+        y, total_income = section("INGRESOS", incomes, "Total Ingresos:", y)
+        y -= 15 * mm
+        y, total_expense = section("EGRESOS", expenses, "Total Egresos:", y)
+        y -= 20 * mm
+
+        c.setFont("Helvetica-Bold", 14)
+        c.line(30 * mm, y + 5, 175 * mm, y + 5)
+        c.drawString(55 * mm, y - 5 * mm, "BALANCE NETO:")
+        c.drawRightString(175 * mm, y - 5 * mm, f"$ {total_income - total_expense:,.2f}")
+
+        c.save()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
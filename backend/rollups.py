@@ -0,0 +1,360 @@
+"""
+Pre-aggregated sales and cash-flow rollups for reporting.
+
+Two in-process stores, both bucketed by calendar day:
+  - totals per (day, category_id, type) from `transactions`
+  - units / revenue per (day, stock_item_id) from `sales`, dated by their
+    parent transaction
+
+Write endpoints report the rows they insert (sale lines with their
+stock units, see rows.SaleLine), so the buckets stay current without
+re-reading the tables. A full rebuild pages through both tables once; it
+runs in the background on first use and on demand via POST
+/rebuild-rollups. After that, every ROLLUP_MAX_AGE seconds only the last
+ROLLUP_REFRESH_DAYS days are re-read and replaced, which picks up rows
+inserted by other instances (the app only appends to both tables, dated
+now or, for offline replays, a few days back); edits made outside the
+app to older rows need POST /rebuild-rollups. Writes reported while a
+rebuild runs are replayed on top of it unless its scan already saw them.
+
+Requests never wait for a full rebuild: view() returns the live store,
+stale or not, and before the first build completes it answers from a
+one-off store loaded with only the rows of the requested range.
+
+Series over a year touch at most 365 day buckets instead of every row.
+Per-SKU totals of closed periods (ending before today) are memoized until
+a rebuild or a backdated sale (e.g. an offline replay) touches the past.
+"""
+
+import asyncio
+import bisect
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterable
+
+from supabase_client import supabase  # type: ignore
+from cache import LRUCache  # type: ignore
+from rows import SaleLine  # type: ignore
+
+ROLLUP_MAX_AGE = float(os.getenv("ROLLUP_MAX_AGE", "900"))
+ROLLUP_PAGE_SIZE = int(os.getenv("ROLLUP_PAGE_SIZE", "1000"))
+ROLLUP_PERIOD_CACHE_SIZE = int(os.getenv("ROLLUP_PERIOD_CACHE_SIZE", "128"))
+ROLLUP_REFRESH_DAYS = int(os.getenv("ROLLUP_REFRESH_DAYS", "7"))
+ROLLUP_ID_CHUNK = 200  # Transaction ids per sales query when loading a range of days
+
+TX_COLUMNS = "id, amount, type, category_id, date"
+SALES_COLUMNS = "id, stock_item_id, quantity, units, description, sale_price_total, sale_tx_id"
+
+GRANULARITIES = ("day", "week", "month")
+
+# Rows written before `units` existed: the suffix _sale_line() appends to pack line descriptions
+_PACK_SUFFIX_RE = re.compile(r" \(Pack x([\d.]+)\)$")
+
+
+def day_of(value) -> str:
+    """ISO day of a timestamp column; rows inserted without one default to now() in the DB."""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if value:
+        return str(value)[:10]
+    return date.today().isoformat()
+
+
+def period_of(day: str, granularity: str) -> str:
+    """Bucket key of a day: the day itself, the Monday of its week, or YYYY-MM."""
+    if granularity == "month":
+        return day[:7]
+    if granularity == "week":
+        d = date.fromisoformat(day)
+        return (d - timedelta(days=d.weekday())).isoformat()
+    return day
+
+
+def sale_units(sale: dict) -> float:
+    """
+    Units a stored sale row took out of stock, for rebuilds: the `units`
+    column (`alter table sales add column units numeric`). Rows written
+    before it existed fall back to the " (Pack xN)" suffix of their
+    description.
+    """
+    if sale.get("units") is not None:
+        return sale["units"]
+    quantity = sale.get("quantity") or 0
+    match = _PACK_SUFFIX_RE.search(sale.get("description") or "")
+    return quantity * float(match.group(1)) if match else quantity
+
+
+class SalesRollups:
+    """Day buckets of transaction totals and per-SKU sales."""
+
+    def __init__(self, max_age: float = ROLLUP_MAX_AGE, page_size: int = ROLLUP_PAGE_SIZE):
+        self.max_age = max_age
+        self.page_size = page_size
+        self._built_at: float | None = None
+        self._building: asyncio.Future | None = None
+        self._pending: list[tuple] | None = None  # Writes reported during a rebuild
+        self._closed_periods = LRUCache(max_entries=ROLLUP_PERIOD_CACHE_SIZE)
+        self.clear()
+
+    def clear(self):
+        self._days: list[str] = []  # Sorted days that have any bucket
+        self._totals: dict[str, dict[tuple[int | None, str], list]] = {}  # day → (category, type) → [amount, count]
+        self._skus: dict[str, dict[int, list]] = {}  # day → item id → [units, revenue]
+
+    # ── Building ──────────────────────────────────────────────────────────
+
+    @property
+    def loaded(self) -> bool:
+        return self._built_at is not None
+
+    async def view(self, start: str, end: str, sales: bool = True) -> "SalesRollups":
+        """
+        A store that can answer queries over [start, end] (ISO days) now.
+
+        Starts a background build when the rollups were never built, and
+        a refresh of the last ROLLUP_REFRESH_DAYS days when they are older
+        than max_age. Once built (even if stale) this store is returned;
+        before that, a one-off store with only the range's transactions
+        (and their sales, if `sales`).
+        """
+        if self._built_at is None:
+            self._start_rebuild()
+        elif time.monotonic() - self._built_at >= self.max_age:
+            self._start_rebuild((date.today() - timedelta(days=ROLLUP_REFRESH_DAYS)).isoformat())
+        if self.loaded:
+            return self
+        return await self._load_range(start, end, sales)
+
+    def _start_rebuild(self, start: str | None = None):
+        if self._building is None or self._building.done():
+            self._building = asyncio.ensure_future(self.rebuild(start))
+            self._building.add_done_callback(_log_rebuild_failure)
+
+    async def rebuild(self, start: str | None = None) -> dict:
+        """
+        Recompute the buckets from the tables, one page at a time: every
+        day, or only the days from `start` (ISO) on, keeping older buckets.
+        """
+        if not self.loaded:
+            start = None  # Nothing to keep
+        fresh = SalesRollups(self.max_age, self.page_size)
+        self._pending = []
+        try:
+            if start is None:
+                scanned = await fresh._scan(self._pages("transactions", TX_COLUMNS), all_sales=True)
+            else:
+                transactions = self._pages("transactions", TX_COLUMNS, lambda q: q.gte("date", start))
+                scanned = await fresh._scan(transactions, all_sales=False)
+            tx_days, with_sales, sales = scanned
+
+            # Writes reported meanwhile, unless the scans already counted them
+            for kind, tx, lines in self._pending:
+                day = day_of(tx.get("date"))
+                if start is not None and day < start:
+                    continue  # Outside the refreshed days: already applied to the live buckets
+                if kind == "tx" and tx.get("id") not in tx_days:
+                    fresh._add_transaction(tx)
+                elif kind == "sales" and tx.get("id") not in with_sales:
+                    fresh._add_lines(lines, day)
+        finally:
+            self._pending = None
+
+        if start is None:
+            self._days, self._totals, self._skus = fresh._days, fresh._totals, fresh._skus
+        else:
+            keep = bisect.bisect_left(self._days, start)
+            for day in self._days[keep:]:
+                del self._totals[day], self._skus[day]
+            self._days = self._days[:keep] + fresh._days
+            self._totals.update(fresh._totals)
+            self._skus.update(fresh._skus)
+        self._closed_periods.clear()
+        self._built_at = time.monotonic()
+        return {"transactions": len(tx_days), "sales": sales, "days": len(fresh._days)}
+
+    async def _load_range(self, start: str, end: str, sales: bool) -> "SalesRollups":
+        """One-off store with the transactions dated in [start, end] and their sales."""
+        store = SalesRollups(self.max_age, self.page_size)
+        next_day = (date.fromisoformat(end) + timedelta(days=1)).isoformat()
+        transactions = self._pages("transactions", TX_COLUMNS, lambda q: q.gte("date", start).lt("date", next_day))
+        await store._scan(transactions, all_sales=False, sales=sales)
+        return store
+
+    async def _scan(self, transactions, all_sales: bool, sales: bool = True) -> tuple[dict[int, str], set[int], int]:
+        """
+        Add the `transactions` rows, then their sales: by paging the whole
+        sales table if `all_sales`, else by the ids of the scanned INCOME
+        transactions, ROLLUP_ID_CHUNK per query. Returns (tx id → day, tx
+        ids whose sales were added, sales added).
+        """
+        tx_days: dict[int, str] = {}
+        income_ids: list[int] = []
+        async for tx in transactions:
+            day = self._add_transaction(tx)
+            if "id" in tx:
+                tx_days[tx["id"]] = day
+                if tx.get("type") == "INCOME":
+                    income_ids.append(tx["id"])
+
+        pages = []
+        if sales and all_sales:
+            pages = [self._pages("sales", SALES_COLUMNS)]
+        elif sales:
+            for i in range(0, len(income_ids), ROLLUP_ID_CHUNK):
+                chunk = income_ids[i:i + ROLLUP_ID_CHUNK]
+                pages.append(self._pages("sales", SALES_COLUMNS, lambda q, chunk=chunk: q.in_("sale_tx_id", chunk)))
+        with_sales: set[int] = set()
+        count = 0
+        for page in pages:
+            async for sale in page:
+                day = tx_days.get(sale.get("sale_tx_id"))  # type: ignore
+                if day is not None:
+                    self._add_sale(sale.get("stock_item_id"), sale_units(sale), sale.get("sale_price_total") or 0, day)
+                    with_sales.add(sale["sale_tx_id"])
+                    count += 1
+        return tx_days, with_sales, count
+
+    async def _pages(self, table: str, columns: str, where=None):
+        offset = 0
+        while True:
+            query = supabase.table(table).select(columns)
+            if where is not None:
+                query = where(query)
+            res = await (
+                query
+                .order("id")
+                .range(offset, offset + self.page_size - 1)
+                .execute()
+            )
+            rows = res.data if res else []
+            for row in rows:
+                yield row
+            if len(rows) < self.page_size:
+                return
+            offset += self.page_size
+
+    def reset(self):
+        self.clear()
+        self._closed_periods.clear()
+        self._built_at = None
+        self._building = None
+        self._pending = None
+
+    # ── Change notifications (called by write endpoints) ──────────────────
+
+    def record_transactions(self, rows: Iterable[dict]):
+        rows = list(rows)
+        if self._pending is not None:
+            self._pending.extend(("tx", tx, None) for tx in rows)
+        if not self.loaded:
+            return
+        for tx in rows:
+            self._add_transaction(tx)
+
+    def record_sales(self, lines: Iterable[SaleLine], tx: dict):
+        """Record the sale lines of one transaction (`tx` as returned by its insert)."""
+        lines = list(lines)
+        if self._pending is not None:
+            self._pending.append(("sales", tx, lines))
+        if not self.loaded:
+            return
+        day = day_of(tx.get("date"))
+        if day < date.today().isoformat():
+            self._closed_periods.clear()
+        self._add_lines(lines, day)
+
+    def _add_lines(self, lines: list[SaleLine], day: str):
+        for line in lines:
+            self._add_sale(line.stock_item_id, line.units, line.sale_price_total, day)
+
+    def _touch(self, day: str):
+        if day not in self._totals:
+            bisect.insort(self._days, day)
+            self._totals[day] = {}
+            self._skus[day] = {}
+
+    def _add_transaction(self, tx: dict) -> str:
+        day = day_of(tx.get("date"))
+        self._touch(day)
+        bucket = self._totals[day].setdefault((tx.get("category_id"), tx.get("type") or ""), [0.0, 0])
+        bucket[0] += tx.get("amount") or 0
+        bucket[1] += 1
+        return day
+
+    def _add_sale(self, item_id: int | None, units: float, revenue: float, day: str):
+        if item_id is None:
+            return
+        self._touch(day)
+        bucket = self._skus[day].setdefault(item_id, [0.0, 0.0])
+        bucket[0] += units
+        bucket[1] += revenue
+
+    # ── Queries ───────────────────────────────────────────────────────────
+
+    def _day_range(self, start: str, end: str) -> list[str]:
+        """Days with data in [start, end] (inclusive, ISO dates)."""
+        lo = bisect.bisect_left(self._days, start)
+        hi = bisect.bisect_right(self._days, end)
+        return self._days[lo:hi]
+
+    def series(self, start: str, end: str, granularity: str = "day", category_id: int | None = None) -> list[dict]:
+        """Income / expense / net per period, oldest first."""
+        periods: dict[str, dict] = {}
+        for day in self._day_range(start, end):
+            for (cat, tx_type), (amount, count) in self._totals[day].items():
+                if category_id is not None and cat != category_id:
+                    continue
+                key = period_of(day, granularity)
+                row = periods.setdefault(key, {"period": key, "income": 0.0, "expense": 0.0, "transactions": 0})
+                if tx_type == "INCOME":
+                    row["income"] += amount
+                elif tx_type == "EXPENSE":
+                    row["expense"] += amount
+                row["transactions"] += count
+        for row in periods.values():
+            row["net"] = row["income"] - row["expense"]
+        return list(periods.values())
+
+    def product_series(self, item_id: int, start: str, end: str, granularity: str = "day") -> list[dict]:
+        """Units and revenue of one SKU per period, oldest first."""
+        periods: dict[str, dict] = {}
+        for day in self._day_range(start, end):
+            bucket = self._skus[day].get(item_id)
+            if bucket is None:
+                continue
+            key = period_of(day, granularity)
+            row = periods.setdefault(key, {"period": key, "units": 0.0, "revenue": 0.0})
+            row["units"] += bucket[0]
+            row["revenue"] += bucket[1]
+        return list(periods.values())
+
+    def sku_totals(self, start: str, end: str) -> dict[int, tuple[float, float]]:
+        """item id → (units, revenue) summed over [start, end]."""
+        if end >= date.today().isoformat():
+            return self._sum_skus(start, end)  # Still receiving sales
+        cached = self._closed_periods.get((start, end))
+        if cached is None:
+            cached = self._sum_skus(start, end)
+            self._closed_periods.set((start, end), cached)
+        return cached
+
+    def _sum_skus(self, start: str, end: str) -> dict[int, tuple[float, float]]:
+        totals: dict[int, list] = {}
+        for day in self._day_range(start, end):
+            for item_id, (units, revenue) in self._skus[day].items():
+                acc = totals.setdefault(item_id, [0.0, 0.0])
+                acc[0] += units
+                acc[1] += revenue
+        return {item_id: (units, revenue) for item_id, (units, revenue) in totals.items()}
+
+
+def _log_rebuild_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[rollups] Warning: background rebuild failed: {task.exception()}")
+
+
+rollups = SalesRollups()
@@ -2,7 +2,9 @@
 
 from fastapi import APIRouter  # type: ignore
 from supabase_client import supabase  # type: ignore
-from helpers import log_movement  # type: ignore
+from helpers import log_movement, category_registry  # type: ignore
+from rollups import rollups  # type: ignore
+from jobs import job_runner  # type: ignore
 
 router = APIRouter()
 
@@ -29,11 +31,26 @@ async def seed_categories():
     res = await supabase.table("categories").upsert(
         DEFAULT_CATEGORIES, on_conflict="name"
     ).execute()
+    category_registry.invalidate()
 
     await log_movement("SISTEMA", "CONFIG", "Categorías inicializadas/actualizadas")
     return {"status": "ok", "count": len(res.data) if res.data else 0}
 
 
+@router.post("/rebuild-rollups")
+async def rebuild_rollups():
+    """Recompute the reporting rollups from transactions and sales (backfill)."""
+    counts = await rollups.rebuild()
+    await log_movement("SISTEMA", "CONFIG", "Rollups de reportes recalculados", metadata=counts)
+    return {"status": "ok", **counts}
+
+
+@router.get("/admin/jobs")
+async def job_stats():
+    """Background job runner counters and recent failures."""
+    return job_runner.stats()
+
+
 @router.api_route("/reset-db", methods=["GET", "POST"])
 async def reset_db():
     """
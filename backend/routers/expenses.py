@@ -1,13 +1,16 @@
 """
-Expense and financial summary endpoints.
+Expense and financial summary endpoints, plus serving of the stored documents.
 """
 
+import mimetypes
 import os
-from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form  # type: ignore
+from fastapi import APIRouter, HTTPException, Query, Request, Response, UploadFile, File, Form  # type: ignore
+from fastapi.responses import FileResponse  # type: ignore
 from supabase_client import supabase  # type: ignore
-from helpers import log_movement, UPLOAD_DIR, get_category_id  # type: ignore
+from helpers import get_category_id, raw_response, record_transaction  # type: ignore
+from storage import document_storage, is_content_addressed, THUMBNAIL_SIZES  # type: ignore
+from cache import response_cache, DASHBOARD  # type: ignore
 
 router = APIRouter()
 
@@ -66,9 +69,10 @@ async def list_expenses(month: int, year: int):
         .gte("date", month_start)
         .lt("date", month_end)
         .order("date", desc=True)
+        .raw()
         .execute()
     )
-    return res.data if res else []
+    return raw_response(res)
 
 
 @router.post("/expenses/upload")
@@ -78,23 +82,17 @@ async def upload_expense(
     date: str = Form(...),
     file: UploadFile = File(...),
 ):
-    """Upload an expense document (PDF or image)."""
+    """
+    Upload an expense document (PDF or image).
+    The file is streamed into the content-addressed document store.
+    """
     # Validate extension
     ext = os.path.splitext(file.filename or "")[1].lower()
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"File type not allowed: {ext}")
 
-    # Read and validate size
-    contents: bytes = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-
-    # Save file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
-    with open(filepath, "wb") as f:
-        f.write(contents)
+    # Stream to disk, rejecting oversized files early
+    filename, digest, already_stored = await document_storage.save(file, ext, MAX_FILE_SIZE)
 
     # Record in database
     doc_res = await supabase.table("expense_documents").insert({
@@ -105,20 +103,85 @@ async def upload_expense(
         "file_type": ext.lstrip("."),
     }).execute()
 
-    # Create expense transaction
+    # Expense transaction and its movement are written by a background job
     expense_cat_id = await get_category_id("Gastos Fijos")
-    tx_res = await supabase.table("transactions").insert({
-        "amount": amount,
-        "description": description,
-        "type": "EXPENSE",
-        "category_id": expense_cat_id,
-    }).execute()
+    await record_transaction(
+        {
+            "amount": amount,
+            "description": description,
+            "type": "EXPENSE",
+            "category_id": expense_cat_id,
+        },
+        movement={
+            "category": "FINANZAS",
+            "action": "GASTO",
+            "description": f"Gasto registrado: {description} — ${amount:,.2f}",
+            "metadata": {"amount": amount, "file": filename, "original_name": file.filename, "sha256": digest},
+        },
+    )
+
+    response_cache.invalidate(DASHBOARD)
+    return {
+        "status": "ok",
+        "document": doc_res.data[0] if doc_res and doc_res.data else {},
+        "duplicate_file": already_stored,
+    }
 
-    await log_movement(
-        "FINANZAS", "GASTO",
-        f"Gasto registrado: {description} — ${amount:,.2f}",
-        metadata={"amount": amount, "file": filename},
-        transaction_id=tx_res.data[0]["id"] if tx_res and tx_res.data else None,
+
+# ─── DOCUMENT FILES ───────────────────────────────────────────────────────────
+
+async def _document_key(expense_id: int) -> str:
+    res = await (
+        supabase.table("expense_documents")
+        .select("id, file_path")
+        .eq("id", expense_id)
+        .single()
+        .execute()
+    )
+    if not res or not res.data or not res.data.get("file_path"):
+        raise HTTPException(status_code=404, detail="Expense document not found")
+    return res.data["file_path"].removeprefix("uploads/")
+
+
+def _file_response(request: Request, path: str, key: str, filename: str | None = None) -> Response:
+    """
+    Serve a stored file (FileResponse handles Range requests). Content-addressed
+    files never change, so their hash is a strong ETag and they cache forever.
+    """
+    headers = {}
+    if is_content_addressed(key):
+        etag = f'"{os.path.splitext(os.path.basename(key))[0]}"'
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers={"ETag": etag})
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    return FileResponse(
+        path,
+        media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        headers=headers,
+        filename=filename,
+        content_disposition_type="inline",
     )
 
-    return {"status": "ok", "document": doc_res.data[0] if doc_res and doc_res.data else {}}
+
+@router.get("/expenses/{expense_id}/file")
+async def get_expense_file(expense_id: int, request: Request):
+    """Download the original document of an expense (supports Range and If-None-Match)."""
+    key = await _document_key(expense_id)
+    path = document_storage.local_path(key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return _file_response(request, path, key, filename=os.path.basename(key))
+
+
+@router.get("/expenses/{expense_id}/thumbnail")
+async def get_expense_thumbnail(expense_id: int, request: Request, size: int = Query(256)):
+    """
+    Small JPEG preview of an image receipt for the expenses list, generated
+    on first request and cached. Sizes snap up to one of THUMBNAIL_SIZES.
+    """
+    size = next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+    key = await _document_key(expense_id)
+    path = await document_storage.thumbnail(key, size)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No thumbnail for this document")
+    return _file_response(request, path, key)
@@ -1,7 +1,9 @@
-"""Health check endpoints."""
+"""Health check and metrics endpoints."""
 
 from fastapi import APIRouter  # type: ignore
+from fastapi.responses import PlainTextResponse  # type: ignore
 from supabase_client import supabase  # type: ignore
+from tracing import metrics  # type: ignore
 
 router = APIRouter()
 
@@ -24,3 +26,9 @@ async def health_check():
         "status": "healthy",
         "database": db_status,
     }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """Request latency and upstream query histograms in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
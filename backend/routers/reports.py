@@ -1,56 +1,133 @@
 """
-Report generation endpoints — PDF accounting reports.
+Report generation endpoints — PDF accounting reports and chart series.
 """
 
-import io
-from fastapi import APIRouter  # type: ignore
-from fastapi.responses import StreamingResponse  # type: ignore
-from reportlab.lib.pagesizes import A4  # type: ignore
-from reportlab.lib.units import mm  # type: ignore
-from reportlab.pdfgen import canvas  # type: ignore
+import heapq
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from fastapi import APIRouter, HTTPException, Query  # type: ignore
+from fastapi.responses import FileResponse  # type: ignore
+from starlette.background import BackgroundTask  # type: ignore
 
 from supabase_client import supabase  # type: ignore
+from rollups import rollups, GRANULARITIES  # type: ignore
+from catalog import catalog  # type: ignore
+from rows import Transaction  # type: ignore
+from rendering import render_pool, render_accounting_report, ReportRow  # type: ignore
 
 router = APIRouter()
 
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "novamanager_reports"))
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "1000"))
+REPORT_KEEP_VERSIONS = int(os.getenv("REPORT_KEEP_VERSIONS", "3"))
+REPORT_PRUNE_GRACE = float(os.getenv("REPORT_PRUNE_GRACE", "300"))  # Seconds a served file is left alone
+
+GRANULARITY = Query("day", pattern=f"^({'|'.join(GRANULARITIES)})$")
+
+
+def _date_range(start: date | None, end: date | None) -> tuple[str, str]:
+    """Inclusive ISO range; defaults to the last 365 days."""
+    end = end or date.today()
+    start = start or end - timedelta(days=364)
+    return start.isoformat(), end.isoformat()
+
+
+# ─── SERIES (served from rollups) ─────────────────────────────────────────────
+
+@router.get("/reports/series")
+async def report_series(
+    start: date | None = None,
+    end: date | None = None,
+    granularity: str = GRANULARITY,
+    category_id: int | None = None,
+):
+    """Income, expense and net per day / week / month, from the daily rollups."""
+    start_day, end_day = _date_range(start, end)
+    store = await rollups.view(start_day, end_day, sales=False)
+    return store.series(start_day, end_day, granularity=granularity, category_id=category_id)
+
+
+@router.get("/reports/products/{item_id}/series")
+async def product_series(
+    item_id: int,
+    start: date | None = None,
+    end: date | None = None,
+    granularity: str = GRANULARITY,
+):
+    """Units and revenue of one product per day / week / month."""
+    start_day, end_day = _date_range(start, end)
+    store = await rollups.view(start_day, end_day)
+    return store.product_series(item_id, start_day, end_day, granularity=granularity)
+
+
+@router.get("/reports/top-products")
+async def top_products(
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = Query(20, ge=1, le=500),
+    sort: str = Query("units", pattern="^(units|revenue|margin)$"),
+):
+    """
+    Best sellers over a date range (default: last 30 days) with velocity.
+
+    Units and revenue come from the per-SKU rollups; margin uses the current
+    `unit_cost` and days of stock divides the current quantity by the
+    average units sold per day in the range.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    store = await rollups.view(start.isoformat(), end.isoformat())
+    await catalog.ensure_loaded()
+
+    totals = store.sku_totals(start.isoformat(), end.isoformat())
+    elapsed_days = max((min(end, date.today()) - start).days + 1, 1)
+
+    rows = []
+    for item_id, (units, revenue) in totals.items():
+        item = catalog.get(item_id) or {}
+        cost = units * (item.get("unit_cost") or 0)
+        daily_units = units / elapsed_days
+        quantity = item.get("quantity")
+        rows.append({
+            "item_id": item_id,
+            "name": item.get("name"),
+            "brand": item.get("brand"),
+            "units": units,
+            "revenue": round(revenue, 2),
+            "cost": round(cost, 2),
+            "margin": round(revenue - cost, 2),
+            "margin_pct": round((revenue - cost) / revenue * 100, 1) if revenue else None,
+            "daily_units": round(daily_units, 3),
+            "quantity": quantity,
+            "days_of_stock": round(quantity / daily_units, 1) if quantity is not None and daily_units > 0 else None,
+        })
+
+    return heapq.nlargest(limit, rows, key=lambda r: (r[sort], -r["item_id"]))
+
+
+# ─── ACCOUNTING PDF ───────────────────────────────────────────────────────────
+
 
 @router.get("/reports/accounting/pdf")
 async def accounting_report_pdf(month: int, year: int):
     """
     Generate a PDF accounting report for a given month.
     Summarizes income, expenses, and net balance.
+
+    The PDF is cached on disk keyed by (year, month, data version), where
+    the version comes from one single-row query (_report_version). Only a
+    miss pages the rows from Supabase into compact tuples and renders them
+    on the render pool. An unchanged month, e.g. any closed past month, is
+    never fetched or rendered twice.
     """
     month_start = f"{year}-{month:02d}-01"
     next_month = month + 1 if month < 12 else 1
     next_year = year if month < 12 else year + 1
     month_end = f"{next_year}-{next_month:02d}-01"
 
-    # Fetch transactions for the month
-    income_res = await (
-        supabase.table("transactions")
-        .select("*")
-        .eq("type", "INCOME")
-        .gte("date", month_start)
-        .lt("date", month_end)
-        .order("date")
-        .execute()
-    )
-    expense_res = await (
-        supabase.table("transactions")
-        .select("*")
-        .eq("type", "EXPENSE")
-        .gte("date", month_start)
-        .lt("date", month_end)
-        .order("date")
-        .execute()
-    )
-
-    incomes = income_res.data if income_res else []
-    expenses = expense_res.data if expense_res else []
-    total_income = sum(t["amount"] for t in incomes)
-    total_expense = sum(t["amount"] for t in expenses)
-    net_balance = total_income - total_expense
-
     # Month name in Spanish
     months_es = [
         "", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
@@ -58,78 +135,96 @@ async def accounting_report_pdf(month: int, year: int):
     ]
     month_name = months_es[month] if 1 <= month <= 12 else str(month)
 
-    # Build PDF
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Header
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(30 * mm, height - 25 * mm, "ESTADO DE CUENTA")
-    c.setFont("Helvetica", 11)
-    c.drawString(30 * mm, height - 33 * mm, "Centro de Abaratamiento Mayorista")
-    c.drawString(30 * mm, height - 40 * mm, f"Período: {month_name} {year}")
-
-    y = height - 55 * mm
-
-    # ── Income Section ────
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(30 * mm, y, "INGRESOS")
-    y -= 8 * mm
-    c.setFont("Helvetica", 9)
-
-    for tx in incomes:
-        date_str = tx.get("date", "-")[:10]
-        c.drawString(30 * mm, y, date_str)
-        c.drawString(55 * mm, y, (tx.get("description", "-"))[:55])
-        c.drawRightString(175 * mm, y, f"$ {tx['amount']:,.2f}")
-        y -= 5 * mm
-        if y < 30 * mm:
-            c.showPage()
-            y = height - 25 * mm
-
-    c.setFont("Helvetica-Bold", 10)
-    y -= 3 * mm
-    c.line(30 * mm, y + 2, 175 * mm, y + 2)
-    c.drawString(55 * mm, y - 3 * mm, "Total Ingresos:")
-    c.drawRightString(175 * mm, y - 3 * mm, f"$ {total_income:,.2f}")
-    y -= 15 * mm
-
-    # ── Expense Section ────
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(30 * mm, y, "EGRESOS")
-    y -= 8 * mm
-    c.setFont("Helvetica", 9)
-
-    for tx in expenses:
-        date_str = tx.get("date", "-")[:10]
-        c.drawString(30 * mm, y, date_str)
-        c.drawString(55 * mm, y, (tx.get("description", "-"))[:55])
-        c.drawRightString(175 * mm, y, f"$ {tx['amount']:,.2f}")
-        y -= 5 * mm
-        if y < 30 * mm:
-            c.showPage()
-            y = height - 25 * mm
-
-    c.setFont("Helvetica-Bold", 10)
-    y -= 3 * mm
-    c.line(30 * mm, y + 2, 175 * mm, y + 2)
-    c.drawString(55 * mm, y - 3 * mm, "Total Egresos:")
-    c.drawRightString(175 * mm, y - 3 * mm, f"$ {total_expense:,.2f}")
-    y -= 20 * mm
-
-    # ── Balance ────
-    c.setFont("Helvetica-Bold", 14)
-    c.line(30 * mm, y + 5, 175 * mm, y + 5)
-    c.drawString(55 * mm, y - 5 * mm, "BALANCE NETO:")
-    c.drawRightString(175 * mm, y - 5 * mm, f"$ {net_balance:,.2f}")
-
-    c.save()
-    buffer.seek(0)
+    version = await _report_version(month_start, month_end)
+    prefix = f"accounting_{year}_{month:02d}_"
+    path = os.path.join(REPORT_CACHE_DIR, f"{prefix}{version}.pdf")
+    prune = None
+    try:
+        os.utime(path)  # Cached: mark it in use, so pruning leaves it alone while it streams
+    except FileNotFoundError:  # Never rendered, or pruned meanwhile
+        incomes = await _report_rows("INCOME", month_start, month_end)
+        expenses = await _report_rows("EXPENSE", month_start, month_end)
+        os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+        await render_pool.run(render_accounting_report, path, f"{month_name} {year}", incomes, expenses)
+        prune = BackgroundTask(_prune_report_versions, prefix)
 
     filename = f"Estado_Cuenta_{month_name}_{year}.pdf"
-    return StreamingResponse(
-        buffer,
+    return FileResponse(
+        path,
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
+        background=prune,
+    )
+
+
+async def _report_version(month_start: str, month_end: str) -> str:
+    """
+    Data version of the month's report: how many income and expense rows
+    it has and the newest id, from ONE request returning a single row. The
+    app only appends transactions (and deletes only ones it just inserted),
+    so every change it makes moves one of the two.
+    """
+    res = await (
+        supabase.table("transactions")
+        .select("id")
+        .in_("type", ["INCOME", "EXPENSE"])
+        .gte("date", month_start)
+        .lt("date", month_end)
+        .order("id", desc=True)
+        .limit(1)
+        .count()
+        .execute()
     )
+    if not res:
+        raise HTTPException(status_code=502, detail=f"Could not read transactions: {res.error}")
+    newest = max((row["id"] for row in res.data), default=0)
+    return f"{res.count or 0}_{newest}"
+
+
+async def _report_rows(tx_type: str, month_start: str, month_end: str) -> list[ReportRow]:
+    """One type's transactions for the month, fetched page by page as (date, description, amount)."""
+    rows: list[ReportRow] = []
+    offset = 0
+    while True:
+        res = await (
+            supabase.table("transactions")
+            .select("id, date, description, amount")
+            .eq("type", tx_type)
+            .gte("date", month_start)
+            .lt("date", month_end)
+            .order("id")
+            .range(offset, offset + REPORT_PAGE_SIZE - 1)
+            .execute()
+        )
+        page = res.data if res else []
+        rows.extend(
+            ((tx.date or "-")[:10], (tx.description or "-")[:55], tx.amount)
+            for tx in map(Transaction.from_row, page)
+        )
+        if len(page) < REPORT_PAGE_SIZE:
+            return rows
+        offset += REPORT_PAGE_SIZE
+
+
+def _prune_report_versions(prefix: str):
+    """
+    Drop older renders of the same month, after the response is sent. The
+    newest REPORT_KEEP_VERSIONS stay, and so does any file served in the
+    last REPORT_PRUNE_GRACE seconds: a request may still be streaming it.
+    """
+    versions = []
+    for name in os.listdir(REPORT_CACHE_DIR):
+        if name.startswith(prefix) and name.endswith(".pdf"):
+            path = os.path.join(REPORT_CACHE_DIR, name)
+            try:
+                versions.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+    versions.sort(reverse=True)
+    cutoff = time.time() - REPORT_PRUNE_GRACE
+    for mtime, path in versions[REPORT_KEEP_VERSIONS:]:
+        if mtime < cutoff:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -2,24 +2,36 @@
 Sales, transactions, and dashboard endpoints.
 
 Includes batch sale processing with atomic stock deduction (race condition fix),
-invoice PDF generation, and dashboard statistics.
+cached invoice PDF generation, and dashboard statistics.
 """
 
-import io
+import os
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Query  # type: ignore
-from fastapi.responses import StreamingResponse  # type: ignore
-from reportlab.lib.pagesizes import A4  # type: ignore
-from reportlab.lib.units import mm  # type: ignore
-from reportlab.pdfgen import canvas  # type: ignore
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response  # type: ignore
 
 from supabase_client import supabase  # type: ignore
-from helpers import get_category_id, log_movement  # type: ignore
+from helpers import (  # type: ignore
+    get_category_id, log_movement, raw_response,
+    movement_events, publish_movements, fetch_movements_since,
+)
+from events import format_sse, parse_last_event_id, sse_response  # type: ignore
+from cache import response_cache, LRUCache, CATALOG, DASHBOARD  # type: ignore
+from idempotency import idempotency, REPLAY_HEADER  # type: ignore
+from rollups import rollups  # type: ignore
+from rendering import render_pool, render_invoice  # type: ignore
+from rows import SaleLine, StockItem, StockItemFormat  # type: ignore
+from stock_writes import StockConflict, StockNotFound, StockWriteError, adjust_stock, read_stock_item, restore_stock  # type: ignore
 import schemas  # type: ignore
 
 router = APIRouter()
 
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+INVOICE_CACHE_SIZE = int(os.getenv("INVOICE_CACHE_SIZE", "256"))
+
+# Rendered invoice PDFs by transaction id
+invoice_cache = LRUCache(max_entries=INVOICE_CACHE_SIZE)
+
 
 # ─── TRANSACTIONS ─────────────────────────────────────────────────────────────
 
@@ -32,12 +44,14 @@ async def create_transaction(tx: schemas.TransactionCreate):
         raise HTTPException(status_code=400, detail="Failed to create transaction")
 
     created = res.data[0]
+    rollups.record_transactions(res.data)
     await log_movement(
         "FINANZAS", "TRANSACCION",
         f"Transacción {created['type']}: ${created['amount']}",
         metadata={"amount": created["amount"], "type": created["type"]},
         transaction_id=created["id"],
     )
+    response_cache.invalidate(DASHBOARD)
     return created
 
 
@@ -49,29 +63,73 @@ async def read_transactions(skip: int = 0, limit: int = 50):
         .select("*")
         .order("date", desc=True)
         .range(skip, skip + limit - 1)
+        .raw()
         .execute()
     )
-    return res.data if res else []
+    return raw_response(res)
 
 
 @router.get("/movements")
-async def read_movements(limit: int = 100):
-    """List audit log movements."""
+async def read_movements(limit: int = 100, since: int | None = None):
+    """
+    List audit log movements.
+    `since` is a movement id cursor: only newer movements are returned.
+    """
+    query = supabase.table("app_movements").select("*")
+    if since is not None:
+        query = query.gt("id", since)
     res = await (
-        supabase.table("app_movements")
-        .select("*")
+        query
         .order("created_at", desc=True)
         .limit(limit)
+        .raw()
         .execute()
     )
-    return res.data if res else []
+    return raw_response(res)
+
+
+@router.get("/movements/stream")
+async def stream_movements(
+    since: int | None = None,
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events feed of new movements, replacing /movements polling.
+
+    Resumes after `Last-Event-ID` (sent by EventSource on reconnect) from
+    the in-memory ring buffer. The first connect after loading /movements
+    passes the `since` row id instead, and so does a reconnect the buffer
+    cannot cover (e.g. after a restart): the rows after it are sent from
+    the database (clients drop rows they already have, by row id).
+    """
+    resume_from = parse_last_event_id(last_event_id)
+
+    async def stream():
+        start_id = resume_from
+        if start_id is None or movement_events.since(start_id) is None:
+            start_id = movement_events.last_id  # Live events after the backfill come from the buffer
+            if resume_from is not None or since is not None:
+                for row in await fetch_movements_since(since):
+                    yield format_sse(start_id, "movement", row)
+        async for frame in movement_events.stream(start_id):
+            yield frame
+
+    return sse_response(stream())
 
 
 # ─── DASHBOARD ────────────────────────────────────────────────────────────────
 
 @router.get("/dashboard-stats")
-async def dashboard_stats():
-    """Get current month income, expenses, balance, and recent sales."""
+async def dashboard_stats(request: Request):
+    """
+    Get current month income, expenses, balance, and recent sales.
+    Cached (precompressed) for DASHBOARD_CACHE_TTL seconds between writes.
+    """
+    accept_encoding = request.headers.get("accept-encoding", "")
+    cached = response_cache.get(DASHBOARD)
+    if cached is not None:
+        return cached.response(accept_encoding)
+
     now = datetime.now()
     month_start = f"{now.year}-{now.month:02d}-01"
     next_month = now.month + 1 if now.month < 12 else 1
@@ -110,107 +168,106 @@ async def dashboard_stats():
         .execute()
     )
 
-    return {
+    stats = {
         "total_income": total_income,
         "total_expense": total_expense,
         "net_balance": total_income - total_expense,
         "recent_sales": recent_res.data if recent_res else [],
     }
+    return response_cache.set(DASHBOARD, stats, DASHBOARD_CACHE_TTL).response(accept_encoding)
 
 
 # ─── BATCH SALE (POS) ────────────────────────────────────────────────────────
 
 @router.post("/sales")
-async def create_batch_sale(batch: schemas.BatchSaleRequest):
+async def create_batch_sale(
+    batch: schemas.BatchSaleRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+):
     """
     Process a batch sale from the POS (cart checkout).
 
-    RACE CONDITION FIX: Each item is validated and deducted ATOMICALLY
-    in a single loop. If any item fails validation, all previously
-    deducted items are rolled back.
+    Honors the Idempotency-Key header: a retried checkout returns the
+    stored result of the first attempt instead of deducting stock twice.
+    """
+    result, replayed = await idempotency.run(
+        idempotency_key, "sales", batch, lambda: _process_batch_sale(batch)
+    )
+    if replayed:
+        response.headers[REPLAY_HEADER] = "true"
+    return result
+
+
+def _sale_line(product: StockItem, sale_item: schemas.BatchSaleItem, fmt: StockItemFormat | None) -> SaleLine:
+    """Price a cart line: units to deduct, description and total."""
+    if not sale_item.is_pack:
+        pack_size, unit_price = 1, product.selling_price
+    elif fmt is not None:
+        pack_size, unit_price = fmt.pack_size, fmt.pack_price
+    else:
+        pack_size = product.pack_size
+        unit_price = product.pack_price or product.selling_price * pack_size
+    description = product.label + (f" (Pack x{pack_size})" if sale_item.is_pack else "")
+    return SaleLine(
+        stock_item_id=product.id,
+        quantity=sale_item.quantity,
+        units=sale_item.quantity * pack_size,
+        description=description,
+        sale_price_total=unit_price * sale_item.quantity,
+    )
+
+
+def _require_stock(units: float):
+    """adjust_stock() check rejecting a deduction that would leave negative stock."""
+    def check(product: StockItem, new_qty: float):
+        if new_qty < 0:
+            raise ValueError(
+                f"Stock insuficiente para {product.label}: "
+                f"disponible={product.quantity}, requerido={units}"
+            )
+    return check
+
+
+async def _process_batch_sale(batch: schemas.BatchSaleRequest) -> dict:
+    """
+    RACE CONDITION FIX: Each item is validated and deducted in a single
+    loop with a compare-and-swap write (stock_writes.adjust_stock), so a
+    concurrent change makes us re-read and re-validate instead of
+    overwriting it. If any item fails, the units already deducted are
+    given back (as deltas, keeping concurrent sales intact).
     """
     if not batch.items:
         raise HTTPException(status_code=400, detail="No items in sale")
 
     sale_cat_id = await get_category_id("Venta de Bebidas")
     total_sale = 0
-    processed_items: list[dict] = []  # Track for rollback
-    sale_details: list[dict] = []
+    deducted: list[SaleLine] = []  # Lines whose stock is already deducted (for rollback)
 
     try:
         for sale_item in batch.items:
-            # Fetch current stock (fresh read per item for atomicity)
-            item_res = await (
-                supabase.table("stock_items")
-                .select("*")
-                .eq("id", sale_item.item_id)
-                .single()
-                .execute()
-            )
-            if not item_res or not item_res.data:
-                raise ValueError(f"Product ID {sale_item.item_id} not found")
-
-            product = item_res.data
+            # Fetch current stock (fresh read per item)
+            product = await read_stock_item(sale_item.item_id)
 
             # Calculate units to deduct
-            if sale_item.is_pack:
-                if sale_item.format_id:
-                    fmt_res = await (
-                        supabase.table("stock_item_formats")
-                        .select("*")
-                        .eq("id", sale_item.format_id)
-                        .single()
-                        .execute()
-                    )
-                    if not fmt_res or not fmt_res.data:
-                        raise ValueError(f"Format ID {sale_item.format_id} not found")
-                    pack_size = fmt_res.data["pack_size"]
-                    unit_price = fmt_res.data["pack_price"]
-                else:
-                    pack_size = product.get("pack_size", 1) or 1
-                    unit_price = product.get("pack_price") or (product["selling_price"] * pack_size)
-            else:
-                pack_size = 1
-                unit_price = product["selling_price"]
-
-            units_to_deduct = sale_item.quantity * pack_size
-
-            # ATOMIC VALIDATION: Check stock RIGHT BEFORE deducting
-            if product["quantity"] < units_to_deduct:
-                raise ValueError(
-                    f"Stock insuficiente para {product.get('brand', '')} {product['name']}: "
-                    f"disponible={product['quantity']}, requerido={units_to_deduct}"
+            fmt = None
+            if sale_item.is_pack and sale_item.format_id:
+                fmt_res = await (
+                    supabase.table("stock_item_formats")
+                    .select("*")
+                    .eq("id", sale_item.format_id)
+                    .single()
+                    .execute()
                 )
+                if not fmt_res or not fmt_res.data:
+                    raise ValueError(f"Format ID {sale_item.format_id} not found")
+                fmt = StockItemFormat.from_row(fmt_res.data)
+            line = _sale_line(product, sale_item, fmt)
 
-            # IMMEDIATE DEDUCTION (no separate validation pass)
-            new_qty = product["quantity"] - units_to_deduct
-            new_status = "DEPLETED" if new_qty == 0 else "AVAILABLE"
-
-            await (
-                supabase.table("stock_items")
-                .update({"quantity": new_qty, "status": new_status})
-                .eq("id", sale_item.item_id)
-                .execute()
-            )
-
-            # Track for potential rollback
-            processed_items.append({
-                "item_id": sale_item.item_id,
-                "units_deducted": units_to_deduct,
-                "original_qty": product["quantity"],
-            })
-
-            line_total = unit_price * sale_item.quantity
-            total_sale += line_total
-
-            sale_details.append({
-                "stock_item_id": sale_item.item_id,
-                "quantity": sale_item.quantity,
-                "description": f"{product.get('brand', '')} {product['name']}" + (f" (Pack x{pack_size})" if sale_item.is_pack else ""),
-                "sale_price_total": line_total,
-                "product_name": product["name"],
-                "product_brand": product.get("brand", ""),
-            })
+            # Validate and deduct in one conditional write (re-validated on conflict)
+            await adjust_stock(product.id, -line.units, item=product, check=_require_stock(line.units))
+            deducted.append(line)
+            total_sale += line.sale_price_total
 
         # All items deducted successfully — create transaction
         tx_res = await supabase.table("transactions").insert({
@@ -226,49 +283,301 @@ async def create_batch_sale(batch: schemas.BatchSaleRequest):
         tx_id = tx_res.data[0]["id"]
 
         # Create individual sale records
-        for detail in sale_details:
-            sale_record = {
-                "stock_item_id": detail["stock_item_id"],
-                "quantity": detail["quantity"],
-                "description": detail["description"],
-                "sale_price_total": detail["sale_price_total"],
-                "sale_tx_id": tx_id,
-            }
-            await supabase.table("sales").insert(sale_record).execute()
+        for line in deducted:
+            await supabase.table("sales").insert(line.to_row(tx_id)).execute()
+
+        rollups.record_transactions(tx_res.data)
+        rollups.record_sales(deducted, tx_res.data[0])
 
         await log_movement(
             "VENTA", "VENTA_LOTE",
-            f"Venta procesada: {len(sale_details)} productos — ${total_sale:,.2f}",
-            metadata={"transaction_id": tx_id, "items": len(sale_details), "total": total_sale},
+            f"Venta procesada: {len(deducted)} productos — ${total_sale:,.2f}",
+            metadata={"transaction_id": tx_id, "items": len(deducted), "total": total_sale},
             transaction_id=tx_id,
         )
 
+        response_cache.invalidate(CATALOG, DASHBOARD)
         return {"status": "ok", "transaction_id": tx_id, "total": total_sale}
 
-    except ValueError as ve:
-        # ROLLBACK: Restore stock for all already-processed items
-        for processed in processed_items:
+    except (ValueError, StockConflict, StockWriteError) as e:
+        # ROLLBACK: Give back the units already deducted
+        for line in deducted:
+            await restore_stock(line.stock_item_id, line.units)
+        response_cache.invalidate(CATALOG)
+
+        status = 400 if isinstance(e, ValueError) else 409 if isinstance(e, StockConflict) else 502
+        raise HTTPException(status_code=status, detail=str(e))
+
+
+# ─── OFFLINE QUEUE REPLAY (POS) ──────────────────────────────────────────────
+
+@router.post("/sales/offline-batch")
+async def create_offline_sales(batch: schemas.OfflineSaleBatchRequest):
+    """
+    Ingest carts the POS queued while offline.
+
+    Carts are deduplicated by client_id (within the batch and against
+    previous replays), validated in the order they were sold, deducted
+    with one conditional stock write per item and committed with one bulk
+    write per table. A cart that cannot be fulfilled is rejected as a whole; the
+    others still go through.
+    """
+    results: dict[str, dict] = {}
+    unique: list[schemas.OfflineSaleCart] = []
+    seen: set[str] = set()
+    for cart in batch.carts:
+        if cart.client_id in seen:
+            continue
+        seen.add(cart.client_id)
+        unique.append(cart)
+
+    # Carts already committed by an earlier replay; the rest are reserved
+    # so a concurrent replay of the same queue waits instead of committing twice
+    previous, claimed = await idempotency.claim_many([c.client_id for c in unique], "offline-sale")
+    try:
+        for client_id, outcome in previous.items():
+            results[client_id] = dict(outcome, status="duplicate")
+        pending = sorted((c for c in unique if c.client_id not in previous), key=lambda c: c.created_at)
+        await _process_offline_carts(pending, results)
+    finally:
+        idempotency.release_many(claimed, "offline-sale")
+
+    ordered = [dict(results[cid], client_id=cid) for cid in dict.fromkeys(c.client_id for c in batch.carts)]
+    return {
+        "accepted": sum(1 for r in ordered if r["status"] == "accepted"),
+        "rejected": sum(1 for r in ordered if r["status"] == "rejected"),
+        "duplicates": sum(1 for r in ordered if r["status"] == "duplicate"),
+        "results": ordered,
+    }
+
+
+OfflineCart = tuple[schemas.OfflineSaleCart, float, list[SaleLine], dict[int, float]]
+
+
+async def _process_offline_carts(pending: list[schemas.OfflineSaleCart], results: dict[str, dict]):
+    """Validate the carts in the order they were sold, then commit the ones that fit."""
+    # Load every referenced product and format in ONE query each
+    item_ids = list({line.item_id for cart in pending for line in cart.items})
+    format_ids = list({line.format_id for cart in pending for line in cart.items if line.is_pack and line.format_id})
+    items: dict[int, StockItem] = {}
+    formats: dict[int, StockItemFormat] = {}
+    if item_ids:
+        prod_res = await supabase.table("stock_items").select("*").in_("id", item_ids).execute()
+        items = {p["id"]: StockItem.from_row(p) for p in (prod_res.data if prod_res else [])}
+    if format_ids:
+        fmt_res = await supabase.table("stock_item_formats").select("*").in_("id", format_ids).execute()
+        formats = {f["id"]: StockItemFormat.from_row(f) for f in (fmt_res.data if fmt_res else [])}
+
+    # Pre-validate against an in-memory copy of the stock: carts that cannot
+    # fit are rejected without a write. The conditional writes re-check it.
+    available = {item_id: item.quantity for item_id, item in items.items()}
+    accepted: list[OfflineCart] = []
+    for cart in pending:
+        try:
+            if not cart.items:
+                raise ValueError("No items in sale")
+            deductions: dict[int, float] = {}
+            lines: list[SaleLine] = []
+            total = 0.0
+            for sale_item in cart.items:
+                product = items.get(sale_item.item_id)
+                if product is None:
+                    raise ValueError(f"Product ID {sale_item.item_id} not found")
+                fmt = None
+                if sale_item.is_pack and sale_item.format_id:
+                    fmt = formats.get(sale_item.format_id)
+                    if fmt is None:
+                        raise ValueError(f"Format ID {sale_item.format_id} not found")
+                line = _sale_line(product, sale_item, fmt)
+                deductions[product.id] = deductions.get(product.id, 0) + line.units
+                if available[product.id] < deductions[product.id]:
+                    raise ValueError(
+                        f"Stock insuficiente para {product.label}: "
+                        f"disponible={available[product.id]}, requerido={deductions[product.id]}"
+                    )
+                total += line.sale_price_total
+                lines.append(line)
+        except ValueError as ve:
+            results[cart.client_id] = {"status": "rejected", "detail": str(ve)}
+            continue
+
+        for item_id, units in deductions.items():
+            available[item_id] -= units
+        accepted.append((cart, total, lines, deductions))
+
+    # Units written so far per item: any error before the sales are recorded gives them back
+    deducted: dict[int, float] = {}
+    try:
+        accepted = await _deduct_offline_stock(accepted, items, results, deducted)
+        tx_rows = await _insert_offline_sales(accepted) if accepted else []
+    except StockWriteError as e:
+        await _restore_offline_stock(deducted)
+        raise HTTPException(status_code=502, detail=str(e))
+    except BaseException:
+        await _restore_offline_stock(deducted)
+        raise
+    finally:
+        response_cache.invalidate(CATALOG, DASHBOARD)
+    if accepted:
+        await _record_offline_sales(accepted, tx_rows, results)
+
+
+async def _deduct_offline_stock(
+    accepted: list[OfflineCart], items: dict[int, StockItem], results: dict[str, dict], deducted: dict[int, float]
+) -> list[OfflineCart]:
+    """
+    Deduct the units of every accepted cart with ONE compare-and-swap
+    write per item (stock_writes). When an item no longer covers the
+    total (sold meanwhile), the latest carts using it are rejected until
+    the rest fit; a missing or constantly conflicting item rejects every
+    cart using it. Units rejected carts already took from other items are
+    given back. `deducted` always holds the units written so far.
+    """
+    carts = list(accepted)
+    surplus: dict[int, float] = {}  # Units of rejected carts on items already deducted
+
+    def reject(entry: OfflineCart, detail: str):
+        carts.remove(entry)
+        results[entry[0].client_id] = {"status": "rejected", "detail": detail}
+        for item_id, units in entry[3].items():
+            if item_id in deducted:
+                surplus[item_id] = surplus.get(item_id, 0) + units
+
+    for item_id in dict.fromkeys(item_id for _, _, _, deductions in accepted for item_id in deductions):
+        row = items.get(item_id)  # Saves the first read; re-read after a failure
+        while using := [entry for entry in carts if item_id in entry[3]]:
+            units = sum(entry[3][item_id] for entry in using)
+            seen: list[StockItem] = []
+
+            def check(product: StockItem, new_qty: float):
+                seen.append(product)
+                if new_qty < 0:
+                    raise ValueError("Stock insuficiente")
+
             try:
-                await (
-                    supabase.table("stock_items")
-                    .update({
-                        "quantity": processed["original_qty"],
-                        "status": "AVAILABLE",
-                    })
-                    .eq("id", processed["item_id"])
-                    .execute()
-                )
-            except Exception:
-                pass  # Best effort rollback
+                await adjust_stock(item_id, -units, item=row, check=check)
+            except (ValueError, StockConflict) as e:
+                row = None
+                if isinstance(e, StockNotFound) or not isinstance(e, ValueError):
+                    for entry in using:
+                        reject(entry, str(e))
+                    continue
+                product = seen[-1]
+                while using and units > product.quantity:
+                    entry = using.pop()  # Latest sale first: earlier carts keep their stock
+                    units -= entry[3][item_id]
+                    reject(entry, (
+                        f"Stock insuficiente para {product.label}: "
+                        f"disponible={product.quantity}, requerido={entry[3][item_id]}"
+                    ))
+                continue
+            deducted[item_id] = units
+            break
+
+    for item_id, units in surplus.items():
+        await restore_stock(item_id, units)
+        deducted[item_id] -= units
+    return carts
+
+
+async def _restore_offline_stock(deducted: dict[int, float]):
+    """Give back the batch's deductions, one delta write per item (concurrent changes stay)."""
+    for item_id, units in deducted.items():
+        if units > 0:
+            await restore_stock(item_id, units)
+
+
+async def _insert_offline_sales(accepted: list[OfflineCart]) -> list[dict]:
+    """Write the deducted carts with one bulk request per table; returns the transactions."""
+    sale_cat_id = await get_category_id("Venta de Bebidas")
 
-        raise HTTPException(status_code=400, detail=str(ve))
+    # 1. One income transaction per cart, dated when the sale happened
+    tx_res = await supabase.table("transactions").insert([
+        {
+            "amount": total,
+            "description": cart.description or "Venta Offline Salón",
+            "type": "INCOME",
+            "category_id": sale_cat_id,
+            "date": cart.created_at.isoformat(),
+        }
+        for cart, total, _, _ in accepted
+    ]).execute()
+    if not tx_res or len(tx_res.data) != len(accepted):
+        raise HTTPException(status_code=502, detail="Failed to create transactions")
+
+    # 2. Sale lines for all carts at once
+    sale_rows = [
+        line.to_row(tx["id"])
+        for (_, _, lines, _), tx in zip(accepted, tx_res.data)
+        for line in lines
+    ]
+    sales_res = await supabase.table("sales").insert(sale_rows).execute()
+    if not sales_res:
+        # Nothing is recorded as accepted: undo the transactions (the caller restores the stock)
+        await supabase.table("transactions").delete().in_("id", [tx["id"] for tx in tx_res.data]).execute()
+        raise HTTPException(status_code=502, detail=f"Failed to record sale lines: {sales_res.error}")
+    return tx_res.data
+
+
+async def _record_offline_sales(accepted: list[OfflineCart], tx_rows: list[dict], results: dict[str, dict]):
+    """Rollups, audit movements and replay outcomes of the committed carts."""
+    movement_rows = []
+    outcomes = []
+    for (cart, total, lines, _), tx in zip(accepted, tx_rows):
+        rollups.record_sales(lines, tx)
+        movement_rows.append({
+            "category": "VENTA",
+            "action": "VENTA_OFFLINE",
+            "description": f"Venta offline: {len(lines)} productos — ${total:,.2f}",
+            "metadata": {
+                "transaction_id": tx["id"],
+                "client_id": cart.client_id,
+                "items": len(lines),
+                "total": total,
+                "sold_at": cart.created_at.isoformat(),
+            },
+            "transaction_id": tx["id"],
+        })
+        outcome = {"status": "accepted", "transaction_id": tx["id"], "total": total}
+        results[cart.client_id] = outcome
+        outcomes.append((cart.client_id, cart, outcome))
+
+    rollups.record_transactions(tx_rows)
+    try:
+        mov_res = await supabase.table("app_movements").insert(movement_rows).execute()
+        if mov_res and mov_res.data:
+            publish_movements(mov_res.data)
+    except Exception as e:
+        # Don't let logging failures break the main operation
+        print(f"[offline-batch] Warning: {e}")
+
+    await idempotency.remember_many(outcomes, "offline-sale")
 
 
 # ─── INVOICE PDF ──────────────────────────────────────────────────────────────
 
 @router.get("/sales/invoice/{transaction_id}")
 async def generate_invoice(transaction_id: int):
-    """Generate a PDF invoice for a completed sale transaction."""
+    """
+    Generate a PDF invoice for a completed sale transaction.
+
+    Invoices are immutable once the sale commits, so rendered PDFs are
+    cached by transaction id and reprints skip both queries and rendering.
+    Rendering runs on the render pool, off the event loop.
+    """
+    pdf = invoice_cache.get(transaction_id)
+    if pdf is None:
+        pdf = await _render_invoice(transaction_id)
+        invoice_cache.set(transaction_id, pdf)
+
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename=Factura_{transaction_id}.pdf"},
+    )
+
+
+async def _render_invoice(transaction_id: int) -> bytes:
     tx_res = await (
         supabase.table("transactions")
         .select("*")
@@ -304,56 +613,4 @@ async def generate_invoice(transaction_id: int):
             for p in prod_res.data:
                 product_names[p["id"]] = {"name": p["name"], "brand": p.get("brand", "")}
 
-    # Build PDF
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(30 * mm, height - 30 * mm, "FACTURA DE VENTA")
-    c.setFont("Helvetica", 10)
-    c.drawString(30 * mm, height - 38 * mm, f"Centro de Abaratamiento Mayorista")
-    c.drawString(30 * mm, height - 44 * mm, f"Transacción #{transaction_id}")
-    c.drawString(130 * mm, height - 44 * mm, f"Fecha: {tx.get('date', '-')}")
-
-    # Table header
-    y = height - 60 * mm
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(30 * mm, y, "Producto")
-    c.drawString(110 * mm, y, "Cant.")
-    c.drawString(135 * mm, y, "Subtotal")
-    c.line(30 * mm, y - 2, 175 * mm, y - 2)
-
-    # Items
-    y -= 8 * mm
-    c.setFont("Helvetica", 9)
-    for item in sale_items:
-        prod = product_names.get(item["stock_item_id"], {})
-        name: str = f"{prod.get('brand', '')} {prod.get('name', item.get('description', '?'))}".strip()
-        truncated_name = name[:50]  # type: ignore
-
-        c.drawString(30 * mm, y, truncated_name)
-        c.drawString(110 * mm, y, str(item["quantity"]))
-        c.drawString(135 * mm, y, f"$ {item['sale_price_total']:,.2f}")
-        y -= 6 * mm
-
-        if y < 30 * mm:
-            c.showPage()
-            y = height - 30 * mm
-
-    # Total
-    y -= 5 * mm
-    c.line(30 * mm, y, 175 * mm, y)
-    y -= 8 * mm
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(110 * mm, y, f"TOTAL:  $ {tx['amount']:,.2f}")
-
-    c.save()
-    buffer.seek(0)
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=Factura_{transaction_id}.pdf"},
-    )
+    return await render_pool.run(render_invoice, transaction_id, tx, sale_items, product_names)
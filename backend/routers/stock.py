@@ -5,28 +5,55 @@ Handles CRUD for stock items, batch additions, format management,
 brand fetching, and bulk price updates.
 """
 
-from fastapi import APIRouter, HTTPException  # type: ignore
+import math
+import os
+from datetime import date, timedelta
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response  # type: ignore
 from supabase_client import supabase  # type: ignore
-from helpers import get_category_id, log_movement  # type: ignore
+from helpers import get_category_id, log_movement, record_transaction  # type: ignore
+from cache import response_cache, CATALOG, DASHBOARD  # type: ignore
+from idempotency import idempotency, REPLAY_HEADER  # type: ignore
+from catalog import catalog, barcode_index, brand_index  # type: ignore
+from search_index import search_index  # type: ignore
+from alerts import alert_index, alert_events  # type: ignore
+from columns import catalog_columns  # type: ignore
+from rollups import rollups  # type: ignore
+from rows import StockItem, StockItemFormat  # type: ignore
+from stock_writes import StockConflict, StockNotFound, StockWriteError, adjust_stock  # type: ignore
+from events import format_sse, parse_last_event_id, sse_response  # type: ignore
 import schemas  # type: ignore
 
 router = APIRouter()
 
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+BULK_UPDATE_ID_CHUNK = 200  # Item ids per query when re-reading bulk-update targets
+
 
 # ─── READ ─────────────────────────────────────────────────────────────────────
 
 @router.get("/stock")
-async def read_stock():
-    """Get all stock items with their formats embedded."""
+async def read_stock(request: Request):
+    """
+    Get all stock items with their formats embedded.
+
+    Served from the response cache (stored precompressed) until a stock
+    write invalidates it or CATALOG_CACHE_TTL expires.
+    """
+    accept_encoding = request.headers.get("accept-encoding", "")
+    cached = response_cache.get(CATALOG)
+    if cached is not None:
+        return cached.response(accept_encoding)
+
     res = await supabase.table("stock_items").select("*").order("name").execute()
     items = res.data if res else []
 
     if not items:
         return items
 
-    # Batch-fetch all formats in ONE query instead of N+1
-    item_ids = [item["id"] for item in items]
-    fmt_res = await supabase.table("stock_item_formats").select("*").in_("stock_item_id", item_ids).execute()
+    # Batch-fetch all formats in ONE query instead of N+1 (unfiltered: every
+    # item is listed, and an id list would overflow the URL on large catalogs)
+    fmt_res = await supabase.table("stock_item_formats").select("*").execute()
     all_formats = fmt_res.data if fmt_res else []
 
     # Group formats by stock_item_id
@@ -39,17 +66,129 @@ async def read_stock():
     for item in items:
         item["formats"] = formats_by_item.get(item["id"], [])
 
-    return items
+    return response_cache.set(CATALOG, items, CATALOG_CACHE_TTL).response(accept_encoding)
+
+
+@router.get("/stock/barcode/{code}")
+async def lookup_barcode(code: str):
+    """
+    Find a stock item (with its formats) by barcode, for the POS scanner.
+    Answered from the in-process barcode index; no catalog download needed.
+    """
+    await catalog.ensure_loaded()
+    item = barcode_index.lookup(code)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Barcode not found")
+    return item
+
+
+@router.get("/stock/search")
+async def search_stock(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    """
+    Typeahead search by partial name or brand ("quilm 1l").
+    Ranked results from the in-memory trigram/prefix index.
+    """
+    await catalog.ensure_loaded()
+    return search_index.search(q, limit=limit)
+
+
+@router.get("/stock/alerts")
+async def read_stock_alerts():
+    """Items at or below their min_stock_alert, most urgent first."""
+    await catalog.ensure_loaded()
+    return alert_index.alerts()
+
+
+@router.get("/stock/alerts/stream")
+async def stream_stock_alerts(last_event_id: str | None = Header(None, alias="Last-Event-ID")):
+    """
+    Server-Sent Events feed of low-stock transitions (LOW / OK / REMOVED).
+    New connections first get a `snapshot` event with the current alerts;
+    reconnections with Last-Event-ID get the transitions they missed, or a
+    fresh snapshot when the buffer cannot cover the gap (e.g. after a restart).
+    """
+    await catalog.ensure_loaded()
+    resume_from = parse_last_event_id(last_event_id)
+
+    async def stream():
+        start_id = resume_from
+        if start_id is None or alert_events.since(start_id) is None:
+            # Transitions after the snapshot are replayed from the buffer
+            start_id = alert_events.last_id
+            yield format_sse(start_id, "snapshot", alert_index.alerts())
+        async for frame in alert_events.stream(start_id):
+            yield frame
+
+    return sse_response(stream())
+
+
+@router.get("/stock/reorder-suggestions")
+async def reorder_suggestions(
+    window_days: int = Query(28, ge=1, le=365),
+    lead_time_days: int = Query(7, ge=0, le=90),
+    cover_days: int = Query(14, ge=1, le=180),
+):
+    """
+    Replenishment draft for POST /stock/batch.
+
+    Daily demand is the moving average of units sold over the last
+    `window_days` (from the per-SKU rollups). An item is suggested when its
+    stock will not cover `lead_time_days + cover_days` of demand plus its
+    min_stock_alert; the order is rounded up to whole packs of `pack_size`.
+    """
+    await catalog.ensure_loaded()
+    today = date.today()
+    window_start = (today - timedelta(days=window_days - 1)).isoformat()
+    store = await rollups.view(window_start, today.isoformat())
+    sold = store.sku_totals(window_start, today.isoformat())
+    horizon = lead_time_days + cover_days
+
+    # Scan the quantity/threshold columns; only items to suggest are read as rows
+    suggestions = []
+    columns = catalog_columns
+    for item_id, quantity, min_stock_alert, pack_size in zip(
+        columns.id, columns.quantity, columns.min_stock_alert, columns.pack_size
+    ):
+        daily_demand = sold[item_id][0] / window_days if item_id in sold else 0.0
+        target = daily_demand * horizon + min_stock_alert
+        if quantity >= target:
+            continue
+        item = catalog.get(item_id)
+        packs = math.ceil((target - quantity) / pack_size)
+        days_left = quantity / daily_demand if daily_demand > 0 else None
+        suggestions.append({
+            # BatchStockItem fields
+            "item_id": item["id"],
+            "name": item["name"],
+            "brand": item.get("brand"),
+            "barcode": item.get("barcode"),
+            "is_pack": item.get("is_pack", False),
+            "pack_size": item.get("pack_size") or 1,
+            "quantity": packs,
+            "cost_amount": round(packs * pack_size * (item.get("unit_cost") or 0), 2),
+            "min_stock_alert": item.get("min_stock_alert") or 0,
+            # Why it was suggested (ignored by /stock/batch)
+            "current_quantity": item.get("quantity") or 0,
+            "daily_demand": round(daily_demand, 3),
+            "days_of_stock": round(days_left, 1) if days_left is not None else None,
+            "stockout_date": (today + timedelta(days=math.floor(days_left))).isoformat() if days_left is not None else None,
+        })
+
+    # Total order: column positions shift when a delete swaps the last row in
+    suggestions.sort(key=lambda s: (
+        s["days_of_stock"] if s["days_of_stock"] is not None else math.inf, s["name"], s["item_id"],
+    ))
+    return {"description": f"Reposición sugerida {today.isoformat()}", "items": suggestions}
 
 
 @router.get("/stock/brands")
-async def get_brands():
-    """Get distinct brand names from stock items."""
-    res = await supabase.table("stock_items").select("brand").execute()
-    if not res or not res.data:
-        return []
-    brands = sorted(set(item["brand"] for item in res.data if item.get("brand")))
-    return brands
+async def get_brands(prefix: str | None = None):
+    """
+    Get distinct brand names from stock items, served from the brand index.
+    `?prefix=` narrows the list for the brand autocomplete.
+    """
+    await catalog.ensure_loaded()
+    return brand_index.brands(prefix)
 
 
 # ─── CREATE ───────────────────────────────────────────────────────────────────
@@ -72,6 +211,8 @@ async def create_stock_item(item: schemas.StockItemCreate):
         raise HTTPException(status_code=400, detail=f"Insert failed: {res.error}")
 
     created = res.data[0]
+    catalog.upsert(created)
+    response_cache.invalidate(CATALOG)
     await log_movement(
         "STOCK", "ALTA",
         f"Producto creado: {created['name']}",
@@ -82,12 +223,26 @@ async def create_stock_item(item: schemas.StockItemCreate):
 
 
 @router.post("/stock/batch")
-async def create_stock_batch(batch: schemas.BatchStockRequest):
+async def create_stock_batch(
+    batch: schemas.BatchStockRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+):
     """
     Create or replenish multiple stock items in a single operation.
 
     Each item can be new (no item_id) or a replenishment (with item_id).
+    Honors the Idempotency-Key header so a retried load is not added twice.
     """
+    results, replayed = await idempotency.run(
+        idempotency_key, "stock-batch", batch, lambda: _process_stock_batch(batch)
+    )
+    if replayed:
+        response.headers[REPLAY_HEADER] = "true"
+    return results
+
+
+async def _process_stock_batch(batch: schemas.BatchStockRequest) -> list[dict]:
     results = []
     purchase_cat_id = await get_category_id("Compra de Mercadería")
 
@@ -99,35 +254,35 @@ async def create_stock_batch(batch: schemas.BatchStockRequest):
         unit_cost = cost / units if units > 0 else 0
 
         if d.get("item_id"):
-            # Replenishment — update existing item
-            existing_res = await supabase.table("stock_items").select("*").eq("id", d["item_id"]).single().execute()
-            if not existing_res or not existing_res.data:
-                results.append({"error": f"Item {d['item_id']} not found"})
-                continue
-
-            existing = existing_res.data
-            new_qty = existing["quantity"] + units
-
-            update_data = {"quantity": new_qty, "unit_cost": unit_cost, "status": "AVAILABLE"}
+            # Replenishment — add to the current quantity (compare-and-swap)
+            update_data = {"unit_cost": unit_cost}
             if d.get("selling_price"):
                 update_data["selling_price"] = d["selling_price"]
             if d.get("pack_price") is not None:
                 update_data["pack_price"] = d["pack_price"]
 
-            await supabase.table("stock_items").update(update_data).eq("id", d["item_id"]).execute()
+            try:
+                existing = await adjust_stock(d["item_id"], units, extra=update_data)
+            except StockNotFound:
+                results.append({"error": f"Item {d['item_id']} not found"})
+                continue
+            except (StockConflict, StockWriteError) as e:
+                results.append({"error": str(e)})
+                continue
+            new_qty = existing.quantity
 
             # Log expense transaction
             if cost > 0 and purchase_cat_id:
-                await supabase.table("transactions").insert({
+                await record_transaction({
                     "amount": cost,
-                    "description": f"Reposición: {existing['name']}",
+                    "description": f"Reposición: {existing.name}",
                     "type": "EXPENSE",
                     "category_id": purchase_cat_id,
-                }).execute()
+                })
 
             await log_movement(
                 "STOCK", "REPOSICION",
-                f"Reposición: {existing['name']} (+{units} unidades)",
+                f"Reposición: {existing.name} (+{units} unidades)",
                 metadata={"item_id": d["item_id"], "added": units, "new_total": new_qty},
                 stock_item_id=d["item_id"],
             )
@@ -152,15 +307,16 @@ async def create_stock_batch(batch: schemas.BatchStockRequest):
             insert_res = await supabase.table("stock_items").insert(new_item).execute()
             if insert_res and insert_res.data:
                 created = insert_res.data[0]
+                catalog.upsert(created)
 
                 # Log expense transaction
                 if cost > 0 and purchase_cat_id:
-                    await supabase.table("transactions").insert({
+                    await record_transaction({
                         "amount": cost,
                         "description": f"Compra: {created['name']}",
                         "type": "EXPENSE",
                         "category_id": purchase_cat_id,
-                    }).execute()
+                    })
 
                 await log_movement(
                     "STOCK", "ALTA",
@@ -172,6 +328,7 @@ async def create_stock_batch(batch: schemas.BatchStockRequest):
             else:
                 results.append({"error": f"Failed to insert {d.get('name', '?')}"})
 
+    response_cache.invalidate(CATALOG, DASHBOARD)
     return results
 
 
@@ -199,6 +356,9 @@ async def update_stock_item(item_id: int, item: schemas.StockItemUpdate):
     if not res:
         raise HTTPException(status_code=400, detail=f"Update failed: {res.error}")
 
+    if res.data:
+        catalog.upsert(res.data[0])
+    response_cache.invalidate(CATALOG)
     await log_movement(
         "STOCK", "EDICION",
         f"Producto actualizado (ID: {item_id})",
@@ -223,6 +383,8 @@ async def delete_stock_item(item_id: int):
     await supabase.table("stock_item_formats").delete().eq("stock_item_id", item_id).execute()
     # Delete item
     await supabase.table("stock_items").delete().eq("id", item_id).execute()
+    catalog.remove(item_id)
+    response_cache.invalidate(CATALOG)
 
     await log_movement(
         "STOCK", "BAJA",
@@ -238,41 +400,42 @@ async def delete_stock_item(item_id: int):
 @router.put("/stock/{item_id}/sell")
 async def sell_stock_item(item_id: int, sale: schemas.SellItem):
     """Quick sell: deduct stock and create an income transaction."""
-    item_res = await supabase.table("stock_items").select("*").eq("id", item_id).single().execute()
-    if not item_res or not item_res.data:
-        raise HTTPException(status_code=404, detail="Item not found")
+    def require_stock(row: StockItem, new_qty: float):
+        if new_qty < 0:
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
 
-    item = item_res.data
-    if item["quantity"] < sale.quantity:
-        raise HTTPException(status_code=400, detail="Stock insuficiente")
-
-    new_qty = item["quantity"] - sale.quantity
-    new_status = "DEPLETED" if new_qty == 0 else "AVAILABLE"
-
-    await supabase.table("stock_items").update({
-        "quantity": new_qty,
-        "status": new_status,
-    }).eq("id", item_id).execute()
+    try:
+        item = await adjust_stock(item_id, -sale.quantity, check=require_stock)
+    except StockNotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    except StockConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except StockWriteError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    new_qty = item.quantity
 
     # Create income transaction
-    total = sale.quantity * (sale.price or item["selling_price"] or 0)
+    total = sale.quantity * (sale.price or item.selling_price)
     sale_cat_id = await get_category_id("Venta de Bebidas")
 
     tx_res = await supabase.table("transactions").insert({
         "amount": total,
-        "description": f"Venta: {item['name']} x{sale.quantity}",
+        "description": f"Venta: {item.name} x{sale.quantity}",
         "type": "INCOME",
         "category_id": sale_cat_id,
     }).execute()
+    if tx_res and tx_res.data:
+        rollups.record_transactions(tx_res.data)
 
     await log_movement(
         "VENTA", "VENTA",
-        f"Venta rápida: {item['name']} x{sale.quantity}",
+        f"Venta rápida: {item.name} x{sale.quantity}",
         metadata={"item_id": item_id, "quantity": sale.quantity, "total": total},
         stock_item_id=item_id,
         transaction_id=tx_res.data[0]["id"] if tx_res and tx_res.data else None,
     )
 
+    response_cache.invalidate(CATALOG, DASHBOARD)
     return {"status": "sold", "remaining": new_qty}
 
 
@@ -284,6 +447,9 @@ async def create_format(fmt: schemas.FormatCreate):
     res = await supabase.table("stock_item_formats").insert(fmt.model_dump()).execute()
     if not res:
         raise HTTPException(status_code=400, detail=f"Failed: {res.error}")
+    if res.data:
+        catalog.add_format(res.data[0])
+    response_cache.invalidate(CATALOG)
     return res.data[0] if res.data else {}
 
 
@@ -291,6 +457,8 @@ async def create_format(fmt: schemas.FormatCreate):
 async def delete_format(format_id: int):
     """Delete a pack format."""
     await supabase.table("stock_item_formats").delete().eq("id", format_id).execute()
+    catalog.remove_format(format_id)
+    response_cache.invalidate(CATALOG)
     return {"status": "deleted", "id": format_id}
 
 
@@ -301,36 +469,47 @@ async def bulk_update_prices(request: schemas.BulkUpdateRequest):
     """
     Bulk update prices and costs by percentage for filtered items.
     Applies to both stock_items and their associated stock_item_formats.
-    """
-    query = supabase.table("stock_items").select("*")
-
-    if request.category_id:
-        query = query.eq("category_id", request.category_id)
-    if request.brand and request.brand.strip():
-        query = query.ilike("brand", f"%{request.brand}%")
-
-    items_res = await query.execute()
-    items = items_res.data if items_res else []
 
+    The filter runs over the columnar catalog view; only the matching rows
+    (and their formats) are re-read from Supabase, so the new prices are
+    computed from current values, not from the mirror. Rows that no longer
+    match (changed by another instance since the last load) are skipped.
+    """
+    await catalog.ensure_loaded()
+    category_id = request.category_id or None
+    brand = request.brand if request.brand and request.brand.strip() else None
+    columns = catalog_columns
+    item_ids = [columns.id[pos] for pos in columns.where(category_id, brand)]
+
+    items: list[dict] = []
+    all_formats: list[dict] = []
+    for i in range(0, len(item_ids), BULK_UPDATE_ID_CHUNK):
+        chunk = item_ids[i:i + BULK_UPDATE_ID_CHUNK]
+        items_res = await supabase.table("stock_items").select("*").in_("id", chunk).execute()
+        fmt_res = await supabase.table("stock_item_formats").select("*").in_("stock_item_id", chunk).execute()
+        items.extend(items_res.data if items_res else [])
+        all_formats.extend(fmt_res.data if fmt_res else [])
+
+    needle = brand.casefold() if brand else None
+    items = [
+        item for item in items
+        if (category_id is None or item.get("category_id") == category_id)
+        and (needle is None or needle in (item.get("brand") or "").casefold())
+    ]
     if not items:
         raise HTTPException(status_code=404, detail="No items match the filter")
 
     multiplier = 1 + (request.percentage / 100)
     updated_count = 0
 
-    # Batch-fetch all formats for these items (N+1 fix)
-    item_ids = [item["id"] for item in items]
-    fmt_res = await supabase.table("stock_item_formats").select("*").in_("stock_item_id", item_ids).execute()
-    all_formats = fmt_res.data if fmt_res else []
-
-    formats_by_item: dict[int, list] = {}
-    for fmt in all_formats:
-        formats_by_item.setdefault(fmt["stock_item_id"], []).append(fmt)
+    formats_by_item: dict[int, list[StockItemFormat]] = {}
+    for fmt in map(StockItemFormat.from_row, all_formats):
+        formats_by_item.setdefault(fmt.stock_item_id, []).append(fmt)
 
-    for item in items:
-        new_selling = round((item.get("selling_price") or 0) * multiplier, 2)
-        new_cost = round((item.get("unit_cost") or 0) * multiplier, 2)
-        new_pack_price = round((item.get("pack_price") or 0) * multiplier, 2) if item.get("pack_price") else None
+    for item in map(StockItem.from_row, items):
+        new_selling = round(item.selling_price * multiplier, 2)
+        new_cost = round(item.unit_cost * multiplier, 2)
+        new_pack_price = round(item.pack_price * multiplier, 2) if item.pack_price else None
 
         update_data = {
             "selling_price": new_selling,
@@ -339,16 +518,19 @@ async def bulk_update_prices(request: schemas.BulkUpdateRequest):
         if new_pack_price is not None:
             update_data["pack_price"] = new_pack_price
 
-        await supabase.table("stock_items").update(update_data).eq("id", item["id"]).execute()
+        await supabase.table("stock_items").update(update_data).eq("id", item.id).execute()
+        catalog.patch(item.id, update_data)
         updated_count += 1
 
         # Update formats for this item
-        for fmt in formats_by_item.get(item["id"], []):  # type: ignore
-            new_fmt_price = round((fmt.get("pack_price") or 0) * multiplier, 2)
+        for fmt in formats_by_item.get(item.id, []):
+            new_fmt_price = round(fmt.pack_price * multiplier, 2)
             await supabase.table("stock_item_formats").update(
                 {"pack_price": new_fmt_price}
-            ).eq("id", fmt["id"]).execute()
+            ).eq("id", fmt.id).execute()
+            catalog.patch_format(fmt.id, {"pack_price": new_fmt_price})
 
+    response_cache.invalidate(CATALOG)
     await log_movement(
         "STOCK", "ACTUALIZACION_MASIVA",
         f"Actualización masiva de precios: {request.percentage:+.1f}% a {updated_count} productos",
@@ -0,0 +1,104 @@
+"""
+Slotted row types for internal hot paths.
+
+Supabase rows arrive as dicts. Code that works through many of them
+(checkout, offline replay, reports) converts each row once with
+`from_row()` and then uses plain attribute access: no `.get()` chains
+with defaults repeated at every use, and a fixed-size slotted instance
+instead of a hash table per row. Only the columns those paths use are
+kept. The Pydantic models in schemas.py stay at the API boundary.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class StockItem:
+    id: int
+    name: str
+    brand: str
+    quantity: float
+    selling_price: float
+    unit_cost: float
+    pack_size: float
+    pack_price: float | None
+    is_pack: bool
+    category_id: int | None
+    status: str
+
+    @classmethod
+    def from_row(cls, row: dict) -> "StockItem":
+        get = row.get
+        return cls(
+            row["id"],
+            get("name") or "",
+            get("brand") or "",
+            get("quantity") or 0,
+            get("selling_price") or 0,
+            get("unit_cost") or 0,
+            get("pack_size") or 1,
+            get("pack_price"),
+            bool(get("is_pack")),
+            get("category_id"),
+            get("status") or "AVAILABLE",
+        )
+
+    @property
+    def label(self) -> str:
+        """"Brand Name", as printed on sale lines."""
+        return f"{self.brand} {self.name}"
+
+
+@dataclass(slots=True)
+class StockItemFormat:
+    id: int
+    stock_item_id: int
+    pack_size: float
+    pack_price: float
+
+    @classmethod
+    def from_row(cls, row: dict) -> "StockItemFormat":
+        return cls(row["id"], row["stock_item_id"], row.get("pack_size") or 1, row.get("pack_price") or 0)
+
+
+@dataclass(slots=True)
+class Transaction:
+    id: int
+    amount: float
+    type: str
+    description: str
+    date: str
+    category_id: int | None
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Transaction":
+        get = row.get
+        return cls(
+            row["id"],
+            get("amount") or 0,
+            get("type") or "",
+            get("description") or "",
+            get("date") or "",
+            get("category_id"),
+        )
+
+
+@dataclass(slots=True)
+class SaleLine:
+    """One priced cart line, before it is written to `sales`."""
+
+    stock_item_id: int
+    quantity: float
+    units: float  # Stock units deducted (quantity × pack size)
+    description: str
+    sale_price_total: float
+
+    def to_row(self, sale_tx_id: int) -> dict:
+        return {
+            "stock_item_id": self.stock_item_id,
+            "quantity": self.quantity,
+            "units": self.units,
+            "description": self.description,
+            "sale_price_total": self.sale_price_total,
+            "sale_tx_id": sale_tx_id,
+        }
@@ -131,11 +131,22 @@ class BatchSaleItem(BaseModel):
 
 class SellItem(BaseModel):
     quantity: float
+    price: Optional[float] = None # Precio unitario; por defecto selling_price
 
 class BatchSaleRequest(BaseModel):
     items: List[BatchSaleItem]
     description: str
 
+# --- OFFLINE POS QUEUE ---
+class OfflineSaleCart(BaseModel):
+    client_id: str # UUID generado por el POS al encolar la venta
+    created_at: datetime # Momento real de la venta (sin conexión)
+    items: List[BatchSaleItem]
+    description: Optional[str] = None
+
+class OfflineSaleBatchRequest(BaseModel):
+    carts: List[OfflineSaleCart]
+
 # --- EXPENSES (ARCA) ---
 class ExpenseDocumentBase(BaseModel):
     description: str
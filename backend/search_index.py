@@ -0,0 +1,171 @@
+"""
+Typeahead search over the catalog (name + brand).
+
+An inverted index from normalized tokens to item ids, plus two ways to
+reach tokens from a partial query word:
+  - a sorted vocabulary for prefix matches ("quilm" → "quilmes")
+  - a trigram → tokens map for typo tolerance ("quilmse" → "quilmes")
+
+Maintained incrementally from catalog changes; queries never touch
+Supabase.
+"""
+
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+
+from catalog import catalog, Catalog, CatalogIndex  # type: ignore
+
+# Scoring per query word: exact token > prefix > fuzzy (trigram similarity)
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+MIN_SIMILARITY = 0.35
+MAX_FUZZY_TOKENS = 50
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str | None) -> str:
+    """Lowercase and strip accents: "Cerveza Ñandú" → "cerveza nandu"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text: str | None) -> list[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex(CatalogIndex):
+    """Token / prefix / trigram index over stock item names and brands."""
+
+    def __init__(self, source: Catalog):
+        self._source = source
+        self.clear()
+
+    def clear(self):
+        self._postings: dict[str, set[int]] = defaultdict(set)
+        self._vocabulary: list[str] = []
+        self._trigram_tokens: dict[str, set[str]] = defaultdict(set)
+        self._sort_names: dict[int, str] = {}
+
+    @staticmethod
+    def _tokens_of(row: dict | None) -> set[str]:
+        if not row:
+            return set()
+        return set(tokenize(row.get("name"))) | set(tokenize(row.get("brand")))
+
+    def update(self, old: dict | None, new: dict | None):
+        if new is None:
+            self._sort_names.pop(old["id"], None)  # type: ignore
+        else:
+            self._sort_names[new["id"]] = normalize(new.get("name"))
+        old_tokens = self._tokens_of(old)
+        new_tokens = self._tokens_of(new)
+        if old_tokens == new_tokens:
+            return
+        for token in old_tokens - new_tokens:
+            self._remove_posting(token, old["id"])  # type: ignore
+        for token in new_tokens - old_tokens:
+            self._add_posting(token, new["id"])  # type: ignore
+
+    def _add_posting(self, token: str, item_id: int):
+        postings = self._postings[token]
+        if not postings:
+            bisect.insort(self._vocabulary, token)
+            for tri in trigrams(token):
+                self._trigram_tokens[tri].add(token)
+        postings.add(item_id)
+
+    def _remove_posting(self, token: str, item_id: int):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.discard(item_id)
+        if postings:
+            return
+        # Last item using this token: drop it from the vocabulary
+        del self._postings[token]
+        pos = bisect.bisect_left(self._vocabulary, token)
+        if pos < len(self._vocabulary) and self._vocabulary[pos] == token:
+            del self._vocabulary[pos]
+        for tri in trigrams(token):
+            tokens = self._trigram_tokens.get(tri)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._trigram_tokens[tri]
+
+    # ── Query ─────────────────────────────────────────────────────────────
+
+    def _candidate_tokens(self, word: str) -> dict[str, float]:
+        """Vocabulary tokens matching one query word, with their score."""
+        matches: dict[str, float] = {}
+
+        # Prefix range in the sorted vocabulary (includes the exact token)
+        start = bisect.bisect_left(self._vocabulary, word)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(word):
+                break
+            matches[token] = EXACT_SCORE if token == word else PREFIX_SCORE
+
+        # Typo tolerance only makes sense for words with some substance
+        if len(word) >= 3:
+            query_tris = trigrams(word)
+            shared: dict[str, int] = defaultdict(int)
+            for tri in query_tris:
+                for token in self._trigram_tokens.get(tri, ()):
+                    shared[token] += 1
+            best = sorted(shared.items(), key=lambda kv: kv[1], reverse=True)[:MAX_FUZZY_TOKENS]
+            for token, common in best:
+                if token in matches:
+                    continue
+                similarity = common / (len(query_tris) + len(trigrams(token)) - common)
+                if similarity >= MIN_SIMILARITY:
+                    matches[token] = PREFIX_SCORE * similarity
+
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        """
+        Rank items by how well they match every word of `query`.
+        An item must match all words; its score is the sum of each word's best match.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        scores: dict[int, float] | None = None
+        for word in words:
+            word_scores: dict[int, float] = {}
+            for token, score in self._candidate_tokens(word).items():
+                for item_id in self._postings.get(token, ()):
+                    if score > word_scores.get(item_id, 0.0):
+                        word_scores[item_id] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {item_id: s + word_scores[item_id] for item_id, s in scores.items() if item_id in word_scores}
+            if not scores:
+                return []
+
+        ranked = heapq.nsmallest(
+            limit,
+            scores.items(),  # type: ignore
+            key=lambda kv: (-kv[1], self._sort_names.get(kv[0], "")),
+        )
+        results = []
+        for item_id, score in ranked:
+            item = self._source.get(item_id)
+            if item is not None:
+                results.append(dict(item, score=round(score / len(words), 3)))
+        return results
+
+
+search_index: SearchIndex = catalog.register(SearchIndex(catalog))  # type: ignore
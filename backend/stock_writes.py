@@ -0,0 +1,104 @@
+"""
+Race-free changes to stock_items.quantity.
+
+PostgREST gives us no transactions, so a plain read → compute → write
+lets two concurrent sales both read 10 and both write 9. Every quantity
+change goes through adjust_stock() instead: the update is conditional on
+the quantity that was read (`id = x AND quantity = read`, a
+compare-and-swap). When another request got there first it matches no
+row; the item is re-read and the change recomputed after a short
+randomized backoff, up to STOCK_CAS_RETRIES times. Rollbacks apply the
+opposite delta the same way (with a larger retry budget) rather than
+restoring an absolute value.
+
+Conflicts and retries are counted in /metrics. An upstream error raises
+StockWriteError, so callers can give back what they already deducted.
+"""
+
+import asyncio
+import os
+import random
+from typing import Callable
+
+from supabase_client import supabase  # type: ignore
+from catalog import catalog  # type: ignore
+from tracing import metrics  # type: ignore
+from rows import StockItem  # type: ignore
+
+STOCK_CAS_RETRIES = int(os.getenv("STOCK_CAS_RETRIES", "25"))
+STOCK_CAS_BACKOFF = float(os.getenv("STOCK_CAS_BACKOFF", "0.002"))
+
+
+class StockNotFound(ValueError):
+    """The item does not exist (a ValueError, like other invalid cart lines)."""
+
+    def __init__(self, item_id: int):
+        super().__init__(f"Product ID {item_id} not found")
+        self.item_id = item_id
+
+
+class StockConflict(Exception):
+    """The item kept changing underneath us for STOCK_CAS_RETRIES attempts."""
+
+
+class StockWriteError(Exception):
+    """Supabase rejected the conditional update (not a conflict: nothing was written)."""
+
+
+async def read_stock_item(item_id: int) -> StockItem:
+    res = await supabase.table("stock_items").select("*").eq("id", item_id).single().execute()
+    if not res or not res.data:
+        raise StockNotFound(item_id)
+    return StockItem.from_row(res.data)
+
+
+async def adjust_stock(
+    item_id: int,
+    delta: float,
+    item: StockItem | None = None,
+    extra: dict | None = None,
+    check: Callable[[StockItem, float], None] | None = None,
+    attempts: int = STOCK_CAS_RETRIES,
+) -> StockItem:
+    """
+    Add `delta` units (negative to deduct) to an item and return the updated row.
+
+    `item` is a row the caller already read, saving the first read.
+    `check(row, new_quantity)` runs against the current row on every
+    attempt and may raise (e.g. insufficient stock) to abort. `extra`
+    columns are written along with the quantity.
+    """
+    for attempt in range(attempts):
+        if item is None:
+            item = await read_stock_item(item_id)
+        new_qty = item.quantity + delta
+        if check is not None:
+            check(item, new_qty)
+
+        values = {"quantity": new_qty, "status": "DEPLETED" if new_qty <= 0 else "AVAILABLE", **(extra or {})}
+        res = await (
+            supabase.table("stock_items")
+            .update(values)
+            .eq("id", item_id)
+            .eq("quantity", item.quantity)
+            .execute()
+        )
+        metrics.inc("stock_cas_writes_total")
+        if res and res.data:
+            catalog.patch(item_id, values)
+            return StockItem.from_row(res.data[0])
+        if not res:
+            raise StockWriteError(f"Stock update of item {item_id} failed: {res.error}")
+        metrics.inc("stock_cas_conflicts_total")
+        item = None  # Someone else changed it: re-read and recompute
+        await asyncio.sleep(random.uniform(0, STOCK_CAS_BACKOFF * (attempt + 1)))
+
+    raise StockConflict(f"Stock of item {item_id} changed concurrently {attempts} times, try again")
+
+
+async def restore_stock(item_id: int, units: float):
+    """Compensate an earlier deduction; never gives up quietly."""
+    try:
+        await adjust_stock(item_id, units, attempts=STOCK_CAS_RETRIES * 4)
+    except Exception as e:
+        print(f"[stock] Warning: could not give back {units} units to item {item_id}: {e}")
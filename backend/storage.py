@@ -0,0 +1,151 @@
+"""
+Content-addressed storage for expense documents.
+
+Files are stored once per SHA-256 under sharded directories
+(`ab/cd/abcd…ef.pdf`), so identical receipts share one copy, two uploads
+can never overwrite each other and no directory grows without bound.
+The key (the path relative to the store root) is what expense_documents
+records after the `uploads/` prefix.
+
+DocumentStorage is the interface the endpoints use; LocalFileStorage is
+the filesystem backend. Image thumbnails are generated lazily with
+Pillow (optional) and cached next to the originals.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+from fastapi import HTTPException, UploadFile  # type: ignore
+
+from helpers import UPLOAD_DIR  # type: ignore
+
+try:
+    from PIL import Image  # type: ignore
+except ImportError:  # Pillow is optional: no thumbnails without it
+    Image = None
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def is_content_addressed(key: str) -> bool:
+    """Keys written by this store end in their hex SHA-256 (legacy uploads do not)."""
+    stem = os.path.splitext(os.path.basename(key))[0]
+    return len(stem) == 64 and all(ch in "0123456789abcdef" for ch in stem)
+
+
+class DocumentStorage(ABC):
+    """Interface for expense document backends."""
+
+    @abstractmethod
+    async def save(self, file: UploadFile, ext: str, max_size: int) -> tuple[str, str, bool]:
+        """Store an upload. Returns (key, sha256, already_stored)."""
+
+    @abstractmethod
+    def local_path(self, key: str) -> str | None:
+        """Filesystem path of a stored document, or None if it is missing."""
+
+    @abstractmethod
+    async def thumbnail(self, key: str, size: int) -> str | None:
+        """Path of a cached JPEG thumbnail, or None if the document is not a readable image."""
+
+
+def _write_chunk(out, hasher, chunk: bytes):
+    out.write(chunk)
+    hasher.update(chunk)
+
+
+def _render_thumbnail(src: str, dst: str, size: int) -> bool:
+    """
+    Write the thumbnail to `dst`. False if `src` is corrupt, truncated, too
+    large to decode or not an image; the temp file never outlives the call.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, Image.open(src) as img:  # type: ignore
+            img.thumbnail((size, size))
+            img.convert("RGB").save(out, "JPEG", quality=80, optimize=True)
+        os.replace(tmp_path, dst)
+        return True
+    except Exception:  # OSError/UnidentifiedImageError, DecompressionBombError, ValueError from odd modes
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class LocalFileStorage(DocumentStorage):
+    """SHA-256 sharded directories under `root`, thumbnails under `root/.thumbs`."""
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self.thumb_root = os.path.join(self.root, ".thumbs")
+
+    @staticmethod
+    def key_for(digest: str, ext: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+    async def save(self, file: UploadFile, ext: str, max_size: int) -> tuple[str, str, bool]:
+        """
+        Chunks are hashed and written to a temp file in a worker thread, and
+        the upload is rejected as soon as it exceeds `max_size`. The temp
+        file is renamed into place atomically, or dropped if that content
+        is already stored.
+        """
+        too_large = HTTPException(status_code=400, detail=f"File too large (max {max_size // (1024 * 1024)}MB)")
+        if file.size is not None and file.size > max_size:
+            raise too_large
+
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise too_large
+                    await asyncio.to_thread(_write_chunk, out, hasher, chunk)
+
+            digest = hasher.hexdigest()
+            key = self.key_for(digest, ext)
+            final_path = os.path.join(self.root, key)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                return key, digest, True
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)  # Atomic: readers never see a partial file
+            return key, digest, False
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def local_path(self, key: str) -> str | None:
+        path = os.path.realpath(os.path.join(self.root, key))
+        # Keys come from the database: never resolve outside the store
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    async def thumbnail(self, key: str, size: int) -> str | None:
+        if Image is None or os.path.splitext(key)[1].lower() not in IMAGE_EXTENSIONS:
+            return None
+        src = self.local_path(key)
+        if src is None:
+            return None
+        name = os.path.splitext(key)[0].replace("/", "_")
+        dst = os.path.join(self.thumb_root, f"{name}_{size}.jpg")
+        if not os.path.exists(dst):
+            os.makedirs(self.thumb_root, exist_ok=True)
+            if not await asyncio.to_thread(_render_thumbnail, src, dst, size):
+                return None
+        return dst
+
+
+document_storage: DocumentStorage = LocalFileStorage(UPLOAD_DIR)
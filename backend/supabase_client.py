@@ -6,10 +6,13 @@ upsert, delete) with consistent filter chaining.
 """
 
 import os
+import time
 from typing import Any, Optional
 import httpx  # type: ignore
 from dotenv import load_dotenv  # type: ignore
 
+from tracing import query_shape, record_query  # type: ignore
+
 load_dotenv()
 
 SUPABASE_URL = (
@@ -26,15 +29,30 @@ SUPABASE_KEY = (
 # ─── Response Wrapper ────────────────────────────────────────────────────────
 
 class SupabaseResponse:
-    """Wraps the httpx response into a convenient .data / .error interface."""
+    """
+    Wraps the httpx response into a convenient .data / .error interface.
+
+    In raw mode the successful body is NOT decoded: .content holds the
+    upstream bytes and .content_type its media type, ready to be handed
+    to a FastAPI Response untouched.
+    """
 
-    def __init__(self, response: httpx.Response):
+    def __init__(self, response: httpx.Response, raw: bool = False):
         self._response = response
         self.status_code = response.status_code
         self.data: list[Any] | dict[str, Any] | Any = []
         self.error: Optional[dict[str, Any]] = None
+        self.content: bytes = b""
+        self.content_type: str = response.headers.get("content-type", "application/json")
+        self.count: Optional[int] = None  # Total matching rows, for count() queries
 
         if 200 <= response.status_code < 300:
+            total = response.headers.get("content-range", "").rpartition("/")[2]
+            if total.isdigit():
+                self.count = int(total)
+            if raw:
+                self.content = response.content
+                return
             try:
                 self.data = response.json()
             except Exception:
@@ -54,8 +72,6 @@ class SupabaseResponse:
         return f"<SupabaseResponse status={self.status_code} data_count={len(self.data) if isinstance(self.data, list) else 1}>"
 
 
-# ─── Unified Query Builder ───────────────────────────────────────────────────
-
 # ─── Unified Query Builder ───────────────────────────────────────────────────
 
 class QueryBuilder:
@@ -65,6 +81,8 @@ class QueryBuilder:
 
     def __init__(self, supabase_instance, url: str, headers: dict, table_name: str):
         self._sb = supabase_instance
+        self._table = table_name
+        self._operation = "select"
         self._base_url = f"{url}/rest/v1/{table_name}"
         self._headers = dict(headers)
         self._params: dict[str, str] = {}
@@ -72,36 +90,43 @@ class QueryBuilder:
         self._body: Any = None
         self._is_single = False
         self._is_count = False
+        self._is_raw = False
 
     # ── Operation Setters ─────────────────────────────────────────────────
 
     def select(self, columns: str = "*"):
+        self._operation = "select"
         self._method = "GET"
         self._params["select"] = columns
         return self
 
     def insert(self, data):
+        self._operation = "insert"
         self._method = "POST"
         self._body = data
         self._headers["Prefer"] = "return=representation"
         return self
 
     def update(self, data: dict):
+        self._operation = "update"
         self._method = "PATCH"
         self._body = data
         self._headers["Prefer"] = "return=representation"
         return self
 
-    def upsert(self, data, on_conflict: str = ""):
+    def upsert(self, data, on_conflict: str = "", ignore_duplicates: bool = False):
+        self._operation = "upsert"
         self._method = "POST"
         self._body = data
-        prefer = "return=representation,resolution=merge-duplicates"
+        resolution = "ignore-duplicates" if ignore_duplicates else "merge-duplicates"
+        prefer = f"return=representation,resolution={resolution}"
         self._headers["Prefer"] = prefer
         if on_conflict:
             self._params["on_conflict"] = on_conflict
         return self
 
     def delete(self):
+        self._operation = "delete"
         self._method = "DELETE"
         self._headers["Prefer"] = "return=representation"
         return self
@@ -165,31 +190,63 @@ class QueryBuilder:
         self._headers["Range"] = f"{start}-{end}"
         return self
 
+    def count(self):
+        """Also report the total number of matching rows (ignoring limit/range) in .count."""
+        self._is_count = True
+        self._headers["Prefer"] = "count=exact"
+        return self
+
     def single(self):
         """Expect exactly one result. Response .data will be a dict instead of list."""
         self._is_single = True
         self._headers["Accept"] = "application/vnd.pgrst.object+json"
         return self
 
+    def raw(self):
+        """
+        Skip JSON decoding. Response .content will hold the upstream body bytes.
+        Meant for read-only endpoints that proxy the rows to the client as-is.
+        """
+        self._is_raw = True
+        return self
+
     # ── Execute ───────────────────────────────────────────────────────────
 
+    def shape(self) -> str:
+        """Table, operation and filter columns, without the values (see tracing)."""
+        filters = [
+            (col, value.split(".", 1)[0])
+            for col, value in self._params.items()
+            if col not in ("select", "order", "limit", "on_conflict")
+        ]
+        return query_shape(self._table, self._operation, filters, self._is_single)
+
     async def execute(self) -> SupabaseResponse:
         """Execute the built query and return a SupabaseResponse."""
         client = await self._sb.get_client()
         kwargs: dict = {"headers": self._headers, "params": self._params}
 
-        if self._method == "GET":
-            response = await client.get(self._base_url, **kwargs)
-        elif self._method == "POST":
-            response = await client.post(self._base_url, json=self._body, **kwargs)
-        elif self._method == "PATCH":
-            response = await client.patch(self._base_url, json=self._body, **kwargs)
-        elif self._method == "DELETE":
-            response = await client.delete(self._base_url, **kwargs)
-        else:
-            raise ValueError(f"Unsupported HTTP method: {self._method}")
-
-        return SupabaseResponse(response)
+        started = time.perf_counter()
+        try:
+            if self._method == "GET":
+                response = await client.get(self._base_url, **kwargs)
+            elif self._method == "POST":
+                response = await client.post(self._base_url, json=self._body, **kwargs)
+            elif self._method == "PATCH":
+                response = await client.patch(self._base_url, json=self._body, **kwargs)
+            elif self._method == "DELETE":
+                response = await client.delete(self._base_url, **kwargs)
+            else:
+                raise ValueError(f"Unsupported HTTP method: {self._method}")
+        except Exception:
+            record_query(self._table, self._operation, "error", 0, time.perf_counter() - started, self.shape())
+            raise
+
+        record_query(
+            self._table, self._operation, response.status_code, len(response.content),
+            time.perf_counter() - started, self.shape(),
+        )
+        return SupabaseResponse(response, raw=self._is_raw)
 
 
 # ─── Main Client ─────────────────────────────────────────────────────────────
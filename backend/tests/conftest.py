@@ -4,6 +4,9 @@ Test fixtures and mocks for backend tests.
 Uses a mock SupabaseLite client to avoid real database connections.
 """
 
+import json
+from contextlib import ExitStack, contextmanager
+
 import pytest  # type: ignore
 from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient  # type: ignore
@@ -14,40 +17,75 @@ class MockResponse:
     def __init__(self, data=None, error=None):
         self.data = data or []
         self.error = error
+        self.count = len(self.data) if isinstance(self.data, list) else None
         self.status_code = 200 if not error else 400
+        self.content_type = "application/json"
+
+    @property
+    def content(self) -> bytes:
+        """Raw-mode body, as PostgREST would have sent it."""
+        return json.dumps(self.data).encode()
 
     def __bool__(self):
         return self.error is None
 
 
 class MockQueryBuilder:
-    """Mock QueryBuilder that returns configurable responses."""
+    """
+    Mock QueryBuilder that returns configurable responses.
+
+    Filters are ignored, but the query shape is kept and reported to
+    tracing on execute(), like the real builder does.
+    """
 
-    def __init__(self, response_data=None):
+    def __init__(self, response_data=None, table_name: str = "?"):
         self._response = MockResponse(data=response_data or [])
+        self._table = table_name
+        self._operation = "select"
+        self._filters: dict[str, str] = {}
+        self._is_single = False
+
+    def _op(self, operation):
+        self._operation = operation
+        return self
+
+    def _filter(self, col, op):
+        self._filters[col] = op
+        return self
 
     # All chainable methods return self
-    def select(self, *a, **kw): return self
-    def insert(self, *a, **kw): return self
-    def update(self, *a, **kw): return self
-    def upsert(self, *a, **kw): return self
-    def delete(self, *a, **kw): return self
-    def eq(self, *a, **kw): return self
-    def neq(self, *a, **kw): return self
-    def gt(self, *a, **kw): return self
-    def gte(self, *a, **kw): return self
-    def lt(self, *a, **kw): return self
-    def lte(self, *a, **kw): return self
-    def like(self, *a, **kw): return self
-    def ilike(self, *a, **kw): return self
-    def in_(self, *a, **kw): return self
-    def is_(self, *a, **kw): return self
+    def select(self, *a, **kw): return self._op("select")
+    def insert(self, *a, **kw): return self._op("insert")
+    def update(self, *a, **kw): return self._op("update")
+    def upsert(self, *a, **kw): return self._op("upsert")
+    def delete(self, *a, **kw): return self._op("delete")
+    def eq(self, col, *a, **kw): return self._filter(col, "eq")
+    def neq(self, col, *a, **kw): return self._filter(col, "neq")
+    def gt(self, col, *a, **kw): return self._filter(col, "gt")
+    def gte(self, col, *a, **kw): return self._filter(col, "gte")
+    def lt(self, col, *a, **kw): return self._filter(col, "lt")
+    def lte(self, col, *a, **kw): return self._filter(col, "lte")
+    def like(self, col, *a, **kw): return self._filter(col, "like")
+    def ilike(self, col, *a, **kw): return self._filter(col, "ilike")
+    def in_(self, col, *a, **kw): return self._filter(col, "in")
+    def is_(self, col, *a, **kw): return self._filter(col, "is")
     def order(self, *a, **kw): return self
     def limit(self, *a, **kw): return self
     def range(self, *a, **kw): return self
-    def single(self, *a, **kw): return self
+    def raw(self, *a, **kw): return self
+    def count(self, *a, **kw): return self
+
+    def single(self, *a, **kw):
+        # Like PostgREST: one object instead of a list
+        rows = self._response.data
+        self._response = MockResponse(data=rows[0] if rows else None)
+        self._is_single = True
+        return self
 
     async def execute(self):
+        from tracing import query_shape, record_query  # type: ignore
+        shape = query_shape(self._table, self._operation, self._filters.items(), self._is_single)
+        record_query(self._table, self._operation, 200, len(self._response.content), 0.0, shape)
         return self._response
 
 
@@ -62,7 +100,7 @@ class MockSupabase:
 
     def table(self, name: str) -> MockQueryBuilder:
         data = self._table_data.get(name, [])
-        return MockQueryBuilder(response_data=data)
+        return MockQueryBuilder(response_data=data, table_name=name)
 
     async def open(self):
         pass
@@ -77,23 +115,114 @@ def mock_supabase():
     return MockSupabase()
 
 
+# Every module that does `from supabase_client import supabase`
+SUPABASE_IMPORTERS = [
+    "supabase_client",
+    "helpers",
+    "idempotency",
+    "catalog",
+    "rollups",
+    "stock_writes",
+    "routers.health",
+    "routers.categories",
+    "routers.stock",
+    "routers.sales",
+    "routers.expenses",
+    "routers.reports",
+    "routers.admin",
+]
+
+
+def reset_process_state():
+    """Drop in-process caches so state does not leak between tests."""
+    from cache import response_cache  # type: ignore
+    from idempotency import idempotency  # type: ignore
+    from catalog import catalog  # type: ignore
+    from helpers import category_registry  # type: ignore
+    from alerts import alert_events  # type: ignore
+    from helpers import movement_events  # type: ignore
+    from rollups import rollups  # type: ignore
+    from routers.sales import invoice_cache  # type: ignore
+    from jobs import job_runner  # type: ignore
+    response_cache.clear()
+    invoice_cache.clear()
+    alert_events.clear()
+    movement_events.clear()
+    category_registry.invalidate()
+    idempotency.clear()
+    catalog.reset()
+    rollups.reset()
+    job_runner.reset_stats()
+    job_runner.retry_delay = 0  # Background retries must not slow the suite down
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Fail the test when a request exceeds its upstream query budget:
+
+        with query_budget(max_queries=2):
+            test_client.get("/stock")
+
+    Every request made inside the block may issue at most `max_queries`
+    queries, and each query shape (see tracing.query_shape) at most
+    `max_repeats` times — a per-item loop shows up as one shape repeated
+    once per item. Yields the list of finished RequestTraces.
+    """
+    from tracing import trace_listeners  # type: ignore
+
+    @contextmanager
+    def budget(max_queries: int | None = None, max_repeats: int = 2):
+        traces: list = []
+        trace_listeners.append(traces.append)
+        try:
+            yield traces
+        finally:
+            trace_listeners.remove(traces.append)
+        for trace in traces:
+            where = f"{trace.scope.get('method')} {trace.route}"
+            if max_queries is not None and len(trace.queries) > max_queries:
+                pytest.fail(f"{where} made {len(trace.queries)} upstream queries (budget {max_queries}): {dict(trace.shapes)}")
+            repeated = trace.repeated_shapes(max_repeats + 1)
+            if repeated:
+                pytest.fail(f"{where} repeated same-shape queries (N+1): {repeated}")
+
+    return budget
+
+
+def _client_with(supabase_stand_in):
+    """TestClient for the app with `supabase_stand_in` patched into every importer."""
+    reset_process_state()
+    with ExitStack() as stack:
+        for module in SUPABASE_IMPORTERS:
+            stack.enter_context(patch(f"{module}.supabase", supabase_stand_in))
+        from main import app  # type: ignore
+        yield TestClient(app)
+
+
 @pytest.fixture
 def test_client(mock_supabase):
     """
     Create a TestClient with mocked Supabase.
     Patches the supabase singleton before importing the app.
     """
-    with patch("supabase_client.supabase", mock_supabase):
-        with patch("helpers.supabase", mock_supabase):
-            with patch("routers.health.supabase", mock_supabase):
-                with patch("routers.categories.supabase", mock_supabase):
-                    with patch("routers.stock.supabase", mock_supabase):
-                        with patch("routers.sales.supabase", mock_supabase):
-                            with patch("routers.expenses.supabase", mock_supabase):
-                                with patch("routers.reports.supabase", mock_supabase):
-                                    with patch("routers.admin.supabase", mock_supabase):
-                                        from main import app  # type: ignore
-                                        yield TestClient(app)
+    yield from _client_with(mock_supabase)
+
+
+@pytest.fixture
+def fake_supabase():
+    """
+    Stateful in-memory Supabase (benchmarks.fake_postgrest): unlike
+    MockSupabase, filters, ordering, ranges and writes really apply.
+    """
+    from benchmarks.fake_postgrest import FakeSupabase  # type: ignore
+    return FakeSupabase()
+
+
+@pytest.fixture
+def fake_client(fake_supabase):
+    """TestClient whose Supabase calls go to `fake_supabase`."""
+    yield from _client_with(fake_supabase)
 
 
 SAMPLE_STOCK_ITEMS = [
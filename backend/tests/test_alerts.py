@@ -0,0 +1,112 @@
+"""Tests for low-stock alerts and the SSE broadcaster."""
+
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from conftest import SAMPLE_STOCK_ITEMS  # type: ignore
+from catalog import Catalog  # type: ignore
+from alerts import AlertIndex  # type: ignore
+from events import Broadcaster  # type: ignore
+
+
+def test_read_stock_alerts(test_client, mock_supabase):
+    """GET /stock/alerts lists items at or below min_stock_alert."""
+    mock_supabase.set_table_data("stock_items", [
+        dict(SAMPLE_STOCK_ITEMS[0], quantity=4),
+        SAMPLE_STOCK_ITEMS[1],
+    ])
+    mock_supabase.set_table_data("stock_item_formats", [])
+
+    response = test_client.get("/stock/alerts")
+    assert response.status_code == 200
+    alerts = response.json()
+    assert [a["id"] for a in alerts] == [1]
+    assert alerts[0]["shortfall"] == 6
+
+
+def test_alert_transitions_are_published():
+    """Crossing the threshold in either direction emits exactly one event."""
+    events = Broadcaster()
+    source = Catalog()
+    index = source.register(AlertIndex(source, events))
+    source.replace([dict(SAMPLE_STOCK_ITEMS[0])])  # quantity 100, alert at 10
+
+    source.patch(1, {"quantity": 50})
+    source.patch(1, {"quantity": 8})
+    source.patch(1, {"quantity": 3})
+    source.patch(1, {"quantity": 60})
+
+    assert [(e, d["state"]) for _, e, d in events.since(0)] == [("low", "LOW"), ("ok", "OK")]
+    assert len(index) == 0
+
+
+def test_broadcaster_replays_after_last_event_id():
+    """A reconnecting client receives buffered events, then live ones."""
+    events = Broadcaster(history=10)
+    for n in range(3):
+        events.publish("tick", {"n": n})
+
+    async def main():
+        stream = events.stream(last_event_id=1)
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        events.publish("tick", {"n": 3})
+        frames.append(await stream.__anext__())
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(main())
+    assert [f.split(b"\n")[0] for f in frames] == [b"id: 2", b"id: 3", b"id: 4"]
+    assert events.subscriber_count == 0
+
+
+def test_broadcaster_reports_gaps():
+    """since() returns None once the requested events were evicted."""
+    events = Broadcaster(history=2)
+    for n in range(5):
+        events.publish("tick", n)
+    assert events.since(1) is None
+    assert [e[0] for e in events.since(3)] == [4, 5]
+
+
+def test_broadcaster_resume_ahead_of_this_process_is_a_gap():
+    """After a restart, a Last-Event-ID beyond anything published means "resync", not "up to date"."""
+    events = Broadcaster(history=10)
+    assert events.since(500) is None
+    events.publish("movement", {"id": 501})
+    assert events.since(500) is None
+    assert [e[0] for e in events.since(0)] == [1]
+
+
+def test_broadcaster_keeps_rows_published_out_of_order():
+    """Rows committed out of id order still reach live subscribers and resumes."""
+    events = Broadcaster(history=10)
+
+    async def main():
+        stream = events.stream()
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        events.publish("movement", {"id": 11})
+        events.publish("movement", {"id": 10})  # Its job finished later
+        frames = [await pending, await stream.__anext__()]
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(main())
+    assert [b'"id": 11' in frames[0], b'"id": 10' in frames[1]] == [True, True]
+    assert [data["id"] for _, _, data in events.since(1)] == [10]
+
+
+def test_reload_publishes_alerts_for_deleted_items():
+    """An item in alert that is missing from a reload is announced as REMOVED."""
+    events = Broadcaster()
+    source = Catalog()
+    index = source.register(AlertIndex(source, events))
+    low = [dict(row, quantity=1) for row in SAMPLE_STOCK_ITEMS]
+    source.replace(low)
+
+    source.replace(low[1:])  # Item 1 was deleted by another instance
+
+    assert [(e, d["item_id"], d["state"]) for _, e, d in events.since(0)] == [("removed", 1, "REMOVED")]
+    assert [a["id"] for a in index.alerts()] == [2]
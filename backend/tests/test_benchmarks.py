@@ -0,0 +1,53 @@
+"""Smoke tests for the benchmark harness and its fake PostgREST upstream."""
+
+import argparse
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # type: ignore
+
+from benchmarks.fake_postgrest import FAKE_URL, FakePostgREST, MemoryDatabase  # type: ignore
+from benchmarks.run import run  # type: ignore
+
+
+def test_fake_postgrest_answers_query_builder():
+    """Filters, ordering, paging and single-object reads behave like PostgREST."""
+    from supabase_client import SupabaseLite  # type: ignore
+    db = MemoryDatabase()
+    db.seed("stock_items", [{"name": n, "quantity": q} for n, q in [("b", 5), ("a", 0), ("c", 12)]])
+    client = SupabaseLite(FAKE_URL, "key")
+    client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=FakePostgREST(db)))
+
+    async def main():
+        try:
+            in_stock = await client.table("stock_items").select("name").gt("quantity", 0).order("name", desc=True).execute()
+            page = await client.table("stock_items").select("id").order("id").range(1, 2).execute()
+            one = await client.table("stock_items").select("*").eq("id", 2).single().execute()
+            missing = await client.table("stock_items").select("*").eq("id", 99).single().execute()
+            updated = await client.table("stock_items").update({"quantity": 1}).in_("id", [1, 2]).execute()
+            return in_stock, page, one, missing, updated
+        finally:
+            await client.close()
+
+    in_stock, page, one, missing, updated = asyncio.run(main())
+    assert in_stock.data == [{"name": "c"}, {"name": "b"}]
+    assert page.data == [{"id": 2}, {"id": 3}]
+    assert one.data["name"] == "a"
+    assert missing.status_code == 406 and not missing
+    assert [row["quantity"] for row in updated.data] == [1, 1]
+
+
+def test_harness_reports_latency_and_upstream_calls():
+    args = argparse.Namespace(
+        skus=50, iterations=3, warmup=0, concurrency=2, latency_ms=0.0, jitter_ms=0.0,
+        only=["checkout_5", "dashboard"],
+    )
+    results = asyncio.run(run(args))
+    assert set(results) == {"checkout_5_lines", "dashboard"}
+    for result in results.values():
+        assert result["requests"] == 3 and result["errors"] == 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    assert results["dashboard"]["upstream_calls_max"] == 3
+    assert results["checkout_5_lines"]["upstream_calls_max"] > 5
@@ -0,0 +1,76 @@
+"""Tests for the category registry and endpoints."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from conftest import SAMPLE_CATEGORIES  # type: ignore
+
+
+def test_read_categories_by_type(test_client, mock_supabase):
+    """GET /categories filters the in-memory registry by type."""
+    mock_supabase.set_table_data("categories", SAMPLE_CATEGORIES)
+    response = test_client.get("/categories", params={"type": "PRODUCT"})
+    assert response.status_code == 200
+    assert [c["name"] for c in response.json()] == ["Gaseosas", "Cervezas"]
+
+
+def test_categories_served_from_memory_until_invalidated(test_client, mock_supabase):
+    """Reads reuse the loaded registry; creating a category forces a reload."""
+    mock_supabase.set_table_data("categories", SAMPLE_CATEGORIES)
+    assert len(test_client.get("/categories").json()) == 4
+
+    mock_supabase.set_table_data("categories", SAMPLE_CATEGORIES[:1])
+    assert len(test_client.get("/categories").json()) == 4
+
+    test_client.post("/categories", json={"name": "Gaseosas", "type": "PRODUCT"})
+    assert len(test_client.get("/categories").json()) == 1
+
+
+def test_get_category_id(test_client, mock_supabase):
+    """Name → id lookups come from the same single-query load."""
+    import asyncio
+    from helpers import get_category_id  # type: ignore
+
+    mock_supabase.set_table_data("categories", SAMPLE_CATEGORIES)
+    assert asyncio.run(get_category_id("Venta de Bebidas")) == 3
+    assert asyncio.run(get_category_id("Inexistente")) is None
+
+
+def test_load_racing_an_invalidation_is_not_fresh():
+    """A load that read the table before a category write does not count as fresh."""
+    import asyncio
+    from unittest.mock import patch
+    from conftest import MockResponse  # type: ignore
+    from helpers import CategoryRegistry  # type: ignore
+    registry = CategoryRegistry()
+    table = list(SAMPLE_CATEGORIES)
+
+    class SlowCategories:
+        """Reads the rows, then answers once `gate` opens."""
+        read = asyncio.Event()
+        gate = asyncio.Event()
+
+        def table(self, name): return self
+        def select(self, *a): return self
+        def order(self, *a, **kw): return self
+
+        async def execute(self):
+            rows = list(table)
+            self.read.set()
+            await self.gate.wait()
+            return MockResponse(rows)
+
+    slow = SlowCategories()
+
+    async def main():
+        with patch("helpers.supabase", slow):
+            load = asyncio.ensure_future(registry.ensure_loaded())
+            await slow.read.wait()
+            table.append({"id": 5, "name": "Vinos", "type": "PRODUCT"})
+            registry.invalidate()
+            slow.gate.set()
+            await load
+            return await registry.get_id("Vinos")
+
+    assert asyncio.run(main()) == 5
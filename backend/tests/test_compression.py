@@ -0,0 +1,60 @@
+"""Tests for response compression and precompressed cache entries."""
+
+import gzip
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from conftest import SAMPLE_STOCK_ITEMS  # type: ignore
+from compression import negotiate_encoding, PrecompressedPayload  # type: ignore
+
+
+def test_negotiate_encoding():
+    """brotli is preferred, q=0 excludes, unknown encodings are ignored."""
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip, br;q=0") == "gzip"
+    assert negotiate_encoding("deflate") is None
+    assert negotiate_encoding("") is None
+
+
+def test_large_json_is_gzipped(test_client, mock_supabase):
+    """List endpoints above the threshold are compressed when the client accepts it."""
+    rows = [{"id": i, "amount": i * 10, "type": "INCOME", "description": "Venta Directa Salón"} for i in range(200)]
+    mock_supabase.set_table_data("transactions", rows)
+    response = test_client.get("/transactions", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == rows
+
+
+def test_small_json_is_not_compressed(test_client):
+    """Bodies under the minimum size are sent as-is."""
+    response = test_client.get("/ping", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_precompressed_payload_reuses_variant():
+    """The compressed form is computed once and served again on the next hit."""
+    payload = PrecompressedPayload(b'{"items":[' + b'"x",' * 1000 + b'"x"]}')
+    first = payload.response("gzip", minimum_size=10)
+    second = payload.response("gzip", minimum_size=10)
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.body is second.body
+    assert gzip.decompress(first.body) == payload.body
+
+
+def test_cached_catalog_not_recompressed(test_client, mock_supabase):
+    """A cached /stock hit carries its stored encoding straight through the middleware."""
+    items = [dict(SAMPLE_STOCK_ITEMS[i % 2], id=i) for i in range(50)]
+    mock_supabase.set_table_data("stock_items", items)
+    mock_supabase.set_table_data("stock_item_formats", [])
+
+    first = test_client.get("/stock", headers={"Accept-Encoding": "gzip"})
+    mock_supabase.set_table_data("stock_items", [])
+    second = test_client.get("/stock", headers={"Accept-Encoding": "gzip"})
+
+    assert first.headers["content-encoding"] == "gzip"
+    assert second.headers["content-encoding"] == "gzip"
+    assert len(second.json()) == 50
@@ -0,0 +1,130 @@
+"""Tests for expense document uploads."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest  # type: ignore
+
+
+@pytest.fixture
+def upload_dir(monkeypatch, tmp_path):
+    import routers.expenses as expenses  # type: ignore
+    from storage import LocalFileStorage  # type: ignore
+    monkeypatch.setattr(expenses, "document_storage", LocalFileStorage(str(tmp_path)))
+    return tmp_path
+
+
+def _upload(client, content: bytes, name: str = "ticket.pdf"):
+    return client.post(
+        "/expenses/upload",
+        data={"description": "Luz", "amount": "1500", "date": "2026-03-02"},
+        files={"file": (name, content, "application/pdf")},
+    )
+
+
+def test_upload_is_stored_once_per_content(test_client, mock_supabase, upload_dir):
+    """Identical receipts share one file named by their SHA-256."""
+    import hashlib
+    mock_supabase.set_table_data("expense_documents", [{"id": 1}])
+    content = b"%PDF-1.4 receipt" * 1000
+
+    first = _upload(test_client, content)
+    second = _upload(test_client, content, name="copy.pdf")
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json()["duplicate_file"] is False
+    assert second.json()["duplicate_file"] is True
+    digest = hashlib.sha256(content).hexdigest()
+    assert [p.relative_to(upload_dir).as_posix() for p in upload_dir.rglob("*") if p.is_file()] == [
+        f"{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+    ]
+
+
+def test_upload_rejects_oversized_file_without_leftovers(test_client, mock_supabase, upload_dir, monkeypatch):
+    import routers.expenses as expenses  # type: ignore
+    monkeypatch.setattr(expenses, "MAX_FILE_SIZE", 1024)
+
+    response = _upload(test_client, b"x" * 4096)
+    assert response.status_code == 400
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_upload_rejects_unknown_extension(test_client, upload_dir):
+    assert _upload(test_client, b"MZ", name="virus.exe").status_code == 400
+
+
+def test_expense_file_supports_etag_and_range(test_client, mock_supabase, upload_dir):
+    content = b"%PDF-1.4 " + bytes(range(256)) * 40
+    mock_supabase.set_table_data("expense_documents", [{"id": 1}])
+    _upload(test_client, content)
+    mock_supabase.set_table_data("expense_documents", [{"id": 1, "file_path": _stored_path(upload_dir)}])
+
+    full = test_client.get("/expenses/1/file")
+    assert full.status_code == 200 and full.content == content
+    etag = full.headers["etag"]
+
+    assert test_client.get("/expenses/1/file", headers={"If-None-Match": etag}).status_code == 304
+    partial = test_client.get("/expenses/1/file", headers={"Range": "bytes=0-99"})
+    assert partial.status_code == 206 and partial.content == content[:100]
+
+
+def test_image_thumbnail_is_generated_once(test_client, mock_supabase, upload_dir):
+    import io
+    from PIL import Image  # type: ignore
+    buffer = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "red").save(buffer, "PNG")
+    mock_supabase.set_table_data("expense_documents", [{"id": 2}])
+    _upload(test_client, buffer.getvalue(), name="ticket.png")
+    mock_supabase.set_table_data("expense_documents", [{"id": 2, "file_path": _stored_path(upload_dir)}])
+
+    response = test_client.get("/expenses/2/thumbnail", params={"size": 100})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).size == (128, 64)
+    assert len(list((upload_dir / ".thumbs").iterdir())) == 1
+
+
+def test_pdf_has_no_thumbnail(test_client, mock_supabase, upload_dir):
+    mock_supabase.set_table_data("expense_documents", [{"id": 3}])
+    _upload(test_client, b"%PDF-1.4")
+    mock_supabase.set_table_data("expense_documents", [{"id": 3, "file_path": _stored_path(upload_dir)}])
+    assert test_client.get("/expenses/3/thumbnail").status_code == 404
+
+
+def test_corrupt_image_has_no_thumbnail(test_client, mock_supabase, upload_dir):
+    mock_supabase.set_table_data("expense_documents", [{"id": 4}])
+    _upload(test_client, b"\x89PNG\r\n\x1a\n truncated", name="ticket.png")
+    mock_supabase.set_table_data("expense_documents", [{"id": 4, "file_path": _stored_path(upload_dir)}])
+    assert test_client.get("/expenses/4/thumbnail").status_code == 404
+    assert list((upload_dir / ".thumbs").iterdir()) == []
+
+
+def test_oversized_image_has_no_thumbnail(test_client, mock_supabase, upload_dir, monkeypatch):
+    """A decompression bomb is a 404 too, and leaves no temp file behind."""
+    import io
+    from PIL import Image  # type: ignore
+    buffer = io.BytesIO()
+    Image.new("RGB", (400, 400), "red").save(buffer, "PNG")
+    mock_supabase.set_table_data("expense_documents", [{"id": 5}])
+    _upload(test_client, buffer.getvalue(), name="ticket.png")
+    mock_supabase.set_table_data("expense_documents", [{"id": 5, "file_path": _stored_path(upload_dir)}])
+
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)  # 400x400 is over twice the limit
+    assert test_client.get("/expenses/5/thumbnail").status_code == 404
+    assert list((upload_dir / ".thumbs").iterdir()) == []
+
+
+def test_document_storage_requires_every_hook():
+    from storage import DocumentStorage  # type: ignore
+
+    class PartialStorage(DocumentStorage):
+        def local_path(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStorage()
+
+
+def _stored_path(upload_dir) -> str:
+    [stored] = [p for p in upload_dir.rglob("*") if p.is_file() and ".thumbs" not in p.parts]
+    return "uploads/" + stored.relative_to(upload_dir).as_posix()
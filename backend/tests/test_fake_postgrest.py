@@ -0,0 +1,109 @@
+"""Tests for the in-memory PostgREST engine and the FakeSupabase drop-in."""
+
+import asyncio
+import random
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fake_postgrest import FakeSupabase, Filter, MemoryDatabase  # type: ignore
+from conftest import SAMPLE_CATEGORIES, SAMPLE_STOCK_ITEMS  # type: ignore
+
+
+def test_indexed_lookups_match_a_full_scan():
+    """Random inserts, re-parenting updates and deletes keep the *_id indexes exact."""
+    rng = random.Random(7)
+    db = MemoryDatabase()
+    table = db.table("sales")
+    for _ in range(2000):
+        op = rng.random()
+        if op < 0.6 or not table.rows:
+            table.insert({"stock_item_id": rng.randint(1, 20), "quantity": rng.randint(1, 5)})
+        elif op < 0.85:
+            db.update("sales", [Filter("id", f"eq.{rng.choice(list(table.rows))}")], {"stock_item_id": rng.randint(1, 20)})
+        else:
+            db.delete("sales", [Filter("id", f"eq.{rng.choice(list(table.rows))}")])
+
+    for item_id in range(1, 21):
+        scan = [row for row in table.rows.values() if row["stock_item_id"] == item_id]
+        assert db.select("sales", [Filter("stock_item_id", f"eq.{item_id}")]) == scan
+    wanted = "in.(3,5,8)"
+    assert db.select("sales", [Filter("stock_item_id", wanted), Filter("quantity", "gte.3")]) == [
+        row for row in table.rows.values() if row["stock_item_id"] in (3, 5, 8) and row["quantity"] >= 3
+    ]
+
+
+def test_query_builder_semantics():
+    fake = FakeSupabase()
+    fake.db.seed("stock_items", [
+        {"name": "Quilmes 1L", "brand": "Quilmes", "quantity": 5, "category_id": 2},
+        {"name": "Coca-Cola", "brand": None, "quantity": 0, "category_id": 1},
+        {"name": "Quilmes Lata", "brand": "Quilmes", "quantity": 12, "category_id": 2},
+    ])
+
+    async def main():
+        table = fake.table
+        try:
+            return [
+                await table("stock_items").select("id").ilike("name", "%quilmes%").order("quantity", desc=True).execute(),
+                await table("stock_items").select("id").eq("category_id", 2).limit(1).count().execute(),
+                await table("stock_items").select("id").is_("brand", "null").execute(),
+                await table("stock_items").select("id").neq("category_id", 2).execute(),
+                await table("stock_items").select("name").order("brand").order("name").limit(1).execute(),
+                await table("stock_items").upsert({"id": 2, "quantity": 7}).execute(),
+                await table("stock_items").upsert({"name": "Fernet", "quantity": 1}).execute(),
+                await table("stock_items").delete().eq("category_id", 1).execute(),
+                await table("stock_items").select("*").eq("brand", "Quilmes").single().execute(),
+            ]
+        finally:
+            await fake.close()
+
+    by_name, counted, null_brand, other_category, first, upserted, inserted, deleted, ambiguous = asyncio.run(main())
+    assert by_name.data == [{"id": 3}, {"id": 1}]
+    assert (counted.data, counted.count) == ([{"id": 1}], 2)
+    assert null_brand.data == [{"id": 2}]
+    assert other_category.data == [{"id": 2}]
+    assert first.data == [{"name": "Coca-Cola"}]  # QueryBuilder keeps the last order()
+    assert upserted.data[0]["name"] == "Coca-Cola" and upserted.data[0]["quantity"] == 7
+    assert inserted.data[0]["id"] == 4
+    assert [row["id"] for row in deleted.data] == [2]
+    assert ambiguous.status_code == 406
+    assert [row["id"] for row in fake.db.rows("stock_items")] == [1, 3, 4]
+
+
+def test_concurrent_writers_get_unique_ids():
+    """Requests interleave under jitter but each one applies atomically."""
+    fake = FakeSupabase(latency=0.001, jitter=0.002)
+
+    async def main():
+        try:
+            return await asyncio.gather(*(
+                fake.table("transactions").insert({"amount": i}).execute() for i in range(300)
+            ))
+        finally:
+            await fake.close()
+
+    responses = asyncio.run(main())
+    ids = [res.data[0]["id"] for res in responses]
+    assert sorted(ids) == list(range(1, 301))
+    assert len(fake.db.rows("transactions")) == 300
+
+
+def test_checkout_against_fake_backend(fake_client, fake_supabase):
+    """A checkout really deducts stock and links its sales to the transaction."""
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    fake_supabase.set_table_data("categories", SAMPLE_CATEGORIES)
+    cart = {"description": "Mostrador", "items": [{"item_id": 1, "quantity": 3}, {"item_id": 2, "quantity": 4}]}
+
+    response = fake_client.post("/sales", json=cart)
+    assert response.status_code == 200
+    tx_id = response.json()["transaction_id"]
+
+    db = fake_supabase.db
+    assert [row["quantity"] for row in db.rows("stock_items")] == [97, 46]
+    assert {row["sale_tx_id"] for row in db.rows("sales")} == {tx_id}
+    assert db.rows("transactions")[0]["amount"] == response.json()["total"]
+
+    short = fake_client.post("/sales", json={"description": "x", "items": [{"item_id": 1, "quantity": 500}]})
+    assert short.status_code == 400
+    assert db.rows("stock_items")[0]["quantity"] == 97
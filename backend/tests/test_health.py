@@ -22,3 +22,47 @@ def test_health(test_client, mock_supabase):
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "healthy"
+
+
+def test_requests_carry_server_timing_and_feed_metrics(test_client):
+    """Every response has a Server-Timing header; /metrics aggregates per route template."""
+    from tracing import metrics  # type: ignore
+    metrics.clear()
+    response = test_client.get("/ping")
+    assert response.headers["server-timing"].startswith('db;dur=0.0;desc="0 queries", app;dur=')
+
+    body = test_client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/ping",status="200"} 1' in body
+    assert 'upstream_queries_per_request_bucket{route="/ping",le="0"} 1' in body
+
+
+def test_query_builder_records_round_trips():
+    """QueryBuilder.execute() reports table, operation, status and bytes to the active trace."""
+    import asyncio
+    import httpx  # type: ignore
+    from supabase_client import SupabaseLite  # type: ignore
+    from tracing import RequestTrace, _current_trace, metrics  # type: ignore
+    metrics.clear()
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(201 if request.method == "POST" else 200, json=[{"id": 1}])
+
+    client = SupabaseLite("http://supabase.test", "key")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    trace = RequestTrace()
+
+    async def main():
+        token = _current_trace.set(trace)
+        try:
+            await client.table("stock_items").select("*").execute()
+            await client.table("sales").insert({"quantity": 1}).execute()
+        finally:
+            _current_trace.reset(token)
+            await client._client.aclose()
+
+    asyncio.run(main())
+    assert [(t, op, status, nbytes) for t, op, status, nbytes, _ in trace.queries] == [
+        ("stock_items", "select", 200, 10),
+        ("sales", "insert", 201, 10),
+    ]
+    assert 'upstream_queries_total{route="unmatched",table="sales",operation="insert",status="201"} 1' in metrics.render()
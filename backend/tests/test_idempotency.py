@@ -0,0 +1,114 @@
+"""Tests for Idempotency-Key handling on POST /sales and POST /stock/batch."""
+
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from idempotency import IdempotencyStore  # type: ignore
+
+BATCH = {
+    "items": [{"name": "Fernet", "brand": "Branca", "cost_amount": 0, "quantity": 6}],
+}
+
+
+def test_stock_batch_replays_with_same_key(test_client, mock_supabase):
+    """A retried /stock/batch returns the first result without inserting again."""
+    mock_supabase.set_table_data("categories", [])
+    mock_supabase.set_table_data("stock_items", [{"id": 10, "name": "Fernet"}])
+    headers = {"Idempotency-Key": "load-1"}
+
+    first = test_client.post("/stock/batch", json=BATCH, headers=headers)
+    mock_supabase.set_table_data("stock_items", [{"id": 11, "name": "Fernet"}])
+    second = test_client.post("/stock/batch", json=BATCH, headers=headers)
+
+    assert first.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.json() == first.json() == [{"id": 10, "status": "created"}]
+
+
+def test_stock_batch_key_reused_with_other_body(test_client, mock_supabase):
+    """Reusing a key for a different payload is rejected."""
+    mock_supabase.set_table_data("categories", [])
+    mock_supabase.set_table_data("stock_items", [{"id": 10, "name": "Fernet"}])
+    headers = {"Idempotency-Key": "load-2"}
+
+    test_client.post("/stock/batch", json=BATCH, headers=headers)
+    other = {"items": [dict(BATCH["items"][0], quantity=12)]}
+    response = test_client.post("/stock/batch", json=other, headers=headers)
+    assert response.status_code == 422
+
+
+def test_concurrent_duplicates_run_once():
+    """Two in-flight requests with the same key share one execution."""
+    store = IdempotencyStore(table="")
+    calls = 0
+
+    async def operation():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"transaction_id": 1}
+
+    async def main():
+        return await asyncio.gather(
+            store.run("k", "sales", {"a": 1}, operation),
+            store.run("k", "sales", {"a": 1}, operation),
+        )
+
+    (first, replayed_a), (second, replayed_b) = asyncio.run(main())
+    assert calls == 1
+    assert first == second == {"transaction_id": 1}
+    assert sorted([replayed_a, replayed_b]) == [False, True]
+
+
+def test_duplicates_during_the_table_lookup_run_once(monkeypatch):
+    """With IDEMPOTENCY_TABLE set, a duplicate arriving while the first one queries the table waits for it."""
+    store = IdempotencyStore(table="idempotency_keys")
+    calls = 0
+
+    async def slow_miss(cache_key):
+        await asyncio.sleep(0.01)
+        return None
+
+    async def no_persist(cache_key, stored):
+        pass
+
+    async def operation():
+        nonlocal calls
+        calls += 1
+        return {"transaction_id": 1}
+
+    monkeypatch.setattr(store, "_load", slow_miss)
+    monkeypatch.setattr(store, "_persist", no_persist)
+
+    async def main():
+        return await asyncio.gather(*(store.run("k", "sales", {"a": 1}, operation) for _ in range(2)))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert sorted(replayed for _, replayed in results) == [False, True]
+
+
+def test_failures_are_not_stored():
+    """A failed attempt can be retried with the same key."""
+    store = IdempotencyStore(table="")
+    attempts = 0
+
+    async def operation():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise ValueError("upstream down")
+        return "ok"
+
+    async def main():
+        try:
+            await store.run("k", "sales", None, operation)
+        except ValueError:
+            pass
+        return await store.run("k", "sales", None, operation)
+
+    assert asyncio.run(main()) == ("ok", False)
+    assert attempts == 2
@@ -0,0 +1,154 @@
+"""Tests for the background job runner."""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from jobs import JobRunner  # type: ignore
+
+
+def _runner(tmp_path, **kwargs) -> JobRunner:
+    return JobRunner(concurrency=2, retry_delay=0, journal_path=str(tmp_path / "jobs.jsonl"), inline=False, **kwargs)
+
+
+def test_jobs_run_in_background_with_retries(tmp_path):
+    runner = _runner(tmp_path, max_attempts=3)
+    calls: list[int] = []
+
+    @runner.handler("flaky")
+    async def flaky(n: int):
+        calls.append(n)
+        if len(calls) < 3:
+            raise RuntimeError("temporary")
+
+    @runner.handler("broken")
+    async def broken():
+        raise RuntimeError("permanent")
+
+    async def main():
+        await runner.start()
+        await runner.enqueue("flaky", n=1)
+        await runner.enqueue("broken")
+        assert runner.stats()["mode"] == "background"
+        await runner.drain()
+
+    asyncio.run(main())
+    stats = runner.stats()
+    assert calls == [1, 1, 1]
+    assert (stats["completed"], stats["failed"], stats["retried"]) == (1, 1, 4)
+    assert stats["recent_failures"][0]["name"] == "broken"
+
+
+def test_unfinished_jobs_are_recovered_from_the_journal(tmp_path):
+    """Jobs enqueued before a crash (no done/failed record) run on the next start."""
+    journal = tmp_path / "jobs.jsonl"
+    journal.write_text("\n".join([
+        json.dumps({"op": "enqueued", "job": {"id": "a", "name": "echo", "kwargs": {"value": "lost"}}}),
+        json.dumps({"op": "enqueued", "job": {"id": "b", "name": "echo", "kwargs": {"value": "done"}}}),
+        json.dumps({"op": "done", "id": "b"}),
+        '{"op": "enq',  # Torn write
+    ]))
+    runner = _runner(tmp_path)
+    seen: list[str] = []
+
+    @runner.handler("echo")
+    async def echo(value: str):
+        seen.append(value)
+
+    async def main():
+        await runner.start()
+        await runner.drain()
+
+    asyncio.run(main())
+    assert seen == ["lost"]
+    records = [json.loads(line) for line in journal.read_text().splitlines()]
+    assert records[-1] == {"op": "done", "id": "a"}
+
+
+def test_admin_jobs_reports_inline_work(test_client, mock_supabase):
+    """Without a started runner (tests, Vercel) jobs run inline and are still counted."""
+    mock_supabase.set_table_data("app_movements", [{"id": 1}])
+    test_client.get("/seed-categories")
+    stats = test_client.get("/admin/jobs").json()
+    assert stats["mode"] == "inline"
+    assert stats["completed"] >= 1
+
+
+def test_each_runner_locks_its_own_journal(tmp_path):
+    """A second process on the same JOBS_JOURNAL gets the next slot and never replays the first one's jobs."""
+    first, second = _runner(tmp_path), _runner(tmp_path)
+    seen: list[str] = []
+
+    async def echo(value: str):
+        seen.append(value)
+
+    first.handler("echo")(echo)
+    second.handler("echo")(echo)
+
+    async def main():
+        await first.start()
+        await first.enqueue("echo", value="first")
+        await second.start()
+        journals = (first.journal_path, second.journal_path)
+        await first.drain()
+        await second.drain()
+        return journals
+
+    journals = asyncio.run(main())
+    assert journals == (str(tmp_path / "jobs.jsonl"), str(tmp_path / "jobs.jsonl.1"))
+    assert seen == ["first"]
+
+
+def test_inline_jobs_do_not_retry(tmp_path):
+    runner = JobRunner(retry_delay=60, journal_path=str(tmp_path / "jobs.jsonl"), inline=True, max_attempts=3)
+    calls: list[int] = []
+
+    @runner.handler("broken")
+    async def broken():
+        calls.append(1)
+        raise RuntimeError("down")
+
+    asyncio.run(runner.enqueue("broken"))
+    assert calls == [1]
+    assert runner.stats()["failed"] == 1
+
+
+def test_job_inserts_are_idempotent(fake_client, fake_supabase):
+    """A replayed insert_transaction job (same job id) does not insert again."""
+    from unittest.mock import patch
+    from helpers import _insert_transaction  # type: ignore
+    from jobs import _current_job  # type: ignore
+
+    async def main():
+        _current_job.set("job-1")
+        with patch("helpers.rollups.record_transactions") as recorded:
+            await _insert_transaction({"amount": 10})
+            await _insert_transaction({"amount": 10})  # Recovered after a crash
+        return recorded.call_count
+
+    assert asyncio.run(main()) == 1
+    [tx] = fake_supabase.db.rows("transactions")
+    assert tx["job_id"] == "job-1"
+
+
+def test_journal_is_compacted_while_running(tmp_path):
+    runner = _runner(tmp_path)
+    runner.compact_every = 4
+
+    @runner.handler("echo")
+    async def echo(value: int):
+        pass
+
+    async def main():
+        await runner.start()
+        for value in range(10):
+            await runner.enqueue("echo", value=value)
+            await asyncio.sleep(0)
+        await runner.drain()
+
+    asyncio.run(main())
+    lines = (tmp_path / "jobs.jsonl").read_text().splitlines()
+    assert len(lines) < 20  # One enqueued and one done record per job without compaction
+    assert runner._recover() == []
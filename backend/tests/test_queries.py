@@ -0,0 +1,74 @@
+"""Tests for per-request query counting and the N+1 detector."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest  # type: ignore
+
+from conftest import SAMPLE_CATEGORIES, SAMPLE_STOCK_ITEMS  # type: ignore
+
+
+def _seed(mock_supabase):
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    mock_supabase.set_table_data("categories", SAMPLE_CATEGORIES)
+    mock_supabase.set_table_data("transactions", [{"id": 5, "amount": 1300, "date": "2026-02-15"}])
+    mock_supabase.set_table_data("sales", [{"stock_item_id": 1, "quantity": 1, "sale_price_total": 500}])
+
+
+def test_query_shape_ignores_values():
+    """Lookups that differ only in filter values share one shape."""
+    from supabase_client import SupabaseLite  # type: ignore
+    client = SupabaseLite("http://supabase.test", "key")
+    shapes = {
+        client.table("stock_items").select("*").eq("id", item_id).single().shape()
+        for item_id in (1, 2, 3)
+    }
+    assert shapes == {"select stock_items id=eq single"}
+    assert client.table("stock_items").select("id").in_("id", [1, 2]).order("id").shape() == "select stock_items id=in"
+
+
+def test_bulk_endpoints_stay_within_budget(test_client, mock_supabase, query_budget):
+    """Endpoints already batched by id stay at a fixed number of round trips."""
+    _seed(mock_supabase)
+    with query_budget(max_queries=3) as traces:
+        assert test_client.get("/stock").status_code == 200
+        assert test_client.get("/sales/invoice/5").status_code == 200
+    assert [len(trace.queries) for trace in traces] == [2, 3]
+
+
+def test_budget_fails_on_per_item_queries(test_client, mock_supabase, query_budget):
+    """A checkout that reads and writes stock per cart line is flagged as N+1."""
+    _seed(mock_supabase)
+    cart = {"description": "Test", "items": [{"item_id": 1, "quantity": 1} for _ in range(3)]}
+    with pytest.raises(pytest.fail.Exception, match="select stock_items id=eq single"):
+        with query_budget():
+            test_client.post("/sales", json=cart)
+
+
+def test_budget_fails_over_max_queries(test_client, mock_supabase, query_budget):
+    _seed(mock_supabase)
+    with pytest.raises(pytest.fail.Exception, match="budget 1"):
+        with query_budget(max_queries=1):
+            test_client.get("/stock")
+
+
+def test_debug_mode_reports_repeated_queries(mock_supabase, capsys):
+    """With debug on, responses carry query counts and N+1 requests are logged."""
+    from fastapi import FastAPI  # type: ignore
+    from fastapi.testclient import TestClient  # type: ignore
+    from tracing import TracingMiddleware  # type: ignore
+
+    app = FastAPI()
+
+    @app.get("/loop")
+    async def loop():
+        for item_id in range(4):
+            await mock_supabase.table("stock_items").select("*").eq("id", item_id).single().execute()
+        return {}
+
+    app.add_middleware(TracingMiddleware, debug=True)
+    response = TestClient(app).get("/loop")
+    assert response.headers["x-upstream-queries"] == "4"
+    assert response.headers["x-repeated-queries"] == "select stock_items id=eq single x4"
+    assert "GET /loop made 4 queries" in capsys.readouterr().out
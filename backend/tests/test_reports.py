@@ -0,0 +1,227 @@
+"""Tests for the reporting rollups and series endpoints."""
+
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rollups import SalesRollups, period_of, sale_units  # type: ignore
+from rows import SaleLine  # type: ignore
+
+TRANSACTIONS = [
+    {"id": 1, "amount": 100.0, "type": "INCOME", "category_id": 7, "date": "2026-03-02T10:00:00"},
+    {"id": 2, "amount": 50.0, "type": "INCOME", "category_id": 7, "date": "2026-03-04T18:30:00"},
+    {"id": 3, "amount": 30.0, "type": "EXPENSE", "category_id": 9, "date": "2026-03-04T09:00:00"},
+    {"id": 4, "amount": 20.0, "type": "INCOME", "category_id": 7, "date": "2026-04-01T12:00:00"},
+]
+SALES = [
+    {"id": 1, "stock_item_id": 1, "quantity": 2, "sale_price_total": 100.0, "sale_tx_id": 1, "description": "Coca-Cola (Pack x6)"},
+    {"id": 2, "stock_item_id": 1, "quantity": 1, "sale_price_total": 50.0, "sale_tx_id": 2, "description": "Coca-Cola"},
+]
+
+
+def test_report_series_by_day_and_month(test_client, mock_supabase):
+    """GET /reports/series aggregates transactions into day / month buckets."""
+    mock_supabase.set_table_data("transactions", TRANSACTIONS)
+    mock_supabase.set_table_data("sales", SALES)
+
+    daily = test_client.get("/reports/series", params={"start": "2026-03-01", "end": "2026-03-31"}).json()
+    assert [(r["period"], r["income"], r["expense"], r["net"]) for r in daily] == [
+        ("2026-03-02", 100.0, 0.0, 100.0),
+        ("2026-03-04", 50.0, 30.0, 20.0),
+    ]
+
+    monthly = test_client.get("/reports/series", params={
+        "start": "2026-01-01", "end": "2026-12-31", "granularity": "month", "category_id": 7,
+    }).json()
+    assert [(r["period"], r["income"], r["transactions"]) for r in monthly] == [("2026-03", 150.0, 2), ("2026-04", 20.0, 1)]
+
+    assert test_client.get("/reports/series", params={"granularity": "year"}).status_code == 422
+
+
+def test_product_series_counts_pack_units(test_client, mock_supabase):
+    """Per-SKU series report units (packs expanded) and revenue."""
+    mock_supabase.set_table_data("transactions", TRANSACTIONS)
+    mock_supabase.set_table_data("sales", SALES)
+
+    response = test_client.get("/reports/products/1/series", params={
+        "start": "2026-03-01", "end": "2026-03-31", "granularity": "week",
+    })
+    assert response.status_code == 200
+    assert response.json() == [{"period": "2026-03-02", "units": 13.0, "revenue": 150.0}]
+
+
+def test_rollups_record_writes_incrementally(mock_supabase):
+    """Rows reported by write endpoints land in the buckets without a rebuild."""
+    store = SalesRollups()
+    store.record_transactions([TRANSACTIONS[0]])  # Ignored: not built yet
+    asyncio.run(_build(store, mock_supabase))
+
+    tx = {"id": 5, "amount": 12.0, "type": "INCOME", "category_id": 7, "date": "2026-03-02T20:00:00"}
+    store.record_transactions([tx])
+    store.record_sales([SaleLine(2, quantity=1, units=3, description="Pack", sale_price_total=12.0)], tx)
+
+    assert store.series("2026-03-02", "2026-03-02")[0]["income"] == 12.0
+    assert store.sku_totals("2026-03-01", "2026-03-31") == {2: (3.0, 12.0)}
+
+
+async def _build(store, mock_supabase):
+    from unittest.mock import patch
+    with patch("rollups.supabase", mock_supabase):
+        await store.rebuild()
+
+
+def test_period_and_unit_helpers():
+    assert period_of("2026-03-05", "week") == "2026-03-02"
+    assert period_of("2026-03-05", "month") == "2026-03"
+    assert sale_units({"quantity": 2, "description": "X (Pack x12.0)"}) == 24.0
+    assert sale_units({"quantity": 2, "description": "Vino (Pack x6) Reserva"}) == 2  # Not the pack suffix
+    assert sale_units({"quantity": 2, "units": 12, "description": "Vino"}) == 12
+
+
+def test_writes_during_a_rebuild_are_kept(fake_supabase):
+    """A sale recorded while the rebuild pages through the tables is not lost by the swap."""
+    store = SalesRollups(page_size=2)
+    fake_supabase.backend.latency = 0.001  # Page queries really suspend the rebuild
+    fake_supabase.set_table_data("transactions", TRANSACTIONS)
+    fake_supabase.set_table_data("sales", SALES)
+    late = {"id": 9, "amount": 40.0, "type": "INCOME", "category_id": 7, "date": "2026-03-20T10:00:00"}
+
+    async def main():
+        from unittest.mock import patch
+        with patch("rollups.supabase", fake_supabase):
+            build = asyncio.ensure_future(store.rebuild())
+            await asyncio.sleep(0)  # The rebuild is now waiting on its first page
+            store.record_transactions([late, TRANSACTIONS[0]])  # The second one is also in the scan
+            store.record_sales([SaleLine(3, quantity=1, units=4, description="x", sale_price_total=40.0)], late)
+            await build
+            await fake_supabase.close()
+
+    asyncio.run(main())
+    assert [r["income"] for r in store.series("2026-03-02", "2026-03-02")] == [100.0]
+    assert store.series("2026-03-20", "2026-03-20")[0]["income"] == 40.0
+    assert store.sku_totals("2026-03-01", "2026-03-31")[3] == (4.0, 40.0)
+
+
+def test_refresh_rereads_only_recent_days(fake_supabase):
+    """A stale store re-reads the last ROLLUP_REFRESH_DAYS days and keeps older buckets."""
+    from datetime import date, timedelta
+    from rollups import ROLLUP_REFRESH_DAYS  # type: ignore
+    store = SalesRollups()
+    today = date.today().isoformat()
+    old = (date.today() - timedelta(days=ROLLUP_REFRESH_DAYS + 30)).isoformat()
+    fake_supabase.set_table_data("transactions", [{"id": 1, "amount": 10.0, "type": "INCOME", "category_id": 7, "date": old}])
+    fake_supabase.set_table_data("sales", [])
+    db = fake_supabase.db
+
+    async def main():
+        from unittest.mock import patch
+        with patch("rollups.supabase", fake_supabase):
+            await store.rebuild()
+            # Another instance sells today; an old row is edited behind the app's back
+            db.insert("transactions", {"id": 2, "amount": 25.0, "type": "INCOME", "category_id": 7, "date": today})
+            db.insert("sales", {"id": 1, "stock_item_id": 4, "quantity": 1, "units": 6, "sale_price_total": 25.0, "sale_tx_id": 2})
+            db.insert("transactions", {"id": 3, "amount": 99.0, "type": "INCOME", "category_id": 7, "date": old})
+            store._built_at -= store.max_age
+            assert await store.view(today, today) is store
+            await store._building
+            await fake_supabase.close()
+
+    asyncio.run(main())
+    assert store.series(today, today)[0]["income"] == 25.0
+    assert store.sku_totals(today, today) == {4: (6.0, 25.0)}
+    assert store.series(old, old)[0]["income"] == 10.0  # Older days are not re-read
+
+
+def test_cold_view_answers_from_the_range_without_waiting(mock_supabase):
+    """Before the first build, view() loads only the range and rebuilds in the background."""
+    store = SalesRollups()
+    mock_supabase.set_table_data("transactions", TRANSACTIONS)
+    mock_supabase.set_table_data("sales", SALES)
+
+    async def main():
+        from unittest.mock import patch
+        with patch("rollups.supabase", mock_supabase):
+            view = await store.view("2026-03-01", "2026-03-31")
+            assert view is not store and not store.loaded
+            totals = view.sku_totals("2026-03-01", "2026-03-31")
+            await store._building
+            return totals
+
+    assert asyncio.run(main()) == {1: (13.0, 150.0)}
+    assert store.loaded
+
+
+def test_top_products_margin_and_days_of_stock(test_client, mock_supabase):
+    """GET /reports/top-products ranks SKUs and derives margin and velocity."""
+    from conftest import SAMPLE_STOCK_ITEMS  # type: ignore
+    mock_supabase.set_table_data("transactions", TRANSACTIONS)
+    mock_supabase.set_table_data("sales", SALES)
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    mock_supabase.set_table_data("stock_item_formats", [])
+
+    response = test_client.get("/reports/top-products", params={"start": "2026-03-01", "end": "2026-03-13"})
+    assert response.status_code == 200
+    [top] = response.json()
+    item = SAMPLE_STOCK_ITEMS[0]
+    assert top["item_id"] == 1 and top["units"] == 13.0 and top["revenue"] == 150.0
+    assert top["margin"] == round(150.0 - 13 * item["unit_cost"], 2)
+    assert top["daily_units"] == 1.0
+    assert top["days_of_stock"] == item["quantity"]
+
+
+def test_closed_period_totals_are_memoized(mock_supabase):
+    """A closed period is summed once, and a backdated sale invalidates it."""
+    store = SalesRollups()
+    mock_supabase.set_table_data("transactions", TRANSACTIONS)
+    mock_supabase.set_table_data("sales", SALES)
+    asyncio.run(_build(store, mock_supabase))
+
+    first = store.sku_totals("2026-03-01", "2026-03-31")
+    assert store.sku_totals("2026-03-01", "2026-03-31") is first
+
+    store.record_sales([SaleLine(1, quantity=1, units=1, description="x", sale_price_total=5.0)], {"date": "2026-03-10"})
+    assert store.sku_totals("2026-03-01", "2026-03-31")[1] == (14.0, 155.0)
+
+
+def test_accounting_pdf_is_rendered_once_per_data_version(test_client, mock_supabase, monkeypatch, tmp_path):
+    """The month's PDF is cached on disk and re-rendered only when its rows change."""
+    from unittest.mock import patch
+    import routers.reports as reports  # type: ignore
+    renders = []
+    real_render = reports.render_accounting_report
+
+    def counting_render(*args):
+        renders.append(args[0])
+        return real_render(*args)
+
+    monkeypatch.setattr(reports, "REPORT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(reports, "REPORT_KEEP_VERSIONS", 1)
+    monkeypatch.setattr(reports, "render_accounting_report", counting_render)
+    mock_supabase.set_table_data("transactions", TRANSACTIONS[:2])
+
+    first = test_client.get("/reports/accounting/pdf", params={"month": 3, "year": 2026})
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/pdf"
+    assert first.content.startswith(b"%PDF")
+    with patch.object(reports, "_report_rows", side_effect=AssertionError("a cache hit fetched the rows")):
+        again = test_client.get("/reports/accounting/pdf", params={"month": 3, "year": 2026})
+    assert again.content == first.content
+    assert len(renders) == 1
+
+    os.remove(renders[0])  # Pruned by another request between the version check and the read
+    assert test_client.get("/reports/accounting/pdf", params={"month": 3, "year": 2026}).status_code == 200
+    assert len(renders) == 2 and renders[1] == renders[0]
+    renders.pop()
+
+    mock_supabase.set_table_data("transactions", TRANSACTIONS[:3])
+    test_client.get("/reports/accounting/pdf", params={"month": 3, "year": 2026})
+    assert len(renders) == 2
+    assert len(list(tmp_path.iterdir())) == 2  # The old version was just served: it may still be streaming
+
+    old = renders[0]
+    os.utime(old, (0, 0))  # Last served long ago
+    mock_supabase.set_table_data("transactions", TRANSACTIONS[:1])
+    test_client.get("/reports/accounting/pdf", params={"month": 3, "year": 2026})
+    assert not os.path.exists(old)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(os.path.basename(p) for p in renders[1:])
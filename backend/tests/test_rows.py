@@ -0,0 +1,33 @@
+"""Tests for the slotted internal row types."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest  # type: ignore
+
+from rows import SaleLine, StockItem, StockItemFormat, Transaction  # type: ignore
+from conftest import SAMPLE_STOCK_ITEMS  # type: ignore
+
+
+def test_from_row_fills_postgrest_nulls():
+    item = StockItem.from_row({"id": 9, "name": "Fernet", "brand": None, "quantity": None, "pack_size": None})
+    assert (item.brand, item.quantity, item.pack_size, item.pack_price) == ("", 0, 1, None)
+    assert item.status == "AVAILABLE" and item.is_pack is False
+    assert StockItemFormat.from_row({"id": 1, "stock_item_id": 9, "pack_price": None}).pack_price == 0
+    assert Transaction.from_row({"id": 3, "amount": 150.5, "description": None}).description == ""
+
+
+def test_rows_are_slotted():
+    item = StockItem.from_row(SAMPLE_STOCK_ITEMS[0])
+    assert not hasattr(item, "__dict__")
+    with pytest.raises(AttributeError):
+        item.not_a_column = 1  # type: ignore
+
+
+def test_sale_line_row():
+    line = SaleLine(stock_item_id=1, quantity=2, units=12, description="Quilmes x2", sale_price_total=300.0)
+    assert line.to_row(42) == {
+        "stock_item_id": 1, "quantity": 2, "units": 12, "description": "Quilmes x2", "sale_price_total": 300.0,
+        "sale_tx_id": 42,
+    }
@@ -1,5 +1,6 @@
 """Tests for sales endpoints."""
 
+import asyncio
 import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -41,3 +42,237 @@ def test_dashboard_stats(test_client, mock_supabase):
     assert "total_income" in data
     assert "total_expense" in data
     assert "net_balance" in data
+
+
+def test_read_transactions_raw_passthrough(test_client, mock_supabase):
+    """GET /transactions forwards the upstream JSON body untouched."""
+    rows = [{"id": 7, "amount": 250.5, "type": "EXPENSE", "description": "Hielo", "date": "2026-02-16"}]
+    mock_supabase.set_table_data("transactions", rows)
+    response = test_client.get("/transactions")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    assert response.json() == rows
+
+
+def _offline_cart(client_id, item_id, quantity, minute):
+    return {
+        "client_id": client_id,
+        "created_at": f"2026-02-15T10:{minute:02d}:00",
+        "items": [{"item_id": item_id, "quantity": quantity}],
+    }
+
+
+def test_failed_stock_write_gives_back_earlier_lines(fake_client, fake_supabase):
+    """An upstream error deducting one line restores the lines already deducted."""
+    from benchmarks.fake_postgrest import PostgrestError  # type: ignore
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    backend, db = fake_supabase.backend, fake_supabase.db
+    handle = backend.handle
+
+    def failing_update(method, path, query, headers, body):
+        if method == "PATCH" and path.endswith("/stock_items") and "id=eq.2" in query:
+            raise PostgrestError(500, "XX000", "boom")
+        return handle(method, path, query, headers, body)
+
+    backend.handle = failing_update
+    cart = {"description": "Mesa 4", "items": [{"item_id": 1, "quantity": 3}, {"item_id": 2, "quantity": 1}]}
+    assert fake_client.post("/sales", json=cart).status_code == 502
+    assert [row["quantity"] for row in db.rows("stock_items")] == [100, 50]
+    assert db.rows("transactions") == []
+
+
+def test_offline_batch_outcomes(test_client, mock_supabase):
+    """POST /sales/offline-batch accepts, rejects and dedupes per cart."""
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    mock_supabase.set_table_data("categories", [])
+    mock_supabase.set_table_data("transactions", [{"id": 99}])
+    carts = [
+        _offline_cart("a1", 1, 10, 1),
+        _offline_cart("b2", 2, 60, 2),   # only 50 in stock
+        _offline_cart("a1", 1, 10, 1),   # queued twice by the POS
+    ]
+
+    response = test_client.post("/sales/offline-batch", json={"carts": carts})
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["accepted"], data["rejected"]) == (1, 1)
+    assert [r["client_id"] for r in data["results"]] == ["a1", "b2"]
+    assert data["results"][0] == {"client_id": "a1", "status": "accepted", "transaction_id": 99, "total": 5000}
+    assert "Stock insuficiente" in data["results"][1]["detail"]
+
+    replay = test_client.post("/sales/offline-batch", json={"carts": carts[:1]}).json()
+    assert replay["duplicates"] == 1
+    assert replay["results"][0]["status"] == "duplicate"
+    assert replay["results"][0]["transaction_id"] == 99
+
+
+def test_offline_batch_validates_stock_across_carts(test_client, mock_supabase):
+    """Carts share the in-memory stock: the later cart is rejected once stock runs out."""
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    mock_supabase.set_table_data("categories", [])
+    mock_supabase.set_table_data("transactions", [{"id": 5}])
+    carts = [
+        _offline_cart("late", 1, 60, 30),
+        _offline_cart("early", 1, 60, 5),
+    ]
+
+    data = test_client.post("/sales/offline-batch", json={"carts": carts}).json()
+    outcomes = {r["client_id"]: r["status"] for r in data["results"]}
+    assert outcomes == {"late": "rejected", "early": "accepted"}
+
+
+def test_offline_batch_writes_stock_as_deltas(fake_client, fake_supabase):
+    """A change committed while the batch runs survives: only the deduction is applied."""
+    from benchmarks.fake_postgrest import PostgrestError  # type: ignore
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    backend, db = fake_supabase.backend, fake_supabase.db
+    handle = backend.handle
+
+    def concurrent_sale(method, path, query, headers, body):
+        if method == "GET" and path.endswith("/stock_items") and "in." in query:
+            # Another register sells 7 and someone edits the barcode right after our read
+            db.update("stock_items", [], {"quantity": 93, "barcode": "111"})
+        return handle(method, path, query, headers, body)
+
+    backend.handle = concurrent_sale
+    data = fake_client.post("/sales/offline-batch", json={"carts": [_offline_cart("c1", 1, 10, 1)]}).json()
+    assert data["accepted"] == 1
+    item = db.rows("stock_items")[0]
+    assert (item["quantity"], item["barcode"]) == (83, "111")
+
+    def failing_sales(method, path, query, headers, body):
+        if method == "POST" and path.endswith("/sales"):
+            raise PostgrestError(500, "XX000", "boom")
+        return handle(method, path, query, headers, body)
+
+    backend.handle = failing_sales
+    carts = {"carts": [_offline_cart("c2", 1, 5, 2)]}
+    assert fake_client.post("/sales/offline-batch", json=carts).status_code == 502
+    assert db.rows("stock_items")[0]["quantity"] == 83
+    assert len(db.rows("transactions")) == 1  # The failed batch's transaction was removed
+
+    backend.handle = handle
+    retry = fake_client.post("/sales/offline-batch", json=carts).json()
+    assert retry["accepted"] == 1  # Not reported as a duplicate of the failed attempt
+    assert db.rows("stock_items")[0]["quantity"] == 78
+
+
+def test_offline_batch_writes_each_item_once(fake_client, fake_supabase):
+    """Carts share one conditional write per item; carts that no longer fit are rejected and give back."""
+    from benchmarks.fake_postgrest import Filter  # type: ignore
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    backend, db = fake_supabase.backend, fake_supabase.db
+    handle = backend.handle
+    patches: list[str] = []
+
+    def concurrent_sale(method, path, query, headers, body):
+        if method == "PATCH" and path.endswith("/stock_items"):
+            patches.append(query)
+        response = handle(method, path, query, headers, body)
+        if method == "GET" and path.endswith("/stock_items") and "in." in query:
+            db.update("stock_items", [Filter("id", "eq.1")], {"quantity": 50})  # Sold at the bar right after our read
+        return response
+
+    backend.handle = concurrent_sale
+    late = _offline_cart("b", 1, 30, 3)
+    late["items"].append({"item_id": 2, "quantity": 5})
+    carts = [_offline_cart("a", 2, 5, 1), _offline_cart("c", 1, 40, 2), late]
+    data = fake_client.post("/sales/offline-batch", json={"carts": carts}).json()
+    assert {r["client_id"]: r["status"] for r in data["results"]} == {"a": "accepted", "c": "accepted", "b": "rejected"}
+    assert [row["quantity"] for row in db.rows("stock_items")] == [10, 45]
+    assert len(patches) == 4  # Item 2 (both carts), item 1 twice (conflict, then fits), item 2 give-back
+    assert len(db.rows("transactions")) == 2
+
+
+def test_offline_batch_restores_stock_on_upstream_error(fake_client, fake_supabase):
+    """A failed stock write gives back every item the batch already deducted."""
+    from benchmarks.fake_postgrest import PostgrestError  # type: ignore
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    backend, db = fake_supabase.backend, fake_supabase.db
+    handle = backend.handle
+
+    def failing_update(method, path, query, headers, body):
+        if method == "PATCH" and path.endswith("/stock_items") and "id=eq.2" in query:
+            raise PostgrestError(500, "XX000", "boom")
+        return handle(method, path, query, headers, body)
+
+    backend.handle = failing_update
+    carts = {"carts": [_offline_cart("x1", 1, 10, 1), _offline_cart("x2", 2, 1, 2)]}
+    assert fake_client.post("/sales/offline-batch", json=carts).status_code == 502
+    assert [row["quantity"] for row in db.rows("stock_items")] == [100, 50]
+    assert db.rows("transactions") == []
+
+
+def test_concurrent_offline_replays_commit_once(fake_client, fake_supabase):
+    """Two replays of the same queue in flight at once record each cart once."""
+    import httpx  # type: ignore
+    from main import app  # type: ignore
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    fake_supabase.backend.jitter = 0.003
+    carts = {"carts": [_offline_cart("q1", 1, 2, 1), _offline_cart("q2", 2, 1, 2)]}
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/sales/offline-batch", json=carts) for _ in range(2)))
+
+    first, second = (res.json() for res in asyncio.run(main()))
+    assert sorted([first["accepted"], second["accepted"]]) == [0, 2]
+    assert sorted([first["duplicates"], second["duplicates"]]) == [0, 2]
+    assert len(fake_supabase.db.rows("transactions")) == 2
+    assert [row["quantity"] for row in fake_supabase.db.rows("stock_items")] == [98, 49]
+
+
+def test_log_movement_publishes_to_stream(test_client, mock_supabase):
+    """Inserted movements are fanned out to /movements/stream subscribers, row in the payload."""
+    from helpers import log_movement, movement_events  # type: ignore
+    mock_supabase.set_table_data("app_movements", [{"id": 41, "action": "VENTA"}])
+
+    asyncio.run(log_movement("VENTA", "VENTA", "Venta de prueba"))
+
+    assert movement_events.last_id == 1
+    assert [(i, e, d["id"]) for i, e, d in movement_events.since(0)] == [(1, "movement", 41)]
+
+
+def test_movement_stream_backfills_from_database(test_client, mock_supabase):
+    """A reconnect the ring buffer cannot cover is served from app_movements after the `since` row."""
+    from helpers import movement_events  # type: ignore
+    from routers.sales import stream_movements  # type: ignore
+    mock_supabase.set_table_data("app_movements", [{"id": 5, "action": "ALTA"}, {"id": 9, "action": "VENTA"}])
+
+    async def main():
+        response = await stream_movements(since=2, last_event_id="77")  # From before a restart
+        stream = response.body_iterator
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        movement_events.publish("movement", {"id": 10})
+        frames.append(await stream.__anext__())
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(main())
+    assert [f.split(b"\n")[0] for f in frames] == [b"id: 0", b"id: 0", b"id: 1"]
+    assert [b'"id": 5' in frames[0], b'"id": 10' in frames[2]] == [True, True]
+
+
+def test_invoice_is_rendered_once_and_cached(test_client, mock_supabase):
+    """Reprinting an invoice is served from the cache without touching Supabase."""
+    mock_supabase.set_table_data("transactions", [{"id": 7, "amount": 1000.0, "date": "2026-03-02", "type": "INCOME"}])
+    mock_supabase.set_table_data("sales", [
+        {"stock_item_id": 1, "quantity": 2, "sale_price_total": 1000.0, "description": "Coca-Cola"},
+    ])
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+
+    first = test_client.get("/sales/invoice/7")
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/pdf"
+    assert first.content.startswith(b"%PDF")
+
+    mock_supabase.set_table_data("transactions", [])
+    again = test_client.get("/sales/invoice/7")
+    assert again.status_code == 200
+    assert again.content == first.content
+
+
+def test_invoice_not_found_is_not_cached(test_client, mock_supabase):
+    mock_supabase.set_table_data("transactions", [])
+    assert test_client.get("/sales/invoice/99").status_code == 404
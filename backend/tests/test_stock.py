@@ -4,6 +4,8 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
+import pytest  # type: ignore
+
 from conftest import SAMPLE_STOCK_ITEMS, SAMPLE_CATEGORIES  # type: ignore
 
 
@@ -29,15 +31,35 @@ def test_read_stock_empty(test_client, mock_supabase):
 def test_get_brands(test_client, mock_supabase):
     """GET /stock/brands returns sorted unique brands."""
     mock_supabase.set_table_data("stock_items", [
-        {"brand": "Coca-Cola"},
-        {"brand": "Quilmes"},
-        {"brand": "Coca-Cola"},
-        {"brand": None},
+        {"id": 1, "brand": "Coca-Cola"},
+        {"id": 2, "brand": "Quilmes"},
+        {"id": 3, "brand": "Coca-Cola"},
+        {"id": 4, "brand": None},
     ])
+    mock_supabase.set_table_data("stock_item_formats", [])
     response = test_client.get("/stock/brands")
     assert response.status_code == 200
     brands = response.json()
-    assert isinstance(brands, list)
+    assert brands == ["Coca-Cola", "Quilmes"]
+
+    response = test_client.get("/stock/brands", params={"prefix": "qu"})
+    assert response.json() == ["Quilmes"]
+
+
+def test_brand_index_drops_unused_brands():
+    """A brand disappears once no item references it."""
+    from catalog import Catalog, BrandIndex  # type: ignore
+
+    source = Catalog()
+    index = source.register(BrandIndex())
+    source.replace([{"id": 1, "brand": "Andes"}, {"id": 2, "brand": "Andes"}, {"id": 3, "brand": "Brahma"}])
+
+    source.remove(1)
+    assert index.brands() == ["Andes", "Brahma"]
+    source.patch(2, {"brand": "Brahma"})
+    assert index.brands() == ["Brahma"]
+    assert index.count("Brahma") == 2
+    assert index.brands(prefix="a") == []
 
 
 def test_delete_stock_not_found(test_client, mock_supabase):
@@ -46,3 +68,207 @@ def test_delete_stock_not_found(test_client, mock_supabase):
     response = test_client.delete("/stock/999")
     # With mock returning empty data for single(), it should fail
     assert response.status_code in (404, 500)
+
+
+def test_barcode_lookup(test_client, mock_supabase):
+    """GET /stock/barcode/{code} resolves a scanned code to the item with formats."""
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    mock_supabase.set_table_data("stock_item_formats", [])
+
+    response = test_client.get("/stock/barcode/7790895000592")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"] == 2
+    assert data["formats"] == []
+
+    assert test_client.get("/stock/barcode/0000000000000").status_code == 404
+
+
+def test_catalog_index_requires_every_hook():
+    """An index missing clear() or update() fails when created, not on the first write."""
+    from catalog import CatalogIndex  # type: ignore
+
+    class NoUpdate(CatalogIndex):
+        def clear(self):
+            pass
+
+    with pytest.raises(TypeError):
+        NoUpdate()
+
+
+def test_barcode_index_follows_writes():
+    """Barcode changes and deletes reported to the catalog update the index."""
+    from catalog import Catalog, BarcodeIndex  # type: ignore
+
+    source = Catalog()
+    index = source.register(BarcodeIndex(source))
+    source.replace([])
+    source.upsert(dict(SAMPLE_STOCK_ITEMS[0]))
+
+    assert index.lookup("7790895000591")["name"] == "Coca-Cola"
+    source.patch(1, {"barcode": "111"})
+    assert index.lookup("7790895000591") is None
+    assert index.lookup(" 111 ")["id"] == 1
+    source.remove(1)
+    assert index.lookup("111") is None
+
+
+def test_stale_catalog_is_served_while_it_reloads(fake_supabase):
+    """Past max_age the old mirror answers at once; a failed reload keeps it."""
+    import asyncio
+    from unittest.mock import patch
+    from benchmarks.fake_postgrest import Filter, PostgrestError  # type: ignore
+    from catalog import Catalog  # type: ignore
+    source = Catalog(max_age=60)
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    db = fake_supabase.db
+    real_handle = fake_supabase.backend.handle
+
+    def failing_handle(*args):
+        raise PostgrestError(503, "PGRST000", "database unavailable")
+
+    async def main():
+        with patch("catalog.supabase", fake_supabase):
+            await source.ensure_loaded()
+            db.update("stock_items", [Filter("id", "eq.1")], {"quantity": 7})
+            source._loaded_at -= source.max_age
+
+            fake_supabase.backend.handle = failing_handle
+            await source.ensure_loaded()
+            assert source.get(1)["quantity"] == 100  # Not waited for
+            await source._loading
+            assert source.get(1)["quantity"] == 100  # Failed: the old mirror stays
+
+            fake_supabase.backend.handle = real_handle
+            await source.ensure_loaded()
+            await source._loading
+            await fake_supabase.close()
+
+    asyncio.run(main())
+    assert source.get(1)["quantity"] == 7
+
+
+def test_search_stock(test_client, mock_supabase):
+    """GET /stock/search matches partial words and typos across name and brand."""
+    mock_supabase.set_table_data("stock_items", [
+        dict(SAMPLE_STOCK_ITEMS[1], id=1, name="Cerveza Rubia 1L", brand="Quilmes"),
+        dict(SAMPLE_STOCK_ITEMS[1], id=2, name="Cerveza Rubia 473ml", brand="Quilmes"),
+        dict(SAMPLE_STOCK_ITEMS[0], id=3, name="Gaseosa 1.5L", brand="Coca-Cola"),
+    ])
+    mock_supabase.set_table_data("stock_item_formats", [])
+
+    results = test_client.get("/stock/search", params={"q": "quilm 1l"}).json()
+    assert [r["id"] for r in results] == [1]
+
+    results = test_client.get("/stock/search", params={"q": "quilmse"}).json()
+    assert {r["id"] for r in results} == {1, 2}
+
+    assert test_client.get("/stock/search", params={"q": "fernet"}).json() == []
+
+
+def test_search_index_follows_renames():
+    """Renaming an item moves it between tokens; unused tokens leave the vocabulary."""
+    from catalog import Catalog  # type: ignore
+    from search_index import SearchIndex  # type: ignore
+
+    source = Catalog()
+    index = source.register(SearchIndex(source))
+    source.replace([{"id": 1, "name": "Vino Malbec", "brand": "Trapiche"}])
+
+    source.patch(1, {"name": "Vino Cabernet"})
+    assert index.search("malbec") == []
+    assert index.search("cabern")[0]["id"] == 1
+    assert "malbec" not in index._vocabulary
+
+
+def test_reorder_suggestions_are_a_batch_draft(test_client, mock_supabase):
+    """Suggestions round up to whole packs and validate as a BatchStockRequest."""
+    from datetime import date
+    import schemas  # type: ignore
+    today = date.today().isoformat()
+    mock_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS)
+    mock_supabase.set_table_data("stock_item_formats", [])
+    mock_supabase.set_table_data("transactions", [{"id": 1, "amount": 58800, "type": "INCOME", "date": today}])
+    mock_supabase.set_table_data("sales", [
+        {"id": 1, "stock_item_id": 2, "quantity": 14, "sale_price_total": 58800, "sale_tx_id": 1, "description": "Quilmes (Pack x6)"},
+    ])
+
+    response = test_client.get("/stock/reorder-suggestions")
+    assert response.status_code == 200
+    draft = response.json()
+    [suggestion] = draft["items"]
+    assert suggestion["item_id"] == 2
+    assert suggestion["daily_demand"] == 3.0
+    assert suggestion["quantity"] == 3  # 68 target - 50 on hand = 18 units = 3 packs of 6
+    assert suggestion["cost_amount"] == 3 * 6 * 500
+    assert suggestion["days_of_stock"] == 16.7
+
+    request = schemas.BatchStockRequest(**draft)
+    assert request.items[0].item_id == 2
+
+
+def test_reorder_suggestions_order_ignores_column_positions(test_client, mock_supabase):
+    """Ties on days_of_stock and name fall back to item_id, whatever the column order."""
+    low = {"quantity": 0, "min_stock_alert": 5, "pack_size": 1, "name": "Fernet"}
+    mock_supabase.set_table_data("stock_items", [{"id": 9, **low}, {"id": 4, **low}, {"id": 7, **low}])
+    mock_supabase.set_table_data("stock_item_formats", [])
+
+    items = test_client.get("/stock/reorder-suggestions").json()["items"]
+    assert [s["item_id"] for s in items] == [4, 7, 9]
+
+
+def test_catalog_columns_follow_writes():
+    """Inserts, patches and swap-deletes keep columns and positions exact."""
+    import random
+    from catalog import Catalog  # type: ignore
+    from columns import CatalogColumns  # type: ignore
+
+    rng = random.Random(3)
+    source = Catalog()
+    columns = source.register(CatalogColumns())
+    source.replace([])
+    for item_id in range(1, 301):
+        op = rng.random()
+        if op < 0.5 or len(source) < 5:
+            source.upsert({
+                "id": item_id, "quantity": rng.randint(0, 20), "unit_cost": rng.randint(1, 9) * 10,
+                "selling_price": 100, "category_id": rng.choice([1, 2, None]), "brand": rng.choice(["Andes", "Brahma", None]),
+            })
+        elif op < 0.8:
+            source.patch(rng.choice(list(source._rows)), {"quantity": rng.randint(-2, 5), "category_id": rng.choice([1, 2])})
+        else:
+            source.remove(rng.choice(list(source._rows)))
+
+    rows = list(source.rows())
+    assert sorted(columns.id) == sorted(row["id"] for row in rows)
+    for row in rows:
+        pos = columns.position(row["id"])
+        assert columns.quantity[pos] == row["quantity"]
+        assert columns.brand_names[columns.brand[pos]] == (row["brand"] or "")
+
+    brahma = {row["id"] for row in rows if row["category_id"] == 2 and row["brand"] == "Brahma"}
+    assert {columns.id[pos] for pos in columns.where(2, "bRa")} == brahma
+
+
+def test_bulk_update_filters_on_the_columns(fake_client, fake_supabase):
+    """Targets come from the catalog columns; new prices from the current rows."""
+    from benchmarks.fake_postgrest import Filter  # type: ignore
+    can = dict(SAMPLE_STOCK_ITEMS[1], id=3, name="Quilmes Lata", barcode="7790895000593")
+    fake_supabase.set_table_data("stock_items", SAMPLE_STOCK_ITEMS + [can])
+    fake_supabase.set_table_data("stock_item_formats", [{"id": 1, "stock_item_id": 2, "pack_size": 12, "pack_price": 8000}])
+    fake_client.get("/stock/brands")  # Loads the catalog mirror
+
+    # Another instance edits the rows after the load
+    db = fake_supabase.db
+    db.update("stock_items", [Filter("id", "eq.2")], {"selling_price": 1000})
+    db.update("stock_items", [Filter("id", "eq.3")], {"category_id": 1})
+
+    body = {"target_field": "both", "percentage": 10, "category_id": 2, "brand": "quil"}
+    response = fake_client.post("/stock/bulk-update", json=body)
+    assert response.json() == {"status": "ok", "updated": 1}
+    rows = {row["id"]: row for row in db.rows("stock_items")}
+    assert (rows[2]["selling_price"], rows[2]["unit_cost"]) == (1100, 550)
+    assert rows[3]["selling_price"] == 800  # No longer in the category
+    assert db.rows("stock_item_formats")[0]["pack_price"] == 8800
+
+    assert fake_client.post("/stock/bulk-update", json={**body, "brand": "andes"}).status_code == 404
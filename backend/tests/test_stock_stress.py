@@ -0,0 +1,41 @@
+"""Concurrency tests: stock invariants under interleaved sales and replenishments."""
+
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # type: ignore
+
+from benchmarks.stress import seed, stress  # type: ignore
+
+
+def test_interleaved_sales_keep_stock_consistent(fake_client, fake_supabase):
+    """Concurrent checkouts, quick sales, offline replays and replenishments lose no update."""
+    from main import app  # type: ignore
+    fake_supabase.backend.jitter = 0.002
+    seed(fake_supabase.db, items=4, initial=30)
+
+    report = asyncio.run(stress(app, fake_supabase.db, operations=240, concurrency=24, seed_value=1))
+
+    assert report["violations"] == []
+    assert report["conflict_retries"] > 0  # The workload really did collide
+    assert report["outcomes"].get("checkout 200", 0) > 0
+    assert report["outcomes"].get("offline_cart accepted", 0) > 0
+
+
+def test_concurrent_quick_sales_do_not_oversell(fake_client, fake_supabase):
+    """Ten buyers race for the last 5 units: exactly 5 sales succeed."""
+    from main import app  # type: ignore
+    fake_supabase.backend.jitter = 0.003
+    seed(fake_supabase.db, items=1, initial=5)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.put("/stock/1/sell", json={"quantity": 1}) for _ in range(10)))
+
+    statuses = sorted(res.status_code for res in asyncio.run(main()))
+    assert statuses == [200] * 5 + [400] * 5
+    item = fake_supabase.db.rows("stock_items")[0]
+    assert item["quantity"] == 0 and item["status"] == "DEPLETED"
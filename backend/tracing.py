@@ -0,0 +1,244 @@
+"""
+Request-level tracing of upstream queries, and Prometheus metrics.
+
+QueryBuilder.execute() reports every Supabase round trip (table,
+operation, status, bytes, duration) through record_query(). The
+TracingMiddleware — the outermost layer — opens a RequestTrace in a
+contextvar for each inbound request, so those reports are aggregated
+per request: the response carries a `Server-Timing` header (database
+time, query count, total time) and per-endpoint histograms are exposed
+at GET /metrics in the Prometheus text format.
+
+Each query also carries a shape — table, operation and filter columns
+with the values stripped — so a request that issues the same shape over
+and over (an N+1 loop) can be spotted. With QUERY_DEBUG responses get
+`X-Upstream-Queries` / `X-Repeated-Queries` headers and such requests
+are logged; tests hook in through trace_listeners (see the query_budget
+fixture).
+"""
+
+import bisect
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from starlette.datastructures import MutableHeaders  # type: ignore
+from starlette.types import ASGIApp, Message, Receive, Scope, Send  # type: ignore
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "false").lower() == "true"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "3"))
+
+
+def query_shape(table: str, operation: str, filters: Iterable[tuple[str, str]] = (), single: bool = False) -> str:
+    """"select stock_items id=eq single": per-item lookups share one shape."""
+    parts = [operation, table] + [f"{col}={op}" for col, op in sorted(filters)]
+    if single:
+        parts.append("single")
+    return " ".join(parts)
+
+
+class RequestTrace:
+    """Upstream queries made while serving one request."""
+
+    def __init__(self, scope: Scope | None = None):
+        self.scope = scope or {}
+        self.queries: list[tuple[str, str, int | str, int, float]] = []  # (table, operation, status, bytes, seconds)
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+
+    @property
+    def route(self) -> str:
+        """Route template ("/stock/{item_id}"), known once routing has happened."""
+        return getattr(self.scope.get("route"), "path", None) or "unmatched"
+
+    def add(self, table: str, operation: str, status: int | str, nbytes: int, duration: float, shape: str | None = None):
+        self.queries.append((table, operation, status, nbytes, duration))
+        self.db_time += duration
+        self.shapes[shape or query_shape(table, operation)] += 1
+
+    def repeated_shapes(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        """Shapes issued at least `threshold` times in this request."""
+        return {shape: n for shape, n in self.shapes.most_common() if n >= threshold}
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{len(self.queries)} queries", '
+            f"app;dur={total * 1000:.1f}"
+        )
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("request_trace", default=None)
+
+# Called with every finished RequestTrace (debug logging, test budgets)
+trace_listeners: list[Callable[[RequestTrace], None]] = []
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+def record_query(table: str, operation: str, status: int | str, nbytes: int, duration: float, shape: str | None = None):
+    """Called by QueryBuilder.execute() after every upstream round trip."""
+    trace = _current_trace.get()
+    metrics.observe_query(trace.route if trace else "-", table, operation, status, nbytes, duration)
+    if trace is not None:
+        trace.add(table, operation, status, nbytes, duration, shape)
+
+
+def log_repeated_queries(trace: RequestTrace):
+    repeated = trace.repeated_shapes()
+    if repeated:
+        summary = "; ".join(f"{shape} x{n}" for shape, n in repeated.items())
+        print(f"[queries] Warning: {trace.scope.get('method')} {trace.route} made {len(trace.queries)} queries, repeated: {summary}")
+
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        pos = bisect.bisect_left(self.buckets, value)
+        if pos < len(self.buckets):
+            self.counts[pos] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+def _labels(**values) -> str:
+    def escape(v) -> str:
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{key}="{escape(value)}"' for key, value in values.items())
+
+
+class Metrics:
+    """In-process counters and histograms, rendered on demand."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._request_seconds: dict[tuple, Histogram] = {}
+        self._request_queries: dict[str, Histogram] = {}
+        self._requests: Counter = Counter()
+        self._query_seconds: dict[tuple, Histogram] = {}
+        self._queries: Counter = Counter()
+        self._query_bytes: Counter = Counter()
+        self._counters: Counter = Counter()
+
+    def inc(self, name: str, amount: float = 1):
+        """Bump a plain process-wide counter (e.g. stock_cas_conflicts_total)."""
+        self._counters[name] += amount
+
+    def counter(self, name: str) -> float:
+        return self._counters[name]
+
+    def observe_request(self, method: str, route: str, status: int, duration: float, trace: RequestTrace):
+        self._requests[(method, route, status)] += 1
+        self._request_seconds.setdefault((method, route), Histogram(DURATION_BUCKETS)).observe(duration)
+        self._request_queries.setdefault(route, Histogram(QUERY_COUNT_BUCKETS)).observe(len(trace.queries))
+
+    def observe_query(self, route: str, table: str, operation: str, status: int | str, nbytes: int, duration: float):
+        self._queries[(route, table, operation, status)] += 1
+        self._query_bytes[(table, operation)] += nbytes
+        self._query_seconds.setdefault((table, operation), Histogram(DURATION_BUCKETS)).observe(duration)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Inbound requests by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self._requests.items()):
+            lines.append(f"http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+
+        lines += ["# HELP http_request_duration_seconds Inbound request latency.", "# TYPE http_request_duration_seconds histogram"]
+        for (method, route), hist in sorted(self._request_seconds.items()):
+            lines += hist.render("http_request_duration_seconds", _labels(method=method, route=route))
+
+        lines += ["# HELP upstream_queries_per_request Supabase round trips per inbound request.", "# TYPE upstream_queries_per_request histogram"]
+        for route, hist in sorted(self._request_queries.items()):
+            lines += hist.render("upstream_queries_per_request", _labels(route=route))
+
+        lines += ["# HELP upstream_queries_total Supabase round trips by route, table, operation and status.", "# TYPE upstream_queries_total counter"]
+        for (route, table, operation, status), count in sorted(self._queries.items(), key=str):
+            lines.append(f"upstream_queries_total{{{_labels(route=route, table=table, operation=operation, status=status)}}} {count}")
+
+        lines += ["# HELP upstream_query_duration_seconds Supabase round-trip latency.", "# TYPE upstream_query_duration_seconds histogram"]
+        for (table, operation), hist in sorted(self._query_seconds.items()):
+            lines += hist.render("upstream_query_duration_seconds", _labels(table=table, operation=operation))
+
+        lines += ["# HELP upstream_response_bytes_total Bytes received from Supabase.", "# TYPE upstream_response_bytes_total counter"]
+        for (table, operation), nbytes in sorted(self._query_bytes.items()):
+            lines.append(f"upstream_response_bytes_total{{{_labels(table=table, operation=operation)}}} {nbytes}")
+
+        for name, value in sorted(self._counters.items()):
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# ─── Middleware ──────────────────────────────────────────────────────────────
+
+class TracingMiddleware:
+    """Opens a RequestTrace per HTTP request and adds the Server-Timing header."""
+
+    def __init__(self, app: ASGIApp, debug: bool = QUERY_DEBUG):
+        self.app = app
+        self.debug = debug
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope)
+        trace_token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", trace.server_timing(time.perf_counter() - started))
+                if self.debug:
+                    headers.append("X-Upstream-Queries", str(len(trace.queries)))
+                    repeated = trace.repeated_shapes()
+                    if repeated:
+                        headers.append("X-Repeated-Queries", ", ".join(f"{shape} x{n}" for shape, n in repeated.items()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(trace_token)
+            metrics.observe_request(scope["method"], trace.route, status, time.perf_counter() - started, trace)
+            if self.debug:
+                log_repeated_queries(trace)
+            for listener in trace_listeners:
+                listener(trace)